@@ -0,0 +1,293 @@
+"""
+Synthetic camera roll generator
+
+Builds a reproducible input tree that looks like a real camera roll export:
+JPEGs with and without EXIF, PNGs, HEICs, short MP4 and MOV videos, Google
+Photos JSON sidecars, Photo Details CSV files, files without any date and a
+tunable share of duplicates. The same seed always builds the same tree.
+
+Videos need the ffmpeg command and HEICs need pillow-heif, the kinds that
+cannot be made are left out and reported.
+
+Usage:
+    python -m benchmarks.corpus /path/to/corpus [--files 1000] [--seed 0]
+        [--duplicate-ratio 0.1] [--image-size 256]
+"""
+
+import os
+import csv
+import json
+import random
+import calendar
+import shutil
+import argparse
+import subprocess
+from datetime import datetime, timedelta
+from PIL import Image
+import piexif
+
+try:
+    from pillow_heif import register_heif_opener
+    register_heif_opener()
+    HEIF_SUPPORT = True
+except ImportError:
+    HEIF_SUPPORT = False
+
+# how often each kind of file is picked
+KIND_WEIGHTS = {
+    "jpg_name_date": 30,
+    "jpg_exif": 20,
+    "jpg_gphotos_json": 10,
+    "jpg_photo_details_csv": 5,
+    "jpg_no_date": 5,
+    "png_name_date": 10,
+    "screenshot": 5,
+    "heic_exif": 5,
+    "mp4": 5,
+    "mov": 5,
+}
+
+EARLIEST_DATE = datetime(2005, 1, 1)
+LATEST_DATE = datetime(2024, 12, 31)
+
+class CorpusGenerator:
+    def __init__(
+            self,
+            corpus_path: str,
+            files: int = 1000,
+            seed: int = 0,
+            duplicate_ratio: float = 0.1,
+            image_size: int = 256,
+    ):
+        self.corpus_path = corpus_path
+        self.files = files
+        self.duplicate_ratio = duplicate_ratio
+        self.image_size = image_size
+        self.random = random.Random(seed)
+
+        self.kind_weights = dict(KIND_WEIGHTS)
+        self.skipped_kinds = []
+
+        if not HEIF_SUPPORT:
+            self.skip_kind("heic_exif", "pillow-heif is not installed")
+        if not shutil.which("ffmpeg"):
+            self.skip_kind("mp4", "ffmpeg was not found")
+            self.skip_kind("mov", "ffmpeg was not found")
+
+        # written files, so duplicates can be made from them
+        self.written = []
+        self.counts = {}
+
+        # Photo Details CSV rows for each directory
+        self.photo_details = {}
+
+    def skip_kind(self, kind: str, reason: str):
+        del self.kind_weights[kind]
+        self.skipped_kinds.append(f"{kind} ({reason})")
+
+    def generate(self) -> dict:
+        """Builds the corpus, returning a summary of what was written"""
+        shutil.rmtree(self.corpus_path, ignore_errors=True)
+        os.makedirs(self.corpus_path)
+
+        kinds = list(self.kind_weights)
+        weights = list(self.kind_weights.values())
+
+        for i in range(self.files):
+            if self.written and self.random.random() < self.duplicate_ratio:
+                self.write_duplicate(i)
+                continue
+
+            kind = self.random.choices(kinds, weights)[0]
+            self.counts[kind] = self.counts.get(kind, 0) + 1
+            getattr(self, "write_" + kind)(i)
+
+        self.write_photo_details()
+
+        total_bytes = 0
+        total_files = 0
+        for root, _, files in os.walk(self.corpus_path):
+            for file in files:
+                total_files += 1
+                total_bytes += os.path.getsize(os.path.join(root, file))
+
+        return {
+            "corpus_path": self.corpus_path,
+            "media_files": self.files,
+            "total_files": total_files,
+            "total_bytes": total_bytes,
+            "kinds": self.counts,
+            "skipped_kinds": self.skipped_kinds,
+        }
+
+    def random_date(self) -> datetime:
+        seconds = int((LATEST_DATE - EARLIEST_DATE).total_seconds())
+        return EARLIEST_DATE + timedelta(seconds=self.random.randrange(seconds))
+
+    def dir_path(self) -> str:
+        """Spreads files over a few album directories, some nested"""
+        album = self.random.randrange(8)
+        if album < 3:
+            dir_path = self.corpus_path
+        elif album < 6:
+            dir_path = os.path.join(self.corpus_path, f"Album {album}")
+        else:
+            dir_path = os.path.join(self.corpus_path, "Takeout", f"Photos from {2010 + album}")
+
+        os.makedirs(dir_path, exist_ok=True)
+        return dir_path
+
+    def image(self) -> Image.Image:
+        """A noisy image, so it does not compress to nothing and every image
+            is different for the duplicate search"""
+        size = self.image_size
+        noise = bytes(self.random.getrandbits(8) for _ in range(size * size // 16 * 3))
+        small = Image.frombytes("RGB", (size // 4, size // 4), noise)
+        return small.resize((size, size))
+
+    def exif_bytes(self, date: datetime) -> bytes:
+        return piexif.dump({
+            "0th": {piexif.ImageIFD.Make: b"Benchmark", piexif.ImageIFD.Model: b"Synthetic"},
+            "Exif": {
+                piexif.ExifIFD.DateTimeOriginal: date.strftime("%Y:%m:%d %H:%M:%S").encode(),
+                piexif.ExifIFD.OffsetTimeOriginal: b"+01:00",
+            },
+        })
+
+    def record(self, file_path: str):
+        self.written.append(file_path)
+
+    def write_jpg_name_date(self, i: int):
+        date = self.random_date()
+        prefix = self.random.choice(["IMG_", "PXL_", "VID_", ""])
+        name = prefix + date.strftime("%Y%m%d_%H%M%S") + ".jpg"
+        file_path = os.path.join(self.dir_path(), name)
+        self.image().save(file_path, quality=90)
+        self.record(file_path)
+
+    def write_jpg_exif(self, i: int):
+        file_path = os.path.join(self.dir_path(), f"DSC{i:05d}.jpg")
+        self.image().save(file_path, quality=90, exif=self.exif_bytes(self.random_date()))
+        self.record(file_path)
+
+    def write_jpg_gphotos_json(self, i: int):
+        date = self.random_date()
+        file_path = os.path.join(self.dir_path(), f"photo_{i}.jpg")
+        self.image().save(file_path, quality=90)
+
+        with open(file_path + ".json", "w") as f:
+            json.dump({
+                "title": os.path.basename(file_path),
+                "photoTakenTime": {
+                    "timestamp": str(calendar.timegm(date.timetuple())),
+                    "formatted": date.strftime("%b %-d, %Y, %-I:%M:%S %p UTC"),
+                },
+            }, f)
+
+        self.record(file_path)
+
+    def write_jpg_photo_details_csv(self, i: int):
+        date = self.random_date()
+        dir_path = self.dir_path()
+        name = f"shared_{i}.jpg"
+        file_path = os.path.join(dir_path, name)
+        self.image().save(file_path, quality=90)
+
+        self.photo_details.setdefault(dir_path, []).append({
+            "imgName": name,
+            "originalCreationDate": date.strftime("%A %B %-d,%Y %-I:%M %p GMT"),
+        })
+        self.record(file_path)
+
+    def write_jpg_no_date(self, i: int):
+        name = self.random.choice(["kitten", "beach", "receipt", "whatsapp"]) + f"_{i}.jpg"
+        file_path = os.path.join(self.dir_path(), name)
+        self.image().save(file_path, quality=90)
+        self.record(file_path)
+
+    def write_png_name_date(self, i: int):
+        date = self.random_date()
+        file_path = os.path.join(
+            self.dir_path(), date.strftime("%Y-%m-%d %H.%M.%S") + f"_{i}.png")
+        self.image().save(file_path)
+        self.record(file_path)
+
+    def write_screenshot(self, i: int):
+        date = self.random_date()
+        file_path = os.path.join(
+            self.dir_path(), "Screenshot_" + date.strftime("%Y-%m-%d-%H-%M-%S") + ".png")
+        self.image().save(file_path)
+        self.record(file_path)
+
+    def write_heic_exif(self, i: int):
+        file_path = os.path.join(self.dir_path(), f"IMG_{i:04d}.HEIC")
+        self.image().save(file_path, exif=self.exif_bytes(self.random_date()))
+        self.record(file_path)
+
+    def write_video(self, i: int, extension: str):
+        date = self.random_date()
+        file_path = os.path.join(self.dir_path(), f"VID_{i:04d}.{extension}")
+        creation_time = date.strftime("%Y-%m-%dT%H:%M:%S.000000Z")
+
+        subprocess.run(
+            [
+                "ffmpeg", "-y", "-loglevel", "error",
+                "-f", "lavfi", "-i", f"testsrc=duration=1:size=160x120:rate=10",
+                "-metadata", f"creation_time={creation_time}",
+                "-pix_fmt", "yuv420p",
+                file_path,
+            ],
+            check=True,
+        )
+        self.record(file_path)
+
+    def write_mp4(self, i: int):
+        self.write_video(i, "mp4")
+
+    def write_mov(self, i: int):
+        self.write_video(i, "mov")
+
+    def write_duplicate(self, i: int):
+        """Copies an earlier file under a new name, the way the same photo
+            ends up in a camera roll twice"""
+        self.counts["duplicate"] = self.counts.get("duplicate", 0) + 1
+
+        original = self.random.choice(self.written)
+        name, extension = os.path.splitext(os.path.basename(original))
+        file_path = os.path.join(self.dir_path(), f"{name} copy {i}{extension}")
+        shutil.copy2(original, file_path)
+
+    def write_photo_details(self):
+        for dir_path, rows in self.photo_details.items():
+            with open(os.path.join(dir_path, "Photo Details.csv"), "w", newline="") as f:
+                writer = csv.DictWriter(f, ["imgName", "originalCreationDate"])
+                writer.writeheader()
+                writer.writerows(rows)
+
+def main():
+    arg_parser = argparse.ArgumentParser(
+        description="Builds a reproducible synthetic camera roll")
+    arg_parser.add_argument("corpus_path", help="Directory to build the corpus in, it is replaced")
+    arg_parser.add_argument("--files", type=int, default=1000, help="Number of media files")
+    arg_parser.add_argument("--seed", type=int, default=0)
+    arg_parser.add_argument(
+        "--duplicate-ratio",
+        type=float,
+        default=0.1,
+        help="Share of the files that are copies of earlier ones",
+    )
+    arg_parser.add_argument("--image-size", type=int, default=256, help="Width and height of images")
+    args = arg_parser.parse_args()
+
+    summary = CorpusGenerator(
+        args.corpus_path,
+        args.files,
+        args.seed,
+        args.duplicate_ratio,
+        args.image_size,
+    ).generate()
+
+    print(json.dumps(summary, indent=4))
+
+if __name__ == "__main__":
+    main()
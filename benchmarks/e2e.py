@@ -0,0 +1,190 @@
+"""
+End to end benchmark
+
+Runs main.main() over a corpus made by benchmarks.corpus once for each
+configuration, and reports files/sec, MB/sec and the peak RSS of its
+largest process for each. That is the main process or a single worker,
+whichever grew the most, not the total across them. Every run happens in its
+own process from a fresh output directory, so runs do not share caches or
+memory.
+
+Usage:
+    python -m benchmarks.e2e /path/to/corpus [--preset serial --preset parallel]
+        [--set performance.workers=4] [--repeat 1] [--json results.json]
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import resource
+import tempfile
+import subprocess
+from configparser import ConfigParser
+
+REPO_PATH = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# config options set for each named configuration, on top of config.ini
+PRESETS = {
+    "serial": {},
+    "parallel": {
+        "performance.workers": str(os.cpu_count() or 1),
+        "performance.metadata_concurrency": "4",
+        "performance.date_concurrency": "4",
+        "performance.write_concurrency": "4",
+    },
+    "rename": {
+        "output.rename_files": "True",
+    },
+    "no_dedup": {
+        "deduplication.search_for_duplicate_files": "False",
+    },
+}
+
+def corpus_size(corpus_path: str):
+    files = 0
+    total_bytes = 0
+
+    for root, _, file_names in os.walk(corpus_path):
+        for file_name in file_names:
+            # sidecars are read but not fixed themselves
+            if file_name.endswith(".json"):
+                continue
+
+            files += 1
+            total_bytes += os.path.getsize(os.path.join(root, file_name))
+
+    return files, total_bytes
+
+def write_config(run_path: str, corpus_path: str, options: dict) -> str:
+    config = ConfigParser()
+    config.read(os.path.join(REPO_PATH, "config.ini"))
+
+    config.set("structure", "input_path", os.path.abspath(corpus_path))
+    config.set("structure", "output_path", os.path.join(run_path, "fixed"))
+    config.set("structure", "error_path", os.path.join(run_path, "error"))
+    config.set("structure", "report_path", run_path)
+    config.set("deduplication", "duplicate_path", os.path.join(run_path, "duplicates"))
+
+    for option, value in options.items():
+        section, option = option.split(".", 1)
+        if not config.has_section(section):
+            config.add_section(section)
+        config.set(section, option, value)
+
+    config_path = os.path.join(run_path, "config.ini")
+    with open(config_path, "w") as f:
+        config.write(f)
+
+    return config_path
+
+def run_once(config_path: str):
+    """Runs in the benchmark's child process, printing its measurements"""
+    sys.path.insert(0, REPO_PATH)
+    import main
+
+    start_time = time.perf_counter()
+    main.main(config_path)
+    seconds = time.perf_counter() - start_time
+
+    # the children are the worker processes, and ru_maxrss is the largest of
+    # them rather than their sum. It is in bytes on macOS and in KiB on Linux
+    max_process_rss = max(
+        resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss,
+    )
+    if sys.platform != "darwin":
+        max_process_rss *= 1024
+
+    print(json.dumps({"seconds": seconds, "max_process_rss_bytes": max_process_rss}))
+
+def run_benchmark(corpus_path: str, name: str, options: dict) -> dict:
+    files, total_bytes = corpus_size(corpus_path)
+
+    with tempfile.TemporaryDirectory(prefix="camera_roll_bench_") as run_path:
+        config_path = write_config(run_path, corpus_path, options)
+
+        result = subprocess.run(
+            [sys.executable, "-m", "benchmarks.e2e", "--run-once", config_path],
+            cwd=run_path,
+            env=dict(os.environ, PYTHONPATH=REPO_PATH),
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            text=True,
+        )
+
+        if result.returncode != 0:
+            raise RuntimeError(f"{name} failed:\n{result.stderr}")
+
+        measurements = json.loads(result.stdout.strip().splitlines()[-1])
+
+    seconds = measurements["seconds"]
+    return {
+        "name": name,
+        "options": options,
+        "files": files,
+        "bytes": total_bytes,
+        "seconds": seconds,
+        "files_per_sec": files / seconds,
+        "mb_per_sec": total_bytes / 1e6 / seconds,
+        "max_process_rss_mb": measurements["max_process_rss_bytes"] / 1e6,
+    }
+
+def print_results(results: list):
+    print(f"{'configuration':<20} {'files':>7} {'seconds':>9} {'files/sec':>10} "
+        f"{'MB/sec':>8} {'max process RSS MB':>19}")
+
+    for result in results:
+        print(
+            f"{result['name']:<20} {result['files']:>7} {result['seconds']:>9.2f} "
+            f"{result['files_per_sec']:>10.1f} {result['mb_per_sec']:>8.2f} "
+            f"{result['max_process_rss_mb']:>19.1f}"
+        )
+
+def main():
+    arg_parser = argparse.ArgumentParser(
+        description="Measures how fast whole runs fix a synthetic corpus")
+    arg_parser.add_argument("corpus_path", nargs="?", help="A corpus made by benchmarks.corpus")
+    arg_parser.add_argument(
+        "--preset",
+        action="append",
+        choices=list(PRESETS),
+        help="A configuration to run, can be given more than once (default: serial)",
+    )
+    arg_parser.add_argument(
+        "--set",
+        action="append",
+        default=[],
+        metavar="SECTION.OPTION=VALUE",
+        help="Config option to set for every configuration",
+    )
+    arg_parser.add_argument("--repeat", type=int, default=1, help="Runs of each configuration")
+    arg_parser.add_argument("--json", help="Also write the results to this JSON file")
+    arg_parser.add_argument("--run-once", metavar="CONFIG_PATH", help=argparse.SUPPRESS)
+    args = arg_parser.parse_args()
+
+    if args.run_once:
+        run_once(args.run_once)
+        return
+
+    if not args.corpus_path:
+        arg_parser.error("the corpus path is required")
+
+    extra_options = dict(option.split("=", 1) for option in args.set)
+
+    results = []
+    for preset in args.preset or ["serial"]:
+        for i in range(args.repeat):
+            name = preset if args.repeat == 1 else f"{preset} #{i + 1}"
+            options = dict(PRESETS[preset], **extra_options)
+            results.append(run_benchmark(args.corpus_path, name, options))
+
+    print_results(results)
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=4)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,140 @@
+"""
+File name date parser benchmark
+
+Times determine_date.from_file_name over every name in
+resources/photonames.json, reporting ns/name and latency percentiles, and
+checks every parsed date against the expected one. Also reports how many
+names the digit run fast path handled, and how many of the rest hit and
+missed the cache of where the formats match each shape of name. Any name that does not
+parse to its expected date, other than the known failures below, is a
+regression and makes the benchmark exit with an error, so changes to the
+parser are judged on speed and accuracy together.
+
+Usage:
+    python -m benchmarks.filename_parser [--limit 500] [--repeat 1] [--json results.json]
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+
+REPO_PATH = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_PATH)
+
+import src.determine_date as determine_date
+from src import metrics
+from src.options import Options, read_options
+
+# names the parser is known to get wrong, with what it returns for them.
+# Remove a name once the parser gets it right
+KNOWN_FAILURES = {
+    # the WhatsApp date has no time and is not followed by a delimiter
+    "IMG-20190328-WA0000.jpg": "",
+}
+
+def load_names(limit: int | None = None) -> dict:
+    with open(os.path.join(REPO_PATH, "resources", "photonames.json")) as f:
+        names = json.load(f)
+
+    if limit:
+        names = dict(list(names.items())[:limit])
+
+    # the milliseconds are never put in the output, so they are not parsed
+    return {name: entry["date"].split(".")[0] for name, entry in names.items()}
+
+def format_date(date) -> str:
+    return date.strftime("%Y/%m/%d %H:%M:%S") if date else ""
+
+def percentile(sorted_values: list, fraction: float):
+    index = min(len(sorted_values) - 1, int(len(sorted_values) * fraction))
+    return sorted_values[index]
+
+def run_benchmark(names: dict, options: Options, repeat: int = 1) -> dict:
+    timings = []
+    results = {}
+    metrics.registry.clear()
+
+    for _ in range(repeat):
+        for name in names:
+            start_time = time.perf_counter_ns()
+            date = determine_date.from_file_name(name, options)
+            timings.append(time.perf_counter_ns() - start_time)
+
+            results[name] = format_date(date)
+
+    regressions = {}
+    fixed = []
+    for name, expected_date in names.items():
+        if results[name] == expected_date:
+            if name in KNOWN_FAILURES:
+                fixed.append(name)
+        elif KNOWN_FAILURES.get(name) != results[name]:
+            regressions[name] = {"expected": expected_date, "got": results[name]}
+
+    # each parse is recorded with the path that handled it, over every pass
+    paths = {}
+    for (name, labels), histogram in metrics.registry.histograms.items():
+        if name == "file_name_parser_seconds":
+            path = dict(labels)["path"]
+            paths[path] = paths.get(path, 0) + histogram.count
+
+    timings.sort()
+    return {
+        "names": len(names),
+        "repeat": repeat,
+        "total_seconds": sum(timings) / 1e9,
+        "ns_per_name": sum(timings) / len(timings),
+        "p50_ns": percentile(timings, 0.5),
+        "p99_ns": percentile(timings, 0.99),
+        "max_ns": timings[-1],
+        "paths": paths,
+        "regressions": regressions,
+        "fixed_known_failures": fixed,
+    }
+
+def print_results(results: dict):
+    print(f"names:       {results['names']} x {results['repeat']}")
+    print(f"total:       {results['total_seconds']:.2f} s")
+    print(f"ns/name:     {results['ns_per_name']:,.0f}")
+    print(f"p50:         {results['p50_ns']:,} ns")
+    print(f"p99:         {results['p99_ns']:,} ns")
+    print(f"max:         {results['max_ns']:,} ns")
+    print(f"digit runs:  {results['paths'].get('digit_runs', 0)}")
+    print(f"shape hits:  {results['paths'].get('shape_cache', 0)}")
+    print(f"shape misses: {results['paths'].get('formats', 0)}")
+
+    for name in results["fixed_known_failures"]:
+        print(f"Now parsed correctly, remove it from the known failures: {name}")
+
+    for name, regression in results["regressions"].items():
+        print(
+            f'Regression on {name} - Expected: "{regression["expected"]}" '
+            f'got "{regression["got"]}"'
+        )
+
+    print(f"regressions: {len(results['regressions'])}")
+
+def main():
+    arg_parser = argparse.ArgumentParser(
+        description="Times the file name date parser and checks it for regressions")
+    arg_parser.add_argument("--limit", type=int, help="Only use the first LIMIT names")
+    arg_parser.add_argument("--repeat", type=int, default=1, help="Passes over the names")
+    arg_parser.add_argument("--json", help="Also write the results to this JSON file")
+    args = arg_parser.parse_args()
+
+    options = read_options(os.path.join(REPO_PATH, "config.ini"))
+
+    results = run_benchmark(load_names(args.limit), options, args.repeat)
+    print_results(results)
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=4)
+
+    if results["regressions"]:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+"""
+JPEG EXIF date reader benchmark
+
+Reads the date tags of every JPEG under a directory, like one built by
+benchmarks.corpus, both with src.jpeg_exif and with the exif package over
+the whole file, which is what it stands in for. Reports how many files the
+segment reader handled and how many it left to the exif package, how many
+bytes each read and how long each took. Any file where the segment reader
+gives different dates than the exif package makes the benchmark exit with
+an error.
+
+Usage:
+    python -m benchmarks.jpeg_exif /path/to/corpus [--json results.json]
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import warnings
+
+REPO_PATH = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_PATH)
+
+import exif
+from src import jpeg_exif
+from src.media_file import MediaFile
+
+def find_jpegs(path: str) -> list:
+    jpegs = []
+    for dir_path, _, file_names in os.walk(path):
+        for file_name in file_names:
+            if file_name.lower().endswith((".jpg", ".jpeg")):
+                jpegs.append(os.path.join(dir_path, file_name))
+    return sorted(jpegs)
+
+def read_dates(img) -> dict:
+    """Each date tag as the text it holds, or None when from_photo_metadata
+        could not use it, because it is missing or is not text"""
+    dates = {}
+    for name in jpeg_exif.DATE_TAGS.values():
+        try:
+            value = getattr(img, name)
+            dates[name] = value if isinstance(value, str) else None
+        except Exception:
+            dates[name] = None
+    return dates
+
+def run_benchmark(paths: list) -> dict:
+    results = {
+        "files": len(paths),
+        "segment_reader": 0,
+        "fallbacks": 0,
+        "segment_reader_bytes": 0,
+        "exif_package_bytes": 0,
+        "segment_reader_seconds": 0,
+        "exif_package_seconds": 0,
+        "mismatches": {},
+    }
+
+    for path in paths:
+        start_time = time.perf_counter()
+        with MediaFile(path) as media_file:
+            exif_dates = jpeg_exif.read_exif_dates(media_file)
+            bytes_read = len(media_file.head(0))
+            dates = read_dates(exif_dates) if exif_dates else None
+        results["segment_reader_seconds"] += time.perf_counter() - start_time
+
+        start_time = time.perf_counter()
+        with open(path, "rb") as f:
+            contents = f.read()
+        try:
+            expected_dates = read_dates(exif.Image(contents))
+        except Exception:
+            expected_dates = read_dates(None)
+        results["exif_package_seconds"] += time.perf_counter() - start_time
+        results["exif_package_bytes"] += len(contents)
+
+        # files left to the exif package are read whole by it after all
+        if exif_dates is None:
+            results["fallbacks"] += 1
+            results["segment_reader_bytes"] += len(contents)
+            continue
+
+        results["segment_reader"] += 1
+        results["segment_reader_bytes"] += bytes_read
+        if dates != expected_dates:
+            results["mismatches"][path] = {"expected": expected_dates, "got": dates}
+
+    return results
+
+def print_results(results: dict):
+    files = max(results["files"], 1)
+    print(f"files:          {results['files']}")
+    print(f"segment reader: {results['segment_reader']}")
+    print(f"fallbacks:      {results['fallbacks']}")
+
+    for reader in ["segment_reader", "exif_package"]:
+        print(
+            f"{reader.replace('_', ' ') + ':':15} "
+            f"{results[reader + '_bytes'] / files / 1024:,.1f} KB/file, "
+            f"{results[reader + '_seconds'] / files * 1e6:,.0f} us/file"
+        )
+
+    for path, mismatch in results["mismatches"].items():
+        print(f'Mismatch on {path} - Expected: {mismatch["expected"]} got {mismatch["got"]}')
+
+    print(f"mismatches:     {len(results['mismatches'])}")
+
+def main():
+    arg_parser = argparse.ArgumentParser(
+        description="Checks the JPEG EXIF date reader against the exif package and times both")
+    arg_parser.add_argument("path", help="Directory to read the JPEGs under")
+    arg_parser.add_argument("--json", help="Also write the results to this JSON file")
+    args = arg_parser.parse_args()
+
+    # the exif package warns about every malformed tag it skips
+    warnings.simplefilter("ignore")
+
+    results = run_benchmark(find_jpegs(args.path))
+    print_results(results)
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=4)
+
+    if results["mismatches"]:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
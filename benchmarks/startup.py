@@ -0,0 +1,111 @@
+"""
+Startup time benchmark
+
+Times how long `python main.py --help` takes from a cold interpreter, which
+is roughly the fixed cost of every run, and fails if the median is over the
+budget. It also fails if importing main loads any of the heavy libraries
+that should only be imported once they are used.
+
+The budget is for a typical laptop or server. Slow machines can raise it
+with --budget.
+
+Usage:
+    python -m benchmarks.startup [--runs 10] [--budget 0.5]
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import statistics
+import subprocess
+
+REPO_PATH = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# the most seconds `python main.py --help` may take, measured as the median
+STARTUP_BUDGET_SECONDS = 0.5
+
+# modules that take most of the time to import, and must not be imported
+# until they are used
+LAZY_MODULES = [
+    "cv2",
+    "numpy",
+    "PIL.Image",
+    "pillow_heif",
+    "magic",
+    "exif",
+    "piexif",
+    "ffmpeg",
+]
+
+def time_startup(runs: int) -> list:
+    timings = []
+
+    for _ in range(runs):
+        start_time = time.perf_counter()
+        subprocess.run(
+            [sys.executable, "main.py", "--help"],
+            cwd=REPO_PATH,
+            stdout=subprocess.DEVNULL,
+            check=True,
+        )
+        timings.append(time.perf_counter() - start_time)
+
+    return timings
+
+def find_eager_imports() -> list:
+    result = subprocess.run(
+        [
+            sys.executable,
+            "-c",
+            "import sys, json, main; print(json.dumps(sorted(sys.modules)))",
+        ],
+        cwd=REPO_PATH,
+        stdout=subprocess.PIPE,
+        check=True,
+        text=True,
+    )
+    imported = set(json.loads(result.stdout))
+
+    return [module for module in LAZY_MODULES if module in imported]
+
+def main():
+    arg_parser = argparse.ArgumentParser(
+        description="Checks that the CLI starts within its time budget")
+    arg_parser.add_argument("--runs", type=int, default=10)
+    arg_parser.add_argument(
+        "--budget",
+        type=float,
+        default=STARTUP_BUDGET_SECONDS,
+        help=f"Seconds the median start may take (default: {STARTUP_BUDGET_SECONDS})",
+    )
+    args = arg_parser.parse_args()
+
+    # the first run warms up the file system cache and writes .pyc files
+    time_startup(1)
+    timings = time_startup(args.runs)
+    median = statistics.median(timings)
+
+    print(f"runs:   {args.runs}")
+    print(f"median: {median * 1000:.0f} ms")
+    print(f"min:    {min(timings) * 1000:.0f} ms")
+    print(f"max:    {max(timings) * 1000:.0f} ms")
+    print(f"budget: {args.budget * 1000:.0f} ms")
+
+    failed = False
+
+    eager_imports = find_eager_imports()
+    for module in eager_imports:
+        print(f"Importing main imports {module}, it should only be imported once used")
+        failed = True
+
+    if median > args.budget:
+        print("Startup is over budget")
+        failed = True
+
+    if failed:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
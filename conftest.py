@@ -0,0 +1,120 @@
+import os
+import re
+import json
+import random
+import shutil
+import hashlib
+from configparser import ConfigParser
+import pytest
+import piexif
+from PIL import Image
+import main
+
+CONFIG_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "config.ini")
+
+def write_jpg(path: str, exif_date: str | None = None):
+    img = Image.new("RGB", (16, 16), (random.randrange(256), 10, 10))
+
+    if exif_date:
+        img.save(path, exif=piexif.dump({"Exif": {
+            piexif.ExifIFD.DateTimeOriginal: exif_date.encode(),
+            piexif.ExifIFD.OffsetTimeOriginal: b"+02:00",
+        }}))
+    else:
+        img.save(path)
+
+@pytest.fixture
+def camera_roll(tmp_path) -> str:
+    """A small input tree with a file for each date source"""
+    random.seed(1)
+    input_path = tmp_path / "input"
+    os.makedirs(input_path / "sub" / "deeper")
+    os.makedirs(input_path / "csvs")
+
+    write_jpg(input_path / "IMG_20190208_015413.jpg")
+    write_jpg(input_path / "photo_exif.jpg", "2015:03:04 05:06:07")
+    write_jpg(input_path / "sub" / "Screenshot_2024-01-21-09-36-10.jpg")
+    write_jpg(input_path / "sub" / "nodate_kitten.jpg")
+    write_jpg(input_path / "sub" / "gphoto.jpg")
+    with open(input_path / "sub" / "gphoto.jpg.json", "w") as f:
+        json.dump({"photoTakenTime": {"formatted": "Jan 2, 2012, 3:04:05 PM UTC"}}, f)
+
+    # dated by a CSV in another directory
+    write_jpg(input_path / "sub" / "deeper" / "csvdated.jpg")
+    with open(input_path / "csvs" / "Photo Details.csv", "w") as f:
+        f.write('imgName,originalCreationDate\n'
+            'csvdated.jpg,"Thursday September 12,2024 4:58 PM GMT"\n')
+
+    Image.new("RGB", (8, 8)).save(input_path / "sub" / "2020-05-06 07.08.09.png")
+    write_jpg(input_path / "sub" / "2020-05-06 07.08.09(1).jpg")
+    shutil.copy(
+        input_path / "IMG_20190208_015413.jpg",
+        input_path / "sub" / "IMG_20190208_015413 copy.jpg",
+    )
+    # a burst of photos taken in the same second
+    for i in range(6):
+        write_jpg(input_path / "sub" / f"IMG_20210101_120000_{i}.jpg")
+
+    with open(input_path / "notes.txt", "w") as f:
+        f.write("hello 20200101")
+
+    return str(input_path)
+
+@pytest.fixture
+def make_config(tmp_path, camera_roll, monkeypatch):
+    """Writes a config that fixes the camera roll into a directory of its
+        own under the test's directory, with the given options changed"""
+    # the report is written to the working directory
+    monkeypatch.chdir(tmp_path)
+
+    def make_config(run_name: str, **options) -> str:
+        run_path = tmp_path / run_name
+        os.makedirs(run_path)
+
+        config = ConfigParser()
+        config.read(CONFIG_PATH)
+        config["structure"]["input_path"] = camera_roll
+        config["structure"]["output_path"] = str(run_path / "fixed")
+        config["structure"]["error_path"] = str(run_path / "error")
+        config["structure"]["report_path"] = str(run_path)
+        config["deduplication"]["duplicate_path"] = str(run_path / "duplicates")
+
+        for name, value in options.items():
+            section = next(s for s in config.sections() if name in config[s])
+            config[section][name] = str(value)
+
+        config_path = str(run_path / "config.ini")
+        with open(config_path, "w") as f:
+            config.write(f)
+        return config_path
+
+    return make_config
+
+def run_fixer(config_path: str, seed: int = 0, **kwargs):
+    # names with a clashing date get a random part
+    random.seed(seed)
+    main.main(config_path, **kwargs)
+
+def output_tree(config_path: str) -> dict:
+    """The contents and modification time of every file a run wrote, by its
+        path under the run's directory"""
+    run_path = os.path.dirname(config_path)
+    tree = {}
+
+    for dir_name in ["fixed", "error", "duplicates"]:
+        for dir_path, _, file_names in os.walk(os.path.join(run_path, dir_name)):
+            for file_name in file_names:
+                if file_name.startswith(".camera_roll_manifest"):
+                    continue
+
+                path = os.path.join(dir_path, file_name)
+                with open(path, "rb") as f:
+                    digest = hashlib.sha256(f.read()).hexdigest()
+                tree[os.path.relpath(path, run_path)] = (digest, os.stat(path).st_mtime)
+
+    return tree
+
+def read_report(config_path: str) -> list:
+    """The report's lines without their timestamps"""
+    with open(os.path.join(os.path.dirname(config_path), "report.txt")) as f:
+        return [re.sub(r"^\d{4}-\d{2}-\d{2} [\d:.]+ ", "", line) for line in f]
@@ -1,213 +1,330 @@
 import os
-import sys
-import time
-import shutil
-import csv
-import glob
-from configparser import ConfigParser
-from src.determine_date import determine_date
+import argparse
 import src.fixer_util as fixer_util
-from src.img_name_gen import ImgNameGen
+import src.determine_date as determine_date
+from src.file_fixer import FileFixer
+from src.scanner import Scanner
+from src.manifest import Manifest
+from src.options import read_options
 import src.duplicates as duplicates
+import src.plan as plan
+import src.metrics as metrics
+import src.profiling as profiling
+import src.tracing as tracing
+import src.preflight as preflight
+from src.memory import MemoryTracker
+from src.progress import ProgressReporter
 from src.log import Logger
 
-def main(config_path: str):
-    config = ConfigParser()
-    config.read(config_path)
-
-    input_path = config.get("structure", "input_path")
-    output_path = config.get("structure", "output_path")
-    error_path = config.get("structure", "error_path")
-    use_month_subdirs = config.getboolean("structure", "output_in_month_subdirs")
-    report_dups = config.getboolean("deduplication", "search_for_duplicate_files")
-    move_dups = config.getboolean("deduplication", "move_duplicate_files")
-    only_dedup = config.getboolean("deduplication", "only_dedup")
-
-    img_name_gen = ImgNameGen()
-    logger = Logger(config)
+def main(
+        config_path: str,
+        resume: bool = False,
+        plan_path: str | None = None,
+        apply_path: str | None = None,
+        profile: bool = False,
+        trace_path: str | None = None,
+        memory_every: int | None = None,
+        preflight_only: bool = False,
+):
+    # the config is only read once, into options that are passed everywhere
+    options = read_options(config_path)
+
+    # worker processes cannot be profiled, so everything runs in this one
+    if profile:
+        options = options.replace(workers=1, auto_workers=False)
+        profiling.start()
+
+    if trace_path:
+        tracing.start()
+
+    input_path = options.input_path
+    output_path = options.output_path
+    error_path = options.error_path
+    report_dups = options.search_for_duplicate_files
+    move_dups = options.move_duplicate_files
+    only_dedup = options.only_dedup
+
+    logger = Logger(options)
+
+    if profile and profiling.active.exclusive:
+        logger.log_timestamped(
+            "Profiling one stage at a time, since Python 3.12 and later can "
+            "only profile one thread at once")
+
+    memory_tracker = None
+    if memory_every is not None:
+        # compiling the file name formats takes about a minute while traced,
+        # so they are compiled first, once, and left out of the report
+        determine_date.get_file_name_date_formats()
+
+        memory_tracker = MemoryTracker(logger, memory_every)
+        memory_tracker.start()
+
+    # the worker counts are picked from how long a sample of the input
+    # takes to fix, and the prediction is shown before the run starts
+    estimate = None
+    if preflight_only or options.auto_workers:
+        estimate = preflight.Preflight(options).run()
+        estimate.log(logger)
+
+        if preflight_only:
+            logger.close()
+            return
+
+        options = estimate.apply(options)
+
+    metrics.registry.clear()
+    metrics_writer = metrics.MetricsWriter(options)
+    metrics_writer.start()
 
     fixer_util.create_directories(output_path + "/o")
     fixer_util.create_directories(error_path + "/e")
 
-    # Parse Photo Details CSV sidecar files before processing images
-    photo_details_dict = parse_photo_details_csv(input_path, logger)
-
-    input_files = []
-    if not only_dedup:
-        for root, dirs, files in os.walk(input_path):
-            for f in [f for f in files if not ".json" in f]:
-                input_files.append(os.path.join(root, f))
-
-    logger.log_timestamped(
-        f"Attemping to fix file times for all files in {input_path} ...",
-    )
+    # Photo Details CSV sidecar files are all read while the input is
+    # listed, before any file is fixed. The preflight already walked the whole
+    # input, so the files it found are fixed instead of walking it again
+    if estimate:
+        scanner = estimate.scanner
+        scanned_files = estimate.take_scanned_files()
+    else:
+        scanner = Scanner(input_path)
+        scanned_files = scanner.scan()
+
+    input_files = profiling.iterate("scan", scanned_files) \
+        if not only_dedup and not apply_path else []
+
+    if plan_path:
+        logger.log_timestamped(
+            f"Planning how to fix file times for all files in {input_path} ...",
+        )
+    elif apply_path:
+        logger.log_timestamped(f"Applying the plan in {apply_path} ...")
+    else:
+        logger.log_timestamped(
+            f"Attemping to fix file times for all files in {input_path} ...",
+        )
 
-    if config.getboolean("output", "rename_files"):
+    if options.rename_files:
         print("!!!! Warning !!!!")
         print('For some reason "OffsetFix_20190208_015413_VID_CB.mov" ' + \
             'gets renamed to "20190207_205413_VID_Offset.mp4", missing the "Fix".')
         print("Either disable file renaming or accept this issue.", end="\n\n")
 
-    for i, input_file_name in enumerate(input_files):
-        file_name = input_file_name.replace(input_path + "/", "")
-        rel_file_path = ""
+    # files are checkpointed in the manifest as they are written, so an
+    # interrupted run can be resumed
+    manifest = Manifest(output_path, options.fingerprint) if not only_dedup else None
+    skip_unchanged = resume or options.skip_unchanged_files
+
+    if resume:
+        removed = fixer_util.remove_partial_files(output_path) \
+            + fixer_util.remove_partial_files(error_path)
+        logger.log_timestamped(
+            f"Resuming, removed {removed} partially written file(s)")
+
+    file_fixer = FileFixer(
+        options,
+        scanner.photo_details,
+        manifest,
+        skip_unchanged,
+    )
 
-        split_name = file_name.rsplit("/", 1)
-        if len(split_name) == 2:
-            file_name = split_name[1]
+    plan_writer = None
+    planned_count = None
+    if plan_path:
+        plan_writer = plan.PlanWriter(plan_path, options)
+        fixed_files = file_fixer.plan_files(input_files)
+    elif apply_path:
+        plan_header = plan.read_header(apply_path)
+        if plan_header["config_fingerprint"] != options.fingerprint:
+            logger.log_timestamped(
+                "! The config has changed since the plan was made")
+
+        dir_count = plan.create_directories(apply_path)
+        logger.log_timestamped(f"Created {dir_count} output directories")
+        planned_count = plan.count_entries(apply_path)
+
+        file_fixer.create_directories = False
+        fixed_files = file_fixer.apply_plan(
+            plan.read_planned_files(apply_path, options))
+    else:
+        fixed_files = file_fixer.fix_files(input_files)
+
+    progress = None
+    if options.progress_every_seconds > 0:
+        progress = ProgressReporter(
+            scanner, file_fixer, options.progress_every_seconds, total=planned_count)
+        progress.start()
+
+    # the structures that grow with the number of files
+    def memory_sizes():
+        return {
+            "photo details": len(scanner.photo_details),
+            "generated names": len(file_fixer.img_name_gen.prev_filenames),
+        }
+
+    for fixed_file in fixed_files:
+        if not fixed_file.file_date:
+            result = "! Date out of bounds, putting in error dir"
+        elif options.rename_files:
+            result = fixed_file.new_file_name
+        else:
+            result = fixed_file.file_date.strftime('%Y-%m-%d %H:%M:%S')
 
-            if config.getboolean("structure", "preserve_directory_structure"):
-                rel_file_path = "/" + split_name[0]
+        logger.log(
+            f"{fixed_file.index} {fixed_file.file_name} -> "
+            + fixed_file.log_text
+            + result
+        )
 
-        error_file_name = f"{error_path + rel_file_path}/{file_name}"
+        logger.log_record(fixed_file.to_record())
 
-        logger.log(f"{i} {file_name} -> ", end="")
+        if plan_writer:
+            plan_writer.write(fixed_file)
 
-        file_date, original_file_date, write_metadata = determine_date(
-            input_file_name, config, photo_details_dict)
+        if memory_tracker:
+            memory_tracker.file_done(memory_sizes())
 
-        # if the parsed date is not valid, write the file to the error path and
-        # continue to the next
-        if not file_date:
-            fixer_util.create_directories(error_file_name)
-            shutil.copy2(input_file_name, error_file_name)
-            logger.log("! Date out of bounds, putting in error dir")
-            continue
+        if progress:
+            progress.file_done(
+                fixed_file.input_stat.st_size if fixed_file.input_stat else 0)
 
-        file_type, file_extension = fixer_util.get_file_type(
-            input_file_name,
-            logger,
-        )
+    if progress:
+        progress.stop()
 
-        new_file_name = img_name_gen.gen_file_name(
-            file_name,
-            file_type,
-            file_extension,
-            file_date,
-            config,
-        )
+    if memory_tracker:
+        memory_tracker.snapshot("fixed files", memory_sizes())
 
-        preserve_dirs = config.getboolean("structure", "preserve_directory_structure")
-        if use_month_subdirs and (not preserve_dirs or not rel_file_path):
-            output_file_name = f"{output_path}/" \
-                + f"{file_date.strftime('%Y')}/{file_date.strftime('%m')}/" \
-                + f"{new_file_name}"
-        else:
-            output_file_name = f"{output_path}{rel_file_path}/{new_file_name}"
-
-        fixer_util.create_directories(output_file_name)
-
-        write_sidecar = False
-
-        # write the date to the exif data if it is a jpg file and the date did not
-        # originally come from the exif data
-        if config.getboolean("output", "override_png_metadata") \
-                and file_extension == "png" :
-            write_metadata = True
-
-        successful_metadata_write = False
-        if write_metadata:
-            if file_extension == "jpg":
-                successful_metadata_write = fixer_util.write_jpg_with_exif(
-                    input_file_name,
-                    output_file_name,
-                    file_date,
-                    logger,
-                    original_file_date
-                )
-
-            elif file_extension == "png":
-                successful_metadata_write = fixer_util.write_png_with_metadata(
-                    input_file_name,
-                    output_file_name,
-                    file_date,
-                    logger,
-                )
-
-            elif file_type == "video":
-                successful_metadata_write = fixer_util.write_video_with_metadata(
-                    input_file_name,
-                    output_file_name,
-                    file_date,
-                    logger,
-                    config,
-                )
-
-            if not successful_metadata_write:
-                write_sidecar = True
-
-        if file_type == "video":
-            # Write to a sidecar for video files since most video file
-            # containers do not support time offset
-            write_sidecar = True
-
-        if config.getboolean("output", "write_sidecar_for_unsupported_types") \
-                    and write_sidecar:
-                fixer_util.write_sidecar(output_file_name, file_date)
-
-        # copy the file to the output file if a new file was not
-        # written with metadata
-        if not successful_metadata_write:
-            shutil.copy2(input_file_name, output_file_name)
-
-        # create a time object that can be set as the file's modification date
-        modTime = time.mktime(file_date.timetuple())
-
-        # write that the file was modified when it was taken
-        os.utime(output_file_name, (modTime, modTime))
+    if plan_writer:
+        plan_writer.close()
 
-        logger.log(
-            new_file_name if config.getboolean("output", "rename_files") \
-                else file_date.strftime('%Y-%m-%d %H:%M:%S'),
-        )
+    if skip_unchanged:
+        logger.log_timestamped(
+            f"Skipped {file_fixer.skipped_count} file(s) unchanged since they were last fixed")
 
-        time.sleep(0.01)
+    if not apply_path:
+        logger.log_timestamped(
+            f"Found {len(scanner.csv_files)} Photo Details CSV file(s)")
+        for csv_file in scanner.csv_files:
+            logger.log(f"Read CSV file: {os.path.basename(csv_file)}")
+        for csv_error in scanner.csv_errors:
+            logger.log(csv_error)
+        logger.log_timestamped(
+            f"Loaded {len(scanner.photo_details)} photo details from CSV files")
 
-    logger.log_timestamped("Done fixing file times!")
+    if plan_path:
+        logger.log_timestamped(f"Done planning! The plan is in {plan_path}")
+    else:
+        logger.log_timestamped("Done fixing file times!")
 
-    if report_dups:
+    # nothing was written when planning, so there is nothing to deduplicate
+    if report_dups and not plan_path:
         logger.log_timestamped("Generating duplicate file report ... ")
-        dups = duplicates.generate_report(output_path, config)
+        with profiling.scope("dedup"):
+            dups = duplicates.generate_report(output_path, options)
+
+        if memory_tracker:
+            memory_tracker.snapshot("found duplicates", {"duplicates": len(dups)})
 
         if dups and move_dups:
             logger.log_timestamped("Moving duplicate files ... ")
-            duplicates.move_older(dups, config)
+            with profiling.scope("dedup"):
+                moved_files = duplicates.move_older(dups, options)
 
-        logger.log_timestamped("Done!")
-
-    logger.log("", end="\n")
-
-def parse_photo_details_csv(input_path: str, logger):
-    """Parse Photo Details CSV sidecar files and return a dictionary mapping image names to original creation dates."""
-    photo_details = {}
+            # the moved outputs are still there to be skipped next time
+            if manifest:
+                manifest.record_moves(moved_files)
 
-    # Search for Photo Details*.csv files recursively in the input directory and all subdirectories
-    csv_pattern = os.path.join(input_path, "**", "Photo Details*.csv")
-    csv_files = glob.glob(csv_pattern, recursive=True)
+            if memory_tracker:
+                memory_tracker.snapshot("moved duplicates")
 
-    logger.log_timestamped(f"Found {len(csv_files)} Photo Details CSV file(s)")
-
-    for csv_file in csv_files:
-        logger.log(f"Reading CSV file: {os.path.basename(csv_file)}")
+        logger.log_timestamped("Done!")
 
-        try:
-            with open(csv_file, 'r', encoding='utf-8', newline='') as file:
-                # Use tab as delimiter based on the description
-                reader = csv.DictReader(file)
+    if manifest:
+        manifest.close()
 
-                for row in reader:
-                    img_name = row.get('imgName', '').strip()
-                    original_creation_date = row.get('originalCreationDate', '').strip()
+    if profile:
+        report_dir = os.path.dirname(logger.filename) or "."
+        summary_path = profiling.stop(report_dir)
+        logger.log_timestamped(f"Wrote the profile summary to {summary_path}")
 
-                    if img_name and original_creation_date:
-                        photo_details[img_name] = original_creation_date
+    if trace_path:
+        tracing.stop(trace_path)
+        logger.log_timestamped(f"Wrote the trace to {trace_path}")
 
-        except Exception as e:
-            logger.log(f"Error reading CSV file {csv_file}: {str(e)}")
+    if memory_tracker:
+        memory_report_path = os.path.join(
+            os.path.dirname(logger.filename), "memory.txt")
+        memory_tracker.stop(memory_report_path)
+        logger.log_timestamped(f"Wrote the memory report to {memory_report_path}")
 
-    logger.log_timestamped(f"Loaded {len(photo_details)} photo details from CSV files")
-    return photo_details
+    logger.log("", end="\n")
+    logger.close()
+    metrics_writer.stop()
 
 if __name__ == "__main__":
-    config_path = sys.argv[1] if len(sys.argv) == 2 else "config.ini"
-    main(config_path)
+    arg_parser = argparse.ArgumentParser(
+        description="Fixes the dates of photos and videos")
+    arg_parser.add_argument(
+        "config_path",
+        nargs="?",
+        default="config.ini",
+        help="Path to the config file (default: config.ini)",
+    )
+    arg_parser.add_argument(
+        "--resume",
+        action="store_true",
+        help="Continue an interrupted run, skipping the files it already fixed",
+    )
+    plan_args = arg_parser.add_mutually_exclusive_group()
+    plan_args.add_argument(
+        "--plan",
+        metavar="PLAN_FILE",
+        help="Work out the date and output of every file and write them to "
+            "PLAN_FILE without writing any files",
+    )
+    plan_args.add_argument(
+        "--apply",
+        metavar="PLAN_FILE",
+        help="Write the files planned in PLAN_FILE by --plan without "
+            "reading their dates again",
+    )
+    arg_parser.add_argument(
+        "--profile",
+        action="store_true",
+        help="Profile each stage of the run in a single process, writing "
+            ".pstats files and a summary next to the report",
+    )
+    arg_parser.add_argument(
+        "--trace",
+        metavar="TRACE_FILE",
+        help="Write a Chrome trace of every file going through each stage to "
+            "TRACE_FILE, to open in Perfetto or chrome://tracing",
+    )
+    arg_parser.add_argument(
+        "--memory",
+        nargs="?",
+        type=int,
+        const=1000,
+        metavar="EVERY",
+        help="Trace memory use, logging the RSS and top allocation sites every "
+            "EVERY files (default: 1000) and at each phase, and write a "
+            "memory.txt report next to the report",
+    )
+    arg_parser.add_argument(
+        "--preflight",
+        action="store_true",
+        help="Sample the input to predict how long a run would take and "
+            "which worker counts to use, without fixing any files",
+    )
+    args = arg_parser.parse_args()
+
+    main(
+        args.config_path,
+        resume=args.resume,
+        plan_path=args.plan,
+        apply_path=args.apply,
+        profile=args.profile,
+        trace_path=args.trace,
+        memory_every=args.memory,
+        preflight_only=args.preflight,
+    )
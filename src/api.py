@@ -0,0 +1,130 @@
+import os
+from typing import Iterable, Iterator
+from configparser import ConfigParser
+from .file_fixer import FileFixer, FixedFile
+from .scanner import Scanner
+from .manifest import Manifest
+from .options import Options
+from . import fixer_util
+from . import preserve_wordlist
+from . import preflight
+
+# the config.ini next to the code, used when no other config is given
+CONFIG_PATH = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    "config.ini",
+)
+
+class FixResult:
+    """How one file was fixed"""
+
+    def __init__(self, fixed_file: FixedFile):
+        self.input_file_name = fixed_file.input_file_name
+        self.status = "fixed" if fixed_file.file_date else "error"
+        self.date = fixed_file.file_date
+        self.original_date = fixed_file.original_file_date
+        self.date_source = fixed_file.date_source
+
+        # files without a date are copied to the error dir instead
+        self.output_file_name = fixed_file.output_file_name \
+            or fixed_file.error_file_name
+
+        # how long each pipeline stage took for the file, in seconds
+        self.timings = fixed_file.timings
+
+        # what would have been written to the report about the file
+        self.log_text = fixed_file.log_text
+
+    def __repr__(self) -> str:
+        return f"FixResult({self.input_file_name!r}, {self.status!r}, " \
+            f"date={self.date}, date_source={self.date_source!r}, " \
+            f"output={self.output_file_name!r})"
+
+class Fixer:
+    """Fixes files from Python instead of from the command line. The config
+        is read from config_path, then any options given, like
+        {"output": {"rename_files": True}}, are set over it.
+
+        Results are yielded as each file is written, in the order the files
+        were given, and files are only read as fast as the results are
+        taken, so no more than queue_size files are in flight at once.
+
+        The options, worker processes, name generator, Photo Details, sidecar
+        listings and word lists are all kept between calls to fix_files, so
+        later calls do not pay to warm them up again and names stay unique
+        across calls. Duplicates are not searched for. Close the fixer, or
+        use it in a with statement, once done with it. A fixer can only fix
+        one batch of files at a time"""
+
+    def __init__(
+            self,
+            config_path: str | None = CONFIG_PATH,
+            options: dict | None = None,
+    ):
+        config = ConfigParser()
+        if config_path:
+            config.read(config_path)
+        if options:
+            config.read_dict(options)
+        self.options = Options(config)
+
+        # the worker counts are picked by sampling the configured input
+        self.estimate = None
+        if self.options.auto_workers:
+            self.estimate = preflight.Preflight(self.options).run()
+            self.options = self.estimate.apply(self.options)
+
+        fixer_util.create_directories(self.options.output_path + "/o")
+        fixer_util.create_directories(self.options.error_path + "/e")
+
+        self.scanner = Scanner(self.options.input_path)
+        self.manifest = Manifest(self.options.output_path, self.options.fingerprint)
+        self.file_fixer = FileFixer(
+            self.options,
+            self.scanner.photo_details,
+            self.manifest,
+            self.options.skip_unchanged_files,
+        )
+        self.file_fixer.keep_workers = True
+
+        # the word lists are only built when first used, which would
+        # otherwise slow down the first file named
+        preserve_wordlist.larger_words_to_preserve
+
+    def fix_files(self, paths: str | Iterable[str]) -> Iterator[FixResult]:
+        """Fixes the given files, and every file in the given directories,
+            yielding a FixResult for each one once it is written"""
+        if isinstance(paths, str):
+            paths = [paths]
+
+        for fixed_file in self.file_fixer.fix_files(self.__scan(paths)):
+            yield FixResult(fixed_file)
+
+    def close(self):
+        self.file_fixer.close()
+        self.manifest.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.close()
+
+    def __scan(self, paths: Iterable[str]):
+        for path in paths:
+            if os.path.isdir(path):
+                # the Photo Details found are added to the ones the fixer
+                # already has
+                yield from Scanner(path, self.scanner.photo_details).scan()
+            else:
+                yield from self.scanner.scan_files([path])
+
+def fix_files(
+        paths: str | Iterable[str],
+        options: dict | None = None,
+        config_path: str | None = CONFIG_PATH,
+) -> Iterator[FixResult]:
+    """Fixes files with a Fixer that is closed once every result has been
+        taken. Use a Fixer to keep its state between batches of files"""
+    with Fixer(config_path, options) as fixer:
+        yield from fixer.fix_files(paths)
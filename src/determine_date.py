@@ -1,51 +1,82 @@
-import exif
-import PIL
 from datetime import datetime
-from configparser import ConfigParser
 import os
 import json
+import time
 import re
+import string
+import threading
 import itertools
+import collections
 import pytz
 import src.fixer_util as fixer_util
+import src.metrics as metrics
+import src.jpeg_exif as jpeg_exif
 from dateutil import parser
 from .ffprobe import FFProbe
-
-try:
-    from pillow_heif import register_heif_opener
-    register_heif_opener()
-    HEIF_SUPPORT = True
-except ImportError:
-    HEIF_SUPPORT = False
-
-def determine_date(file_name: str, config: ConfigParser, photo_details_dict: dict | None = None):
-    use_sys_date = config.getboolean("parsing", "get_date_from_sys_file_times")
-    use_sidecar_date = config.getboolean("parsing", "get_date_from_sidecar_file")
-    use_metadata_date = config.getboolean("parsing", "get_date_from_file_metadata")
-    use_gphotos_json_date = config.getboolean("parsing", "get_date_from_gphotos_json_file")
-    use_file_name_date = config.getboolean("parsing", "get_date_from_file_name")
+from .options import Options
+from .media_file import MediaFile
+from .lazy_imports import register_heif_opener
+
+def determine_date(file_name: str, options: Options, photo_details_dict: dict | None = None):
+    read_date = read_file_date(file_name, options, photo_details_dict)
+    return resolve_date(file_name, options, read_date)
+
+def read_file_date(
+        file_name: str,
+        options: Options,
+        photo_details_dict: dict | None = None,
+        sidecar_names: frozenset | None = None,
+        media_file: MediaFile | None = None,
+):
+    """Tries the date sources that have to read the file or the files next
+        to it. This is the I/O heavy half of determine_date. Also returns
+        which source the date came from. The file is read through the media
+        file given, or one opened for the call"""
+    if media_file is None:
+        with MediaFile(file_name) as media_file:
+            return read_file_date(
+                file_name, options, photo_details_dict, sidecar_names, media_file)
 
     got_date_from_metadata = False
 
     original_file_date = None
-    file_date = from_user_override(config)
+    file_date = from_user_override(options)
+    date_source = "override" if file_date else None
+
+    if not file_date and options.get_date_from_sidecar_file:
+        with metrics.span("date_source_seconds", source="sidecar"):
+            file_date, original_file_date = from_sidecar(file_name, options, photo_details_dict)
+        date_source = "sidecar" if file_date else None
+
+    if not file_date and options.get_date_from_file_metadata:
+        with metrics.span("date_source_seconds", source="metadata"):
+            file_date, got_date_from_metadata = from_metadata(file_name, options, media_file)
+        date_source = "metadata" if file_date else None
 
-    if not file_date and use_sidecar_date:
-        file_date, original_file_date = from_sidecar(file_name, config, photo_details_dict)
+    if not file_date and options.get_date_from_gphotos_json_file:
+        with metrics.span("date_source_seconds", source="gphotos_json"):
+            file_date = from_gphotos_json(file_name, options, sidecar_names)
+        date_source = "gphotos_json" if file_date else None
 
-    if not file_date and use_metadata_date:
-        file_date, got_date_from_metadata = from_metadata(file_name, config)
+    return file_date, original_file_date, got_date_from_metadata, date_source
 
-    if not file_date and use_gphotos_json_date:
-        file_date = from_gphotos_json(file_name, config)
+def resolve_date(file_name: str, options: Options, read_date: tuple):
+    """Falls back to the date sources that do not read the file when
+        read_file_date found nothing, then converts the date to local time.
+        This is the CPU heavy half of determine_date"""
+    file_date, original_file_date, got_date_from_metadata, date_source = read_date
 
-    if not file_date and use_file_name_date:
-        file_date = from_file_name(file_name, config)
+    if not file_date and options.get_date_from_file_name:
+        with metrics.span("date_source_seconds", source="file_name"):
+            file_date = from_file_name(file_name, options)
+        date_source = "file_name" if file_date else None
 
-    if not file_date and use_sys_date:
-        file_date = from_sys_file_times(file_name, config)
+    if not file_date and options.get_date_from_sys_file_times:
+        with metrics.span("date_source_seconds", source="sys_file_times"):
+            file_date = from_sys_file_times(file_name, options)
+        date_source = "sys_file_times" if file_date else None
 
-    local_timezone = pytz.timezone(config.get("parsing", "local_timezone"))
+    local_timezone = options.local_timezone
 
     # if we got a naive date time from the file, assume it is local
     # time, otherwise convert it to local time
@@ -61,24 +92,26 @@ def determine_date(file_name: str, config: ConfigParser, photo_details_dict: dic
         else:
             original_file_date = original_file_date.astimezone(local_timezone)
 
-    return file_date, original_file_date, not got_date_from_metadata
+    return file_date, original_file_date, not got_date_from_metadata, date_source
 
-def from_metadata(file_name: str, config: ConfigParser):
-    file_date, got_date = from_photo_metadata(file_name)
+def from_metadata(file_name: str, options: Options, media_file: MediaFile):
+    file_date, got_date = from_photo_metadata(file_name, media_file)
     if not got_date:
         file_date, got_date = from_video_metadata(file_name)
 
-    if fixer_util.is_within_years(file_date, config):
+    if fixer_util.is_within_years(file_date, options):
         return file_date, got_date
 
     return None, False
 
-def from_photo_metadata(file_name: str):
+@metrics.timed("photo_metadata")
+def from_photo_metadata(file_name: str, media_file: MediaFile):
     """Photo metadata often stores the time in Local Time"""
     # jpg file handling
     try:
-        with open(file_name, 'rb') as fi:
-            img = exif.Image(fi)
+        # only the date tags are read, from before the image data, unless
+        # the exif package has to look for them
+        img = jpeg_exif.read_exif_dates(media_file) or media_file.exif_image()
 
         try:
             if img.datetime_original:
@@ -135,12 +168,13 @@ def from_photo_metadata(file_name: str):
 
     # Check if this is a HEIF file
     if file_name.lower().endswith(('.heif', '.heic')):
-        return from_heif_metadata(file_name)
+        return from_heif_metadata(file_name, media_file)
 
     # png file handling
     try:
+        img = media_file.image()
+
         for datetimeTag in ["Creation Time", "CreationTime", "DateTime", "DateTimeOriginal", "DateTimeDigitized",  0x0132, 0x9003]:
-            img = PIL.Image.open(file_name)
 
             if img.info.get(datetimeTag):
                 img_date = datetime.strptime(img.info[datetimeTag], "%Y:%m:%d %H:%M:%S")
@@ -162,7 +196,7 @@ def from_photo_metadata(file_name: str):
 
     # heif file handling
     try:
-        img = PIL.Image.open(file_name)
+        img = media_file.image()
 
         # Try to get EXIF data
         if hasattr(img, 'getexif'):
@@ -229,13 +263,13 @@ def from_photo_metadata(file_name: str):
 
     return None, False
 
-def from_heif_metadata(file_name: str):
+def from_heif_metadata(file_name: str, media_file: MediaFile):
     """Extract datetime from HEIF/HEIC files using pillow-heif"""
-    if not HEIF_SUPPORT:
+    if not register_heif_opener():
         print(f"Warning: pillow-heif not installed, cannot read HEIF metadata from {file_name}")
         return None, False
     try:
-        img = PIL.Image.open(file_name)
+        img = media_file.image()
 
         # Try to get EXIF data
         if hasattr(img, 'getexif'):
@@ -307,7 +341,8 @@ def from_video_metadata(file_name: str):
     metadata = {}
     try:
         # Use FFprobe to get metadata from the video file
-        probe = FFProbe(file_name)
+        with metrics.span("operation_seconds", operation="ffprobe"):
+            probe = FFProbe(file_name)
 
         # Extract the metadata
         if probe.metadata.get("creation_time"):
@@ -326,16 +361,28 @@ def from_video_metadata(file_name: str):
 
     return None, False
 
-def from_file_name(file_name: str, config: ConfigParser):
-    file_name = ".".join(file_name.split(".")[0:-1]) # remove the extension
-
+# the delimiters between the date and the time, between the parts of the
+# date or time, and the periods after the time that file names are checked for
+DATE_DELIMITERS = ["", " ", "-", "_", ".", " AT ", " at "]
+DATE_SUB_DELIMITERS = ["", "-", "_", ".", " "]
+# the empty period must be last or else it will match dates with a period
+# before the appropiate period has had a chance to
+DATE_PERIODS = [" AM", " PM", " am", " pm", "AM", "PM", "am", "pm", ""]
+
+def __build_file_name_date_formats() -> list:
+    """Every date format a file name is checked for, in the order they are
+        tried, with their regexes compiled. Each one also has the regexes
+        for the start of it that it shares with other formats, so a whole
+        group of formats can be skipped at once when the start of them is
+        not in the file name"""
     possible_date_formats = []
 
-    delimiters = ["", " ", "-", "_", ".", " AT ", " at "]
-    sub_delimiters = ["", "-", "_", ".", " "]
-    # the empty period must be last or else it will match dates with a period
-    # before the appropiate period has had a chance to
-    periods = [" AM", " PM", " am", " pm", "AM", "PM", "am", "pm", ""]
+    delimiters = DATE_DELIMITERS
+    sub_delimiters = DATE_SUB_DELIMITERS
+    periods = DATE_PERIODS
+
+    # every format has a four digit year in it
+    year_prefix = "\\d\\d\\d\\d"
 
     # generate regex and datetime format for each possible date format that
     # has the same sub delimiter for each block, eg. "2024-01-21 09.36.10"
@@ -354,14 +401,28 @@ def from_file_name(file_name: str, config: ConfigParser):
             period_code = "%p"
 
         # account for an all digit date
+        date_regex = f"\\d\\d\\d\\d{sub_delim1}\\d\\d{sub_delim1}\\d\\d"
         possible_date_formats.append({
-            "regex": f"\\d\\d\\d\\d{sub_delim1}\\d\\d{sub_delim1}\\d\\d{delim}\\d\\d{sub_delim2}\\d\\d{sub_delim2}\\d\\d{period}".replace(".", "\\."),
+            "regex": f"{date_regex}{delim}\\d\\d{sub_delim2}\\d\\d{sub_delim2}\\d\\d{period}".replace(".", "\\."),
             "format": f"%Y{sub_delim1}%m{sub_delim1}%d{delim}{hour_code}{sub_delim2}%M{sub_delim2}%S{period_code}",
+            "prefixes": [
+                year_prefix,
+                date_regex,
+                f"{date_regex}{delim}\\d\\d",
+                f"{date_regex}{delim}\\d\\d{sub_delim2}\\d\\d{sub_delim2}\\d\\d",
+            ],
         })
         # account for a date with short month name
+        date_regex = f"\\d\\d\\d\\d{sub_delim1}[A-Za-z][A-Za-z][A-Za-z]{sub_delim1}\\d\\d"
         possible_date_formats.append({
-            "regex": f"\\d\\d\\d\\d{sub_delim1}[A-Za-z][A-Za-z][A-Za-z]{sub_delim1}\\d\\d{delim}\\d\\d{sub_delim2}\\d\\d{sub_delim2}\\d\\d{period}".replace(".", "\\."),
+            "regex": f"{date_regex}{delim}\\d\\d{sub_delim2}\\d\\d{sub_delim2}\\d\\d{period}".replace(".", "\\."),
             "format": f"%Y{sub_delim1}%b{sub_delim1}%d{delim}{hour_code}{sub_delim2}%M{sub_delim2}%S{period_code}",
+            "prefixes": [
+                year_prefix,
+                date_regex,
+                f"{date_regex}{delim}\\d\\d",
+                f"{date_regex}{delim}\\d\\d{sub_delim2}\\d\\d{sub_delim2}\\d\\d",
+            ],
         })
 
     # generate regex and datetime format for each possible date format that
@@ -381,14 +442,28 @@ def from_file_name(file_name: str, config: ConfigParser):
             period_code = "%p"
 
         # account for an all digit date
+        date_regex = f"\\d\\d\\d\\d{sub_delim1}\\d\\d{sub_delim1}\\d\\d"
         possible_date_formats.append({
-            "regex": f"\\d\\d\\d\\d{sub_delim1}\\d\\d{sub_delim1}\\d\\d{delim}\\d\\dh\\d\\dm\\d\\ds{period}".replace(".", "\\."),
+            "regex": f"{date_regex}{delim}\\d\\dh\\d\\dm\\d\\ds{period}".replace(".", "\\."),
             "format": f"%Y{sub_delim1}%m{sub_delim1}%d{delim}{hour_code}h%Mm%Ss{period_code}",
+            "prefixes": [
+                year_prefix,
+                date_regex,
+                f"{date_regex}{delim}\\d\\d",
+                f"{date_regex}{delim}\\d\\dh\\d\\dm\\d\\ds",
+            ],
         })
         # account for a date with short month name
+        date_regex = f"\\d\\d\\d\\d{sub_delim1}[A-Za-z][A-Za-z][A-Za-z]{sub_delim1}\\d\\d"
         possible_date_formats.append({
-            "regex": f"\\d\\d\\d\\d{sub_delim1}[A-Za-z][A-Za-z][A-Za-z]{sub_delim1}\\d\\d{delim}\\d\\dh\\d\\dm\\d\\ds{period}".replace(".", "\\."),
+            "regex": f"{date_regex}{delim}\\d\\dh\\d\\dm\\d\\ds{period}".replace(".", "\\."),
             "format": f"%Y{sub_delim1}%d{sub_delim1}%d{delim}{hour_code}h%Mm%Ss{period_code}",
+            "prefixes": [
+                year_prefix,
+                date_regex,
+                f"{date_regex}{delim}\\d\\d",
+                f"{date_regex}{delim}\\d\\dh\\d\\dm\\d\\ds",
+            ],
         })
 
     # Generate the regex and datetime format for each possible date format that
@@ -405,42 +480,252 @@ def from_file_name(file_name: str, config: ConfigParser):
         possible_date_formats.append({
             "regex": f"^\\d\\d\\d\\d{sub_delim1}\\d\\d{sub_delim1}\\d\\d\\b".replace(".", "\\."),
             "format": f"%Y{sub_delim1}%m{sub_delim1}%d",
+            "prefixes": [year_prefix],
         })
         possible_date_formats.append({
             "regex": f"^\\d\\d\\d\\d{sub_delim1}\\d\\d{sub_delim1}\\d\\d_".replace(".", "\\."), # underscore is not a word boundry but we want to allow it
             "format": f"%Y{sub_delim1}%m{sub_delim1}%d_",
+            "prefixes": [year_prefix],
         })
         # account for an all digit date at the end of the file name
         possible_date_formats.append({
             "regex": f"\\b\\d\\d\\d\\d{sub_delim1}\\d\\d{sub_delim1}\\d\\d$".replace(".", "\\."),
             "format": f"%Y{sub_delim1}%m{sub_delim1}%d",
+            "prefixes": [year_prefix],
         })
         possible_date_formats.append({
             "regex": f"_\\d\\d\\d\\d{sub_delim1}\\d\\d{sub_delim1}\\d\\d$".replace(".", "\\."),  # underscore is not a word boundry but we want to allow it
             "format": f"_%Y{sub_delim1}%m{sub_delim1}%d",
+            "prefixes": [year_prefix],
         })
         # account for a date with short month name
+        date_regex = f"\\d\\d\\d\\d{sub_delim1}[A-Za-z][A-Za-z][A-Za-z]{sub_delim1}\\d\\d"
         possible_date_formats.append({
-            "regex": f"\\d\\d\\d\\d{sub_delim1}[A-Za-z][A-Za-z][A-Za-z]{sub_delim1}\\d\\d".replace(".", "\\."),
+            "regex": date_regex.replace(".", "\\."),
             "format": f"%Y{sub_delim1}%b{sub_delim1}%d",
+            "prefixes": [year_prefix],
         })
 
+    # The formats share most of their prefixes, so each prefix is only
+    # compiled once and only searched for once per file name. The
+    # lookahead finds every match, even ones that overlap
+    compiled_prefixes = {}
     for date_format in possible_date_formats:
-        matches = re.findall(f"(?=({date_format['regex']}))", file_name)
-        for match in matches:
-            try:
-                file_date = datetime.strptime(match, date_format["format"])
-                if fixer_util.is_within_years(file_date, config):
-                    return file_date
-
-            # if this throws an error, then the "date" being parsed was not
-            # a valid date, so continue in the loop
-            except:
-                pass
+        date_format["pattern"] = re.compile(f"(?=({date_format['regex']}))")
+        date_format["prefixes"] = [
+            compiled_prefixes.setdefault(prefix, re.compile(prefix.replace(".", "\\.")))
+            for prefix in date_format["prefixes"]
+        ]
+
+    return possible_date_formats
+
+# built the first time a file name is parsed, since compiling thousands of
+# regexes takes a while and not every run needs them
+_file_name_date_formats = None
+
+# how many shapes of file names remember where the formats matched them
+SHAPE_CACHE_SIZE = 4096
+
+# the letters the formats spell out, like the AM in a time
+SPELLED_LETTERS = set("".join(DATE_DELIMITERS + DATE_PERIODS) + "hms") \
+    & set(string.ascii_letters)
+
+# A name's shape is its digits turned to d and its letters to a, along with
+# the letters the formats spell out in their places. The formats can not tell
+# apart names of the same shape, so they match them in the same places and
+# only the digits there decide whether it is a valid date
+_shape_table = str.maketrans(
+    {char: "d" for char in string.digits}
+    | {char: "a" for char in string.ascii_letters}
+)
+_spelled_table = str.maketrans(
+    {char: "." for char in string.digits + string.ascii_letters
+        if char not in SPELLED_LETTERS}
+)
+
+# the places the formats matched each shape, with the most recently used last
+_shape_matches = collections.OrderedDict()
+_shape_matches_lock = threading.Lock()
+
+def from_file_name(file_name: str, options: Options):
+    file_name = ".".join(file_name.split(".")[0:-1]) # remove the extension
 
-    return None
+    # most names have one of a few shapes that can be read straight from
+    # their digits, and the rest are checked against every format, unless
+    # where they match names of that shape is already known
+    start_time = time.time()
+    start_counter = time.perf_counter()
+
+    parser_path = "digit_runs"
+    file_date = __parse_digit_runs(file_name, options)
+    if not file_date:
+        file_date, cache_hit = __match_date_formats(file_name, options)
+        parser_path = "shape_cache" if cache_hit else "formats"
+
+    metrics.record(metrics.Span(
+        "file_name_parser_seconds",
+        {"path": parser_path},
+        start_time,
+        time.perf_counter() - start_counter,
+    ))
+    return file_date
+
+def __parse_digit_runs(file_name: str, options: Options):
+    """Reads the date from a name with one of these shapes, where the
+        text around the digits can be anything but more digits, other than
+        a few after the time:
+        IMG_20190208_015413, PXL_20190208_015413123(1), IMG20190208015413 and
+        Screenshot_2024-01-21-09-36-10 or 2019-02-08 01.54.13, with any of
+        the delimiters.
+
+        Which of the formats in __match_date_formats is the first to match
+        these shapes is known, so the date comes out the same without trying
+        any of them. Anything else, including a time followed by AM or PM and
+        dates that are not valid, returns None to be checked against every
+        format"""
+    # \d matches digits in other scripts too, which are not handled here
+    if not file_name.isascii():
+        return None
+
+    runs = []
+    run_start = None
+    for i, char in enumerate(file_name):
+        if "0" <= char <= "9":
+            if run_start is None:
+                run_start = i
+        elif run_start is not None:
+            runs.append((run_start, i))
+            run_start = None
+    if run_start is not None:
+        runs.append((run_start, len(file_name)))
+
+    lengths = [run_end - run_start for run_start, run_end in runs]
+
+    if lengths == [14]:
+        # eg. IMG20190208015413
+        digits = file_name[runs[0][0]:runs[0][1]]
+        time_end = runs[0][1]
+
+    elif len(lengths) >= 2 and lengths[0] == 8 and lengths[1] >= 6 \
+            and (sum(lengths[1:]) < 12 or len(lengths) == 2 and lengths[1] < 14):
+        # eg. IMG_20190208_015413 or IMG_20190208_015413_1, where the time
+        # can be followed by milliseconds. Any other date a format could
+        # find after this one takes at least 12 more digits, and 14 or more
+        # in one run could hold a date of their own
+        delimiter = file_name[runs[0][1]:runs[1][0]]
+        if delimiter not in DATE_DELIMITERS:
+            return None
+
+        time_end = runs[1][0] + 6
+        digits = file_name[runs[0][0]:runs[0][1]] + file_name[runs[1][0]:time_end]
+
+    elif lengths == [4, 2, 2, 2, 2, 2]:
+        # eg. 2019-02-08 01.54.13
+        delimiters = [
+            file_name[runs[i][1]:runs[i + 1][0]] for i in range(len(runs) - 1)]
+
+        if delimiters[0] != delimiters[1] \
+                or delimiters[0] not in DATE_SUB_DELIMITERS \
+                or delimiters[2] not in DATE_DELIMITERS \
+                or delimiters[3] != delimiters[4] \
+                or delimiters[3] not in DATE_SUB_DELIMITERS:
+            return None
+
+        time_end = runs[5][1]
+        digits = "".join(file_name[run_start:run_end] for run_start, run_end in runs)
+
+    else:
+        return None
+
+    # a 12 hour time would be matched first
+    if file_name.startswith(tuple(DATE_PERIODS[:-1]), time_end):
+        return None
+
+    try:
+        file_date = datetime(
+            int(digits[0:4]),
+            int(digits[4:6]),
+            int(digits[6:8]),
+            int(digits[8:10]),
+            int(digits[10:12]),
+            int(digits[12:14]),
+        )
+    except ValueError:
+        return None
+
+    if not fixer_util.is_within_years(file_date, options):
+        return None
+
+    return file_date
+
+def __match_date_formats(file_name: str, options: Options):
+    """Checks the name against every format, returning the date and whether
+        the formats that match names of its shape were already known"""
+    shape = (file_name.translate(_shape_table), file_name.translate(_spelled_table))
+
+    with _shape_matches_lock:
+        matches = _shape_matches.get(shape)
+        if matches is not None:
+            _shape_matches.move_to_end(shape)
+
+    cache_hit = matches is not None
+    if not cache_hit:
+        matches = __find_format_matches(file_name)
+
+        with _shape_matches_lock:
+            _shape_matches[shape] = matches
+            if len(_shape_matches) > SHAPE_CACHE_SIZE:
+                _shape_matches.popitem(last=False)
+
+    for date_format, match_start, match_end in matches:
+        try:
+            file_date = datetime.strptime(file_name[match_start:match_end], date_format)
+            if fixer_util.is_within_years(file_date, options):
+                return file_date, cache_hit
 
-def from_sidecar(file_name: str, config: ConfigParser, photo_details_dict: dict | None = None):
+        # if this throws an error, then the "date" being parsed was not
+        # a valid date, so continue in the loop
+        except:
+            pass
+
+    return None, cache_hit
+
+def get_file_name_date_formats() -> list:
+    """The formats file names are checked against, built the first time
+        they are needed"""
+    global _file_name_date_formats
+
+    if _file_name_date_formats is None:
+        _file_name_date_formats = __build_file_name_date_formats()
+    return _file_name_date_formats
+
+def __find_format_matches(file_name: str) -> list:
+    """Every place a format matches the name, in the order they are tried,
+        as the format with the start and end of the match"""
+    # whether each prefix is in the file name
+    found_prefixes = {}
+    matches = []
+
+    for date_format in get_file_name_date_formats():
+        skip = False
+        for prefix in date_format["prefixes"]:
+            found = found_prefixes.get(prefix)
+            if found is None:
+                found = found_prefixes[prefix] = prefix.search(file_name) is not None
+            if not found:
+                skip = True
+                break
+        if skip:
+            continue
+
+        for match in date_format["pattern"].finditer(file_name):
+            match_start = match.start()
+            matches.append(
+                (date_format["format"], match_start, match_start + len(match.group(1))))
+
+    return matches
+
+def from_sidecar(file_name: str, options: Options, photo_details_dict: dict | None = None):
     """Extract date from sidecar files (CSV, JSON, XML) if available."""
     if not photo_details_dict:
         return None, None
@@ -478,64 +763,72 @@ def from_sidecar(file_name: str, config: ConfigParser, photo_details_dict: dict
 
     return None, None
 
-def from_gphotos_json(file_name: str, config: ConfigParser):
-    data = None
+def gphotos_json_candidates(file_name: str):
+    """The names Google Photos may have given a file's JSON sidecar file,
+        in the order they should be checked"""
+    file_path_split = file_name.split("/")
+    file_path_split[-1] = file_path_split[-1][0:46]
+    short_file_name = "/".join(file_path_split)
+
+    # check for a straight conversion from the file name to
+    # the json file
+    candidates = [f"{short_file_name}.json"]
+
+    # translating a file with a filename duplicate number at the
+    # end is not straigtforward, "hi(2).jpg" -> "hi.jpg(2).json
+    for num in range(5):
+        if f"({num})" in file_name:
+            candidates.append(
+                short_file_name.replace(f"({num})", "") + f"({num}).json")
+
+    # google photos names the json files a little differently than the
+    # actual file when there was an edit
+    if "-edited" in file_name:
+        candidates.append(file_name.replace('-edited', '') + ".json")
+
+    # in some cases the file extension is just left out of the json
+    # file name, like "de.jpg_large.jpg" -> "de.jpg_large.json"
+    candidates.append(".".join(file_name.split(".")[0:-1]) + ".json")
+
+    return candidates
+
+def find_gphotos_json(file_name: str, sidecar_names: frozenset | None = None):
+    """Finds the JSON sidecar file for a file. If the names of the .json
+        files in the file's directory are already known, they are checked
+        instead of the disk"""
+    dir_path = os.path.dirname(file_name)
+
+    for candidate in gphotos_json_candidates(file_name):
+        if sidecar_names is not None and os.path.dirname(candidate) == dir_path:
+            if os.path.basename(candidate) in sidecar_names:
+                return candidate
+        elif os.path.isfile(candidate):
+            return candidate
 
-    def get_json_data(file_name):
-        try:
-            file_path_split = file_name.split("/")
-            file_path_split[-1] = file_path_split[-1][0:46]
-            short_file_name = "/".join(file_path_split)
-
-            # check for a straight conversion from the file name to
-            # the json file
-            if os.path.isfile(f"{short_file_name}.json"):
-                with open(f"{short_file_name}.json") as f:
-                    return json.load(f)
-
-            # translating a file with a filename duplicate number at the
-            # end is not straigtforward, "hi(2).jpg" -> "hi.jpg(2).json
-            for num in range(5):
-                minus_num_file_name = \
-                    short_file_name.replace(f"({num})", "") + f"({num}).json"
-
-                if f"({num})" in file_name and os.path.isfile(minus_num_file_name):
-                    with open(minus_num_file_name) as f:
-                        return json.load(f)
-
-            # google photos names the json files a little differently than the
-            # actual file when there was an edit
-            minus_edited_file_name = file_name.replace('-edited', '') + ".json"
-            if "-edited" in file_name and os.path.isfile(minus_edited_file_name):
-                with open(minus_edited_file_name) as f:
-                    return json.load(f)
-
-            # in some cases the file extension is just left out of the json
-            # file name, like "de.jpg_large.jpg" -> "de.jpg_large.json"
-            minus_ext_file_name = ".".join(file_name.split(".")[0:-1]) + ".json"
-            if os.path.isfile(minus_ext_file_name):
-                with open(minus_ext_file_name) as f:
-                    return json.load(f)
+    return None
 
-        except:
-            pass
+def from_gphotos_json(file_name: str, options: Options, sidecar_names: frozenset | None = None):
+    data = None
 
-    data = get_json_data(file_name)
+    try:
+        json_file_name = find_gphotos_json(file_name, sidecar_names)
+        if json_file_name:
+            with open(json_file_name) as f:
+                data = json.load(f)
+    except:
+        pass
 
     if data:
         file_date = parser.parse(data["photoTakenTime"]["formatted"])
-        if fixer_util.is_within_years(file_date, config):
+        if fixer_util.is_within_years(file_date, options):
             return file_date
 
     return None
 
-def from_user_override(config: ConfigParser):
-    user_override = config.get("parsing", "manual_file_date_override")
-    if not user_override:
-        return
-    return parser.isoparse(user_override)
+def from_user_override(options: Options):
+    return options.manual_file_date_override
 
-def from_sys_file_times(file_name: str, config: ConfigParser):
+def from_sys_file_times(file_name: str, options: Options):
     """This is dangerous!"""
     # get the file modified date
     mod_time = os.path.getmtime(file_name)
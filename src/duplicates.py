@@ -1,29 +1,18 @@
 import os
 import shutil
 import hashlib
-from PIL import Image
-import cv2
-from configparser import ConfigParser
+from .options import Options
 from . import fixer_util
+from . import metrics
 from .ffprobe import FFProbe
+from .manifest import MANIFEST_FILE_NAME
+from .media_file import MediaFile
+from .lazy_imports import cv2
 
-def __generate_file_hash(file_path: str):
-    BUF_SIZE = 65536
-    hasher = hashlib.sha256()
-    
-    with open(file_path, 'rb') as f:
-        while True:
-            data = f.read(BUF_SIZE)
-            if not data:
-                break
-            hasher.update(data)
-            
-    return hasher.hexdigest()
-
-def __generate_image_hash(file_path: str):
+def __generate_image_hash(media_file: MediaFile):
     try:
         # Open the image file
-        img = Image.open(file_path)
+        img = media_file.image()
         
         # Create a hash object using the SHA256 algorithm
         hash_obj = hashlib.sha256()
@@ -44,7 +33,8 @@ def __generate_video_shape(file_path: str):
     video_shape = ""
 
     try:
-        metadata = FFProbe(file_path)
+        with metrics.span("operation_seconds", operation="ffprobe"):
+            metadata = FFProbe(file_path)
 
         video_streams = [s for s in metadata.streams if s.is_video()]
         if not video_streams:
@@ -95,55 +85,89 @@ def __generate_video_hash(file_path: str):
 def __find_duplicate_files(*paths, heavy=True):
     file_hashes = {}
     video_shapes = {}
-    
+
+    # files that are only told apart by a hash of their whole contents, with
+    # a hash of their size and start. Only files that share that partial
+    # hash with another file can be duplicates, so only they are read whole
+    partial_hashes = {}
+
+    # each file's hash or partial hash, and video shape, in the order found
+    found_files = []
+
     for path in paths:
         for root, _, files in os.walk(path):
             for file in files:
+                # the run manifest is not a media file
+                if file.startswith(MANIFEST_FILE_NAME):
+                    continue
+
                 file_path = os.path.join(root, file)
                 file_type = fixer_util.guess_media_type(file)
                 file_hash = None
+                partial_hash = None
                 video_shape = None
 
                 try:
-                    # try to get a hash of the image content
-                    if file_type == "image":
-                        file_hash = __generate_image_hash(file_path)
-                        
-                        # if no img hash could be generated, maybe it is a 
-                        # mis-labeled video so try to get the file's video shape 
-                        if not file_hash:
+                    with MediaFile(file_path) as media_file:
+                        # try to get a hash of the image content
+                        if file_type == "image":
+                            file_hash = __generate_image_hash(media_file)
+
+                            # if no img hash could be generated, maybe it is a
+                            # mis-labeled video so try to get the file's video shape
+                            if not file_hash:
+                                video_shape = __generate_video_shape(file_path)
+
+                        # try to get a shape of the video centent
+                        if file_type == "video":
                             video_shape = __generate_video_shape(file_path)
 
-                    # try to get a shape of the video centent
-                    if file_type == "video":
-                        video_shape = __generate_video_shape(file_path)
-                        
-                        # if no video shape could be generated, maybe it is a 
-                        # mis-labeled image so try to get the file's image 
-                        # content hash
-                        if not video_shape:
-                            file_hash = __generate_image_hash(file_path)
-
-                    # if no video shape or image hash was found, we dunno what 
-                    # the heck this file is, so just take a hash of the whole 
-                    # thing
-                    if not file_hash and not video_shape:
-                        file_hash = __generate_file_hash(file_path)
+                            # if no video shape could be generated, maybe it is a
+                            # mis-labeled image so try to get the file's image
+                            # content hash
+                            if not video_shape:
+                                file_hash = __generate_image_hash(media_file)
+
+                        # if no video shape or image hash was found, we dunno what
+                        # the heck this file is, so just take a hash of the whole
+                        # thing, once another file could have the same contents
+                        if not file_hash and not video_shape:
+                            partial_hash = media_file.partial_hash()
+                            partial_hashes.setdefault(partial_hash, []).append(file_path)
 
                 except OSError as e:
                     continue
-                
-                # add the img or file hash to the list of hashes
-                if file_hash in file_hashes:
-                    file_hashes[file_hash].append(file_path)
-                elif file_hash:
-                    file_hashes[file_hash] = [file_path]
-                
-                # add the video shape to the list of video shapes
-                if video_shape in video_shapes:
-                    video_shapes[video_shape].append(file_path)
-                elif video_shape:
-                    video_shapes[video_shape] = [file_path]
+
+                found_files.append((file_path, file_hash, partial_hash, video_shape))
+
+    # only the files that share a partial hash are hashed whole
+    whole_hashes = {}
+    for partial_hash, partial_group in partial_hashes.items():
+        if len(partial_group) < 2:
+            continue
+
+        for file_path in partial_group:
+            try:
+                with MediaFile(file_path) as media_file:
+                    whole_hashes[file_path] = media_file.file_hash()
+            except OSError as e:
+                continue
+
+    for file_path, file_hash, partial_hash, video_shape in found_files:
+        if partial_hash:
+            file_hash = whole_hashes.get(file_path)
+
+        # add the img or file hash to the list of hashes
+        if file_hash in file_hashes:
+            file_hashes[file_hash].append(file_path)
+        elif file_hash:
+            file_hashes[file_hash] = [file_path]
+
+        # add the video shape to the list of video shapes
+        if video_shape in video_shapes:
+            video_shapes[video_shape].append(file_path)
+        elif video_shape:
+            video_shapes[video_shape] = [file_path]
 
     similiar_video_groups = [tuple(videos) for videos in video_shapes.values() if len(videos) > 1]
 
@@ -171,19 +195,20 @@ def __find_duplicate_files(*paths, heavy=True):
 
     return duplicate_images + duplicate_videos
 
-def generate_report(start_path, config: ConfigParser):
-    heavy = config.get("deduplication", "heavy_duplicate_file_checking")
-    dups = __find_duplicate_files(start_path, heavy=heavy)
+@metrics.timed("find_duplicates")
+def generate_report(start_path, options: Options):
+    dups = __find_duplicate_files(start_path, heavy=options.heavy_duplicate_file_checking)
     with open("duplicates.txt", "w") as fi:
         for dup in dups:
             print('"', '","'.join(dup), '"', file=fi, sep="")
 
     return dups
 
-def move_older(duplicate_tuples: list, config: ConfigParser):
-    dest_dir = config.get("deduplication", "duplicate_path")
-    preferred_keyword = config.get("deduplication", "preferred_keyword_in_dups")
-    unpreferred_keyword = config.get("deduplication", "unpreferred_keyword_in_dups")
+@metrics.timed("move_duplicates")
+def move_older(duplicate_tuples: list, options: Options):
+    dest_dir = options.duplicate_path
+    preferred_keyword = options.preferred_keyword_in_dups
+    unpreferred_keyword = options.unpreferred_keyword_in_dups
 
     fixer_util.create_directories(dest_dir + "/d")
     moved_files = []
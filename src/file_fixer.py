@@ -0,0 +1,684 @@
+import os
+import time
+import tracemalloc
+from multiprocessing import Pool
+from datetime import datetime
+from .determine_date import read_file_date, resolve_date, find_gphotos_json
+from .img_name_gen import ImgNameGen
+from .pipeline import Pipeline, Stage
+from .scanner import ScannedFile
+from .media_file import MediaFile
+from .manifest import Manifest
+from .options import Options
+from .rate_limit import RateLimiter
+from . import fixer_util
+from . import metrics
+from . import profiling
+from .log import CaptureLogger
+
+# state for worker processes, set once per process by init_worker so the
+# options do not need to be sent along with every file
+_worker_options = None
+
+def init_worker(options: Options):
+    global _worker_options
+    _worker_options = options
+
+def init_pool_worker(options: Options):
+    # a worker forked while --memory traces the main process would be
+    # traced too, which slows it down without any of it being reported
+    if tracemalloc.is_tracing():
+        tracemalloc.stop()
+
+    init_worker(options)
+
+def read_date(input_file_name: str, photo_details_dict: dict, sidecar_names: frozenset | None):
+    """Reads the date from the file and the files next to it, along with the
+        file's MIME type while the start of it is in memory, so deciding
+        its type does not open it again"""
+    with MediaFile(input_file_name) as media_file:
+        read_date = read_file_date(
+            input_file_name,
+            _worker_options,
+            photo_details_dict,
+            sidecar_names,
+            media_file,
+        )
+        return read_date, media_file.mime_type()
+
+def decide_file(input_file_name: str, read_date: tuple, mime_type: str | None):
+    """Determines the date and type of a file without writing anything, so
+        it is safe to run for many files at once in any order. Anything
+        that would have been logged is returned so the caller can write it
+        to the report in order"""
+    logger = CaptureLogger()
+
+    file_date, original_file_date, write_metadata, date_source = resolve_date(
+        input_file_name, _worker_options, read_date)
+
+    file_type, file_extension = None, None
+    if file_date:
+        file_type, file_extension = fixer_util.get_file_type(
+            input_file_name,
+            logger,
+            mime_type,
+        )
+
+    return (
+        file_date,
+        original_file_date,
+        write_metadata,
+        file_type,
+        file_extension,
+        date_source,
+        logger.text,
+    )
+
+def copy_to_error_dir(
+        input_file_name: str,
+        error_file_name: str,
+        create_directories: bool = True,
+):
+    if create_directories:
+        fixer_util.create_directories(error_file_name)
+
+    partial_error_file_name = fixer_util.partial_file_name(error_file_name)
+    fixer_util.copy_file(
+        input_file_name,
+        partial_error_file_name,
+        _worker_options.output_mode,
+    )
+    os.replace(partial_error_file_name, error_file_name)
+
+    return ""
+
+def write_file(
+        input_file_name: str,
+        output_file_name: str,
+        file_type: str,
+        file_extension: str,
+        file_date: datetime,
+        original_file_date: datetime | None,
+        write_metadata: bool,
+        create_directories: bool = True,
+) -> str:
+    """Writes the fixed file to its output path, returning anything that
+        would have been logged"""
+    options = _worker_options
+    logger = CaptureLogger()
+
+    if create_directories:
+        fixer_util.create_directories(output_file_name)
+
+    # everything is written to a partial file that only gets the output
+    # file's name once it is complete
+    partial_output_file_name = fixer_util.partial_file_name(output_file_name)
+
+    write_sidecar = False
+
+    # write the date to the exif data if it is a jpg file and the date did not
+    # originally come from the exif data
+    if options.override_png_metadata and file_extension == "png" :
+        write_metadata = True
+
+    successful_metadata_write = False
+    if write_metadata:
+        if file_extension == "jpg":
+            with MediaFile(input_file_name) as media_file:
+                successful_metadata_write = fixer_util.write_jpg_with_exif(
+                    media_file,
+                    partial_output_file_name,
+                    file_date,
+                    logger,
+                    original_file_date
+                )
+
+        elif file_extension == "png":
+            with MediaFile(input_file_name) as media_file:
+                successful_metadata_write = fixer_util.write_png_with_metadata(
+                    media_file,
+                    partial_output_file_name,
+                    file_date,
+                    logger,
+                )
+
+        elif file_type == "video":
+            successful_metadata_write = fixer_util.write_video_with_metadata(
+                input_file_name,
+                partial_output_file_name,
+                file_date,
+                logger,
+                options,
+            )
+
+        if not successful_metadata_write:
+            write_sidecar = True
+
+    if file_type == "video":
+        # Write to a sidecar for video files since most video file
+        # containers do not support time offset
+        write_sidecar = True
+
+    if options.write_sidecar_for_unsupported_types and write_sidecar:
+            fixer_util.write_sidecar(output_file_name, file_date)
+
+    # copy the file to the output file if a new file was not
+    # written with metadata
+    if not successful_metadata_write:
+        fixer_util.copy_file(
+            input_file_name,
+            partial_output_file_name,
+            options.output_mode,
+        )
+
+    # create a time object that can be set as the file's modification date
+    modTime = time.mktime(file_date.timetuple())
+
+    # write that the file was modified when it was taken
+    os.utime(partial_output_file_name, (modTime, modTime))
+
+    os.replace(partial_output_file_name, output_file_name)
+
+    return logger.text
+
+class FixedFile:
+    """Everything worked out about one input file as it moves through the
+        pipeline"""
+    def __init__(
+            self,
+            index: int,
+            input_file_name: str,
+            input_path: str,
+            options: Options,
+            sidecar_names: frozenset | None = None,
+    ):
+        self.index = index
+        self.input_file_name = input_file_name
+        self.sidecar_names = sidecar_names
+
+        # set when the file is unchanged since it was fixed in an earlier
+        # run, so it goes through the pipeline without being fixed again
+        self.skipped = False
+        self.input_stat = None
+        self.name_key = None
+
+        self.file_name = input_file_name.replace(input_path + "/", "")
+        self.rel_file_path = ""
+
+        split_name = self.file_name.rsplit("/", 1)
+        if len(split_name) == 2:
+            self.file_name = split_name[1]
+
+            if options.preserve_directory_structure:
+                self.rel_file_path = "/" + split_name[0]
+
+        self.read_date = None
+        self.mime_type = None
+        self.date_source = None
+        self.file_date = None
+        self.original_file_date = None
+        self.write_metadata = False
+        self.file_type = None
+        self.file_extension = None
+        self.new_file_name = None
+        self.output_file_name = None
+        self.error_file_name = None
+        self.log_text = ""
+
+        # how long each pipeline stage took for this file, in seconds
+        self.timings = {}
+
+    def to_record(self) -> dict:
+        """A summary of how the file was fixed for the JSON report"""
+        return {
+            "index": self.index,
+            "input": self.input_file_name,
+            "status": "fixed" if self.file_date else "error",
+            "output": self.output_file_name or self.error_file_name,
+            "date": self.file_date.isoformat() if self.file_date else None,
+            "date_source": self.date_source,
+            "timings": self.timings,
+        }
+
+    def to_plan(self, options: Options) -> dict:
+        return {
+            "index": self.index,
+            "input": self.input_file_name,
+            "name": self.file_name,
+            "output": self.output_file_name or self.error_file_name,
+            "error": not self.file_date,
+            "date": self.file_date.isoformat() if self.file_date else None,
+            "date_source": self.date_source,
+            "original_date": self.original_file_date.isoformat() \
+                if self.original_file_date else None,
+            "write_metadata": self.write_metadata,
+            "sidecar": plans_sidecar(
+                self.file_type, self.file_extension, self.write_metadata, options),
+            "type": self.file_type,
+            "extension": self.file_extension,
+            "new_name": self.new_file_name,
+            "name_key": self.name_key,
+            "log": self.log_text,
+        }
+
+    @staticmethod
+    def from_plan(entry: dict, input_path: str, options: Options):
+        fixed_file = FixedFile(entry["index"], entry["input"], input_path, options)
+
+        # the local timezone is put back on the dates, since only their
+        # offset is kept in the plan
+        local_timezone = options.local_timezone
+        if entry["date"]:
+            fixed_file.file_date = datetime.fromisoformat(entry["date"]) \
+                .astimezone(local_timezone)
+        if entry["original_date"]:
+            fixed_file.original_file_date = \
+                datetime.fromisoformat(entry["original_date"]) \
+                .astimezone(local_timezone)
+
+        if entry["error"]:
+            fixed_file.error_file_name = entry["output"]
+        else:
+            fixed_file.output_file_name = entry["output"]
+
+        fixed_file.file_name = entry["name"]
+        fixed_file.date_source = entry["date_source"]
+        fixed_file.write_metadata = entry["write_metadata"]
+        fixed_file.file_type = entry["type"]
+        fixed_file.file_extension = entry["extension"]
+        fixed_file.new_file_name = entry["new_name"]
+        fixed_file.name_key = entry["name_key"]
+        fixed_file.log_text = entry["log"]
+
+        return fixed_file
+
+def plans_sidecar(
+        file_type: str,
+        file_extension: str,
+        write_metadata: bool,
+        options: Options,
+) -> bool:
+    """Whether write_file is expected to write a sidecar file, assuming
+        writing metadata into the file itself succeeds where supported"""
+    if not options.write_sidecar_for_unsupported_types:
+        return False
+
+    if file_type == "video":
+        return True
+
+    if options.override_png_metadata and file_extension == "png":
+        write_metadata = True
+
+    return write_metadata and file_extension not in ["jpg", "png"]
+
+class FileFixer:
+    """Fixes files in a pipeline of stages: reading dates from the files,
+        determining the date, naming and writing. The stages that read or
+        write files run concurrently, and in worker processes if there is
+        more than one, while naming happens one file at a time in input
+        order so the output is the same no matter the concurrency"""
+
+    def __init__(
+            self,
+            options: Options,
+            photo_details_dict: dict,
+            manifest: Manifest | None = None,
+            skip_unchanged: bool = False,
+    ):
+        self.options = options
+        self.photo_details_dict = photo_details_dict
+        self.manifest = manifest
+        self.skip_unchanged = skip_unchanged
+        self.skipped_count = 0
+
+        self.input_path = options.input_path
+        self.output_path = options.output_path
+        self.error_path = options.error_path
+        self.output_mode = options.output_mode
+        self.rate_limiter = RateLimiter.from_options(options)
+
+        self.workers = options.workers
+        self.img_name_gen = ImgNameGen()
+        self.pool = None
+
+        # the worker processes are kept between runs when more runs will
+        # follow, as they are when fixing files through the API
+        self.keep_workers = False
+
+        self.queue_size = options.queue_size
+        self.pipeline = None
+
+        # a plan has all of its directories created up front
+        self.create_directories = True
+
+        self.check_stage = self.__timed_stage(
+            "check manifest", self.check_manifest)
+        self.read_stage = self.__timed_stage(
+            "read metadata",
+            self.read_date,
+            options.metadata_concurrency,
+        )
+        self.date_stage = self.__timed_stage(
+            "determine date",
+            self.determine_date,
+            options.date_concurrency,
+        )
+        self.name_stage = self.__timed_stage("name", self.name, ordered=True)
+        self.write_stage = self.__timed_stage(
+            "write",
+            self.write,
+            options.write_concurrency,
+        )
+
+    def fix_files(self, input_files):
+        """Yields a FixedFile for each input file, in input order, once it
+            has been written"""
+        yield from self.__run(
+            [
+                self.check_stage,
+                self.read_stage,
+                self.date_stage,
+                self.name_stage,
+                self.write_stage,
+            ],
+            self.__to_fixed_files(input_files),
+        )
+
+    def plan_files(self, input_files):
+        """Yields a FixedFile for each input file, in input order, with its
+            date and output file name worked out but without writing it"""
+        yield from self.__run(
+            [
+                self.check_stage,
+                self.read_stage,
+                self.date_stage,
+                self.name_stage,
+            ],
+            self.__to_fixed_files(input_files),
+        )
+
+    def apply_plan(self, planned_files):
+        """Writes files that were already planned by plan_files, without
+            reading their dates again"""
+        # the plan already left out the files that were unchanged
+        skip_unchanged = self.skip_unchanged
+        self.skip_unchanged = False
+
+        try:
+            yield from self.__run(
+                [self.check_stage, self.write_stage],
+                planned_files,
+            )
+        finally:
+            self.skip_unchanged = skip_unchanged
+
+    def __timed_stage(self, name: str, handler, concurrency=1, ordered=False):
+        """A pipeline stage that records how long it took for each file"""
+        def timed_handler(fixed_file: FixedFile):
+            trace_args = {"file": fixed_file.file_name}
+            start_time = time.perf_counter()
+
+            with metrics.span("stage_seconds", trace_args, stage=name), \
+                    profiling.scope(name):
+                fixed_file = handler(fixed_file)
+
+            fixed_file.timings[name] = time.perf_counter() - start_time
+            return fixed_file
+
+        return Stage(name, timed_handler, concurrency, ordered)
+
+    def __to_fixed_files(self, input_files):
+        for i, input_file in enumerate(input_files):
+            if isinstance(input_file, ScannedFile):
+                yield FixedFile(
+                    i,
+                    input_file.path,
+                    input_file.input_path or self.input_path,
+                    self.options,
+                    input_file.sidecar_names,
+                )
+            else:
+                yield FixedFile(i, input_file, self.input_path, self.options)
+
+    def __run(self, stages: list, fixed_files):
+        if self.workers > 1:
+            if not self.pool:
+                self.pool = Pool(
+                    self.workers,
+                    initializer=init_pool_worker,
+                    initargs=(self.options,),
+                )
+        else:
+            init_worker(self.options)
+
+        self.pipeline = Pipeline(stages, max_in_flight=self.queue_size)
+
+        try:
+            for fixed_file in self.pipeline.run(fixed_files):
+                self.count(fixed_file)
+
+                if fixed_file.skipped:
+                    self.skipped_count += 1
+                    continue
+
+                if self.write_stage in stages:
+                    self.record(fixed_file)
+
+                yield fixed_file
+        finally:
+            if not self.keep_workers:
+                self.close()
+
+    def close(self):
+        """Stops the worker processes"""
+        if self.pool:
+            self.pool.terminate()
+            self.pool = None
+
+    def run(self, fixed_file: FixedFile, job, *args):
+        # the timings recorded while running the job are sent back with its
+        # result, since worker processes do not share the metrics
+        if self.pool:
+            result, spans = self.pool.apply(metrics.collect_spans, (job,) + args)
+        else:
+            result, spans = metrics.collect_spans(job, *args)
+
+        metrics.add_spans(spans, file=fixed_file.file_name)
+        return result
+
+    def count(self, fixed_file: FixedFile):
+        if fixed_file.skipped:
+            metrics.registry.increment("files_total", status="skipped")
+            return
+
+        status = "fixed" if fixed_file.file_date else "error"
+        date_source = fixed_file.date_source or "none"
+
+        metrics.registry.increment(
+            "files_total", status=status, date_source=date_source)
+        metrics.registry.observe(
+            "file_seconds", sum(fixed_file.timings.values()), date_source=date_source)
+
+    def check_manifest(self, fixed_file: FixedFile):
+        if not self.manifest:
+            return fixed_file
+
+        fixed_file.input_stat = os.stat(fixed_file.input_file_name)
+
+        if not self.skip_unchanged:
+            return fixed_file
+
+        unchanged = self.manifest.get_unchanged(
+            fixed_file.input_file_name, fixed_file.input_stat)
+        if unchanged:
+            _, _, fixed_file.name_key = unchanged
+            fixed_file.skipped = True
+
+        return fixed_file
+
+    def record(self, fixed_file: FixedFile):
+        if not self.manifest:
+            return
+
+        input_stat = fixed_file.input_stat
+        output_file_name = fixed_file.output_file_name \
+            if fixed_file.file_date else fixed_file.error_file_name
+
+        # a hard linked output shares its modification time with the input,
+        # which was just set to the file's date, so the input is recorded
+        # as it is now or it would never be seen as unchanged
+        if self.output_mode in fixer_util.LINKING_OUTPUT_MODES:
+            output_stat = os.stat(output_file_name)
+            if (output_stat.st_dev, output_stat.st_ino) \
+                    == (input_stat.st_dev, input_stat.st_ino):
+                input_stat = output_stat
+
+        if fixed_file.file_date:
+            self.manifest.record(
+                fixed_file.input_file_name,
+                input_stat,
+                "fixed",
+                fixed_file.output_file_name,
+                fixed_file.name_key,
+            )
+        else:
+            self.manifest.record(
+                fixed_file.input_file_name,
+                input_stat,
+                "error",
+                fixed_file.error_file_name,
+                None,
+            )
+
+    def read_date(self, fixed_file: FixedFile):
+        if fixed_file.skipped:
+            return fixed_file
+
+        # The photo details keep growing as the input is scanned, so rather
+        # than sending all of them to the worker processes only the ones
+        # for this file are sent. Only the sidecar file that would be used
+        # is sent for the same reason
+        photo_details = {}
+        if fixed_file.file_name in self.photo_details_dict:
+            photo_details[fixed_file.file_name] = \
+                self.photo_details_dict[fixed_file.file_name]
+
+        sidecar_names = fixed_file.sidecar_names
+        if sidecar_names is not None:
+            json_file_name = find_gphotos_json(
+                fixed_file.input_file_name, sidecar_names)
+            sidecar_names = frozenset(
+                [os.path.basename(json_file_name)] if json_file_name else [])
+
+        fixed_file.read_date, fixed_file.mime_type = self.run(
+            fixed_file,
+            read_date,
+            fixed_file.input_file_name,
+            photo_details,
+            sidecar_names,
+        )
+        return fixed_file
+
+    def determine_date(self, fixed_file: FixedFile):
+        if fixed_file.skipped:
+            return fixed_file
+
+        fixed_file.file_date, \
+            fixed_file.original_file_date, \
+            fixed_file.write_metadata, \
+            fixed_file.file_type, \
+            fixed_file.file_extension, \
+            fixed_file.date_source, \
+            decision_log = self.run(
+                fixed_file,
+                decide_file,
+                fixed_file.input_file_name,
+                fixed_file.read_date,
+                fixed_file.mime_type,
+            )
+
+        fixed_file.log_text += decision_log
+        return fixed_file
+
+    def name(self, fixed_file: FixedFile):
+        # names are counted in input order even for skipped files, so
+        # nonces come out the same as if every file was fixed again
+        if fixed_file.skipped:
+            if fixed_file.name_key:
+                self.img_name_gen.reserve_name(fixed_file.name_key)
+            return fixed_file
+
+        if not fixed_file.file_date:
+            fixed_file.error_file_name = \
+                f"{self.error_path + fixed_file.rel_file_path}/{fixed_file.file_name}"
+            return fixed_file
+
+        with metrics.span(
+                "operation_seconds",
+                {"file": fixed_file.file_name},
+                operation="gen_file_name",
+        ):
+            fixed_file.new_file_name = self.img_name_gen.gen_file_name(
+                fixed_file.file_name,
+                fixed_file.file_type,
+                fixed_file.file_extension,
+                fixed_file.file_date,
+                self.options,
+            )
+        fixed_file.name_key = self.img_name_gen.last_name_key
+
+        if self.options.output_in_month_subdirs \
+                and (not self.options.preserve_directory_structure or not fixed_file.rel_file_path):
+            fixed_file.output_file_name = f"{self.output_path}/" \
+                + f"{fixed_file.file_date.strftime('%Y')}/{fixed_file.file_date.strftime('%m')}/" \
+                + f"{fixed_file.new_file_name}"
+        else:
+            fixed_file.output_file_name = \
+                f"{self.output_path}{fixed_file.rel_file_path}/{fixed_file.new_file_name}"
+
+        return fixed_file
+
+    def write(self, fixed_file: FixedFile):
+        if fixed_file.skipped:
+            return fixed_file
+
+        # files are only sent to the workers as fast as the rate limit
+        # allows, so the limit applies across all of them
+        if not self.rate_limiter.unlimited:
+            input_stat = fixed_file.input_stat \
+                or os.stat(fixed_file.input_file_name)
+            self.rate_limiter.acquire(input_stat.st_size)
+
+        if not fixed_file.file_date:
+            fixed_file.log_text += self.run(
+                fixed_file,
+                copy_to_error_dir,
+                fixed_file.input_file_name,
+                fixed_file.error_file_name,
+                self.create_directories,
+            )
+            return fixed_file
+
+        # a nonce is random, so the name is recorded before the file is
+        # written, where a resumed run will find it instead of drawing another
+        if self.manifest and fixed_file.name_key:
+            self.manifest.record_writing(
+                fixed_file.input_file_name,
+                fixed_file.input_stat,
+                fixed_file.output_file_name,
+                fixed_file.name_key,
+            )
+
+        fixed_file.log_text += self.run(
+            fixed_file,
+            write_file,
+            fixed_file.input_file_name,
+            fixed_file.output_file_name,
+            fixed_file.file_type,
+            fixed_file.file_extension,
+            fixed_file.file_date,
+            fixed_file.original_file_date,
+            fixed_file.write_metadata,
+            self.create_directories,
+        )
+        return fixed_file
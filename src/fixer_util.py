@@ -1,15 +1,21 @@
 import os
-from datetime import datetime, timedelta
-from configparser import ConfigParser
+import shutil
+from datetime import datetime
 from .ffprobe import FFProbe
 from .log import Logger
-import ffmpeg
-import piexif
+from .options import Options
+from .media_file import MediaFile
+from . import metrics
+from .lazy_imports import PngImagePlugin, ffmpeg, piexif, magic
 import pytz
-import PIL
-import magic
 import tempfile
 
+try:
+    import fcntl
+except ImportError:
+    # not available on Windows, where files are never reflinked
+    fcntl = None
+
 video_extensions = [
     "mp4",
     "avi",
@@ -85,28 +91,23 @@ mime_types = {
     "audio/ogg": "oga",
 }
 
-def is_within_years(dt: datetime, config: ConfigParser):
-    if not dt:
-        return False
+PARTIAL_FILE_PREFIX = ".partial-"
 
-    earliest_year = config.get("parsing", "earliest_year")
-    latest_year = config.get("parsing", "latest_year")
+# the ioctl that clones a file's extents into another file on filesystems
+# that support copy on write, like btrfs and XFS
+FICLONE = 0x40049409
 
-    try:
-        earliest_year = int(earliest_year)
-    except:
-        earliest_year = 1826
+# output modes that can make the output file the same file as the input
+LINKING_OUTPUT_MODES = ["hardlink"]
 
-    try:
-        latest_year = int(latest_year)
-    except:
-        # get the year of tomorrow+1 in case the photo was taken in a later tz
-        latest_year = (datetime.now() + timedelta(days=2)).year
+def is_within_years(dt: datetime, options: Options):
+    if not dt:
+        return False
 
-    if (earliest_year and dt.year < earliest_year):
+    if (options.earliest_year and dt.year < options.earliest_year):
         return False
 
-    if (latest_year and dt.year > latest_year):
+    if (options.latest_year and dt.year > options.latest_year):
         return False
 
     return True
@@ -114,15 +115,113 @@ def is_within_years(dt: datetime, config: ConfigParser):
 def create_directories(file_path: str):
     dir_path = os.path.dirname(file_path)
 
+    # other worker processes may be creating the same directory at once
     if not os.path.exists(dir_path):
-        os.makedirs(dir_path)
+        os.makedirs(dir_path, exist_ok=True)
+
+def partial_file_name(file_name: str) -> str:
+    """The name a file is written to before it is complete. It is only
+        renamed to its real name once it is fully written, so an
+        interrupted run never leaves a half written file behind under a
+        real name. The extension is kept so the file type can still be
+        told from the name when writing"""
+    dir_path, base_name = os.path.split(file_name)
+    return os.path.join(dir_path, PARTIAL_FILE_PREFIX + base_name)
+
+def remove_partial_files(path: str) -> int:
+    """Removes the partial files left behind by an interrupted run"""
+    removed = 0
+
+    for root, _, files in os.walk(path):
+        for file in files:
+            if file.startswith(PARTIAL_FILE_PREFIX):
+                os.remove(os.path.join(root, file))
+                removed += 1
+
+    return removed
+
+def reflink_file(input_file_name: str, output_file_name: str) -> bool:
+    if not fcntl:
+        return False
+
+    try:
+        with open(input_file_name, "rb") as src, open(output_file_name, "wb") as dst:
+            fcntl.ioctl(dst.fileno(), FICLONE, src.fileno())
+    except OSError:
+        if os.path.exists(output_file_name):
+            os.remove(output_file_name)
+        return False
+
+    shutil.copystat(input_file_name, output_file_name)
+    return True
 
-def get_file_type(file_path: str, logger: Logger) -> str:
+def link_file(input_file_name: str, output_file_name: str) -> bool:
+    try:
+        os.link(input_file_name, output_file_name)
+    except OSError:
+        return False
+
+    return True
+
+def copy_file_range(input_file_name: str, output_file_name: str) -> bool:
+    if not hasattr(os, "copy_file_range"):
+        return False
+
+    try:
+        with open(input_file_name, "rb") as src, open(output_file_name, "wb") as dst:
+            size = os.fstat(src.fileno()).st_size
+            copied = 0
+
+            while copied < size:
+                sent = os.copy_file_range(src.fileno(), dst.fileno(), size - copied)
+                if sent == 0:
+                    break
+                copied += sent
+    except OSError:
+        if os.path.exists(output_file_name):
+            os.remove(output_file_name)
+        return False
+
+    shutil.copystat(input_file_name, output_file_name)
+    return True
+
+@metrics.timed("copy")
+def copy_file(
+        input_file_name: str,
+        output_file_name: str,
+        output_mode: str = "copy",
+) -> str:
+    """Puts the contents of the input file at the output file name without
+        copying its bytes through userspace where the output mode and the
+        filesystem allow it, returning how it was done. Only the hardlink
+        mode hard links, since a hard linked output is the same file as the
+        input, so setting its modification time also sets the input's.
+        Anything that cannot be done falls back to a regular copy"""
+    if output_mode in ["reflink", "auto"] \
+            and reflink_file(input_file_name, output_file_name):
+        return "reflink"
+
+    if output_mode in LINKING_OUTPUT_MODES \
+            and link_file(input_file_name, output_file_name):
+        return "hardlink"
+
+    if output_mode == "auto" \
+            and copy_file_range(input_file_name, output_file_name):
+        return "copy_file_range"
+
+    shutil.copy2(input_file_name, output_file_name)
+    return "copy"
+
+@metrics.timed("file_type")
+def get_file_type(file_path: str, logger: Logger, mime: str | None = None) -> str:
+    """The file's type and extension, from its MIME type when it was already
+        sniffed or else by sniffing the file"""
     file_type = "unknown"
     file_extension = ""
 
     try:
-        mime = magic.from_file(file_path, mime=True)
+        if not mime:
+            mime = magic.from_file(file_path, mime=True)
         file_type = mime.split("/")[0]
         file_extension = mime_types.get(mime, "")
     except:
@@ -147,8 +246,9 @@ def get_file_type(file_path: str, logger: Logger) -> str:
 def get_utc_offset(localized_datetime: datetime) -> str:
     return localized_datetime.isoformat()[-6:]
 
+@metrics.timed("write_jpg_metadata")
 def write_jpg_with_exif(
-        input_file_name: str,
+        input_file: MediaFile,
         output_file_name: str,
         img_datetime: datetime,
         logger: Logger,
@@ -158,7 +258,7 @@ def write_jpg_with_exif(
         img_datetime_str = img_datetime.strftime('%Y:%m:%d %H:%M:%S')
         offset_str = get_utc_offset(img_datetime)
 
-        image = PIL.Image.open(input_file_name)
+        image = input_file.image()
         if image.info.get("exif"):
             exif_dict = piexif.load(image.info['exif'])
         else:
@@ -175,17 +275,18 @@ def write_jpg_with_exif(
         return False
     return True
 
+@metrics.timed("write_png_metadata")
 def write_png_with_metadata(
-    input_file_name: str,
+    input_file: MediaFile,
     output_file_name: str,
     img_datetime: datetime,
     logger: Logger,
 ) -> bool:
     try:
-        image = PIL.Image.open(input_file_name)
+        image = input_file.image()
 
         # Create a PngInfo object to store metadata
-        metadata = PIL.PngImagePlugin.PngInfo()
+        metadata = PngImagePlugin.PngInfo()
 
         for key in image.info:
             if type(image.info[key]) is int or type(image.info[key]) is float:
@@ -213,7 +314,8 @@ def write_png_with_metadata(
 def get_video_comment(file_name: str):
     try:
         # Use FFprobe to get metadata from the video file
-        probe = FFProbe(file_name)
+        with metrics.span("operation_seconds", operation="ffprobe"):
+            probe = FFProbe(file_name)
 
         # Extract the metadata
         if probe.metadata.get("comment"):
@@ -225,12 +327,13 @@ def get_video_comment(file_name: str):
 
     return ""
 
+@metrics.timed("write_video_metadata")
 def write_video_with_metadata(
         input_file_name: str,
         output_file_name: str,
         video_date: datetime,
         logger: Logger,
-        config: ConfigParser,
+        options: Options,
 ) -> bool:
     try:
         video_datetime_utc = video_date.astimezone(pytz.UTC)
@@ -253,7 +356,8 @@ def write_video_with_metadata(
                 metadata=f'creation_time={creation_time}',
             )
 
-            ffmpeg.run(tmp_output_stream, overwrite_output=True, quiet=True)
+            with metrics.span("operation_seconds", operation="ffmpeg"):
+                ffmpeg.run(tmp_output_stream, overwrite_output=True, quiet=True)
 
             # copy the tmp file but add a comment with the offset time
             input_stream = ffmpeg.input(tmp_output_file_name)
@@ -266,12 +370,14 @@ def write_video_with_metadata(
                 metadata=f'comment={comment}',
             )
 
-            ffmpeg.run(output_stream, overwrite_output=True, quiet=True)
+            with metrics.span("operation_seconds", operation="ffmpeg"):
+                ffmpeg.run(output_stream, overwrite_output=True, quiet=True)
     except Exception as e:
         logger.log(f"! Error writing video metadata: {e} -> ", end="")
         return False
     return True
 
+@metrics.timed("write_sidecar")
 def write_sidecar(output_file_name: str, file_date: datetime):
     """Use the XMP file format and the photoshop DateCreated tag because
         it supports offset time and PhotoPrism is known to parse it on import"""
@@ -280,8 +386,9 @@ def write_sidecar(output_file_name: str, file_date: datetime):
 
     file_name_no_ext, _ = os.path.splitext(output_file_name)
     output_file_name = file_name_no_ext + ".xmp"
+    partial_output_file_name = partial_file_name(output_file_name)
 
-    with open(output_file_name, "w") as f:
+    with open(partial_output_file_name, "w") as f:
         print(
             '<x:xmpmeta xmlns:x="adobe:ns:meta/" x:xmptk="XMP Core 6.0.0">',
             '<rdf:RDF xmlns:rdf="http://www.w3.org/1999/02/22-rdf-syntax-ns#">',
@@ -296,6 +403,8 @@ def write_sidecar(output_file_name: str, file_date: datetime):
             file=f,
         )
 
+    os.replace(partial_output_file_name, output_file_name)
+
 def guess_media_type(file_name: str):
     file_ext = file_name.split(".")[-1].lower()
 
@@ -1,30 +1,36 @@
 import re
 from datetime import datetime
-from configparser import ConfigParser
 import random
 import re
 import string
-from .preserve_wordlist import larger_words_to_preserve, words_to_not_preserve
+from . import preserve_wordlist
+from .options import Options
+from .preserve_wordlist import words_to_not_preserve
 
 class ImgNameGen:
     def __init__(self):
         self.prev_filenames = []
 
+        # the name the last generated nonce was counted under, if any
+        self.last_name_key = None
+
     def gen_file_name(self, 
             file_name: str, 
             file_type: str,
             file_extension: str,
             file_date: datetime, 
-            config: ConfigParser):
-        if not config.getboolean("output", "rename_files"):
+            options: Options):
+        self.last_name_key = None
+
+        if not options.rename_files:
             return file_name
 
-        if config.getboolean("output", "expand_file_types_in_name"):
+        if options.expand_file_types_in_name:
             file_name = self.expand_media_type(file_name)
 
         date_str = self.get_date_str(file_date)
 
-        if config.getboolean("output", "preserve_original_file_name"):
+        if options.preserve_original_file_name:
             if date_str in file_name:
                 # do not duplicate the date in the file name if the 
                 # original already had it
@@ -60,6 +66,7 @@ class ImgNameGen:
         incr = len([d for d in self.prev_filenames if d == img_filename])
 
         self.prev_filenames.append(img_filename)
+        self.last_name_key = img_filename
 
         consonants = ''.join(set(string.ascii_uppercase) - set('AEIOUYJXZ'))
 
@@ -76,6 +83,11 @@ class ImgNameGen:
             return f"_{incr}" + "".join(random.choices(consonants, k=1))
         return f"_{incr}"
 
+    def reserve_name(self, name_key: str):
+        """Counts a name generated in an earlier run, for a file that is
+            not being renamed again, so new files will not collide with it"""
+        self.prev_filenames.append(name_key)
+
     def get_media_type_prefix(self, file_name: str, file_type: str) -> str:
         img_prefix_regexes_from_file_name = {
             "^PXL_": "_PXL",
@@ -189,7 +201,7 @@ def get_valid_words(string):
     for word in words_to_not_preserve:
         mut_img_filename = mut_img_filename.replace(word, "")
 
-    for word in larger_words_to_preserve:
+    for word in preserve_wordlist.larger_words_to_preserve:
         if word in mut_img_filename:
             mut_img_filename = mut_img_filename.replace(word, "")
             postfix_words.append(word)
@@ -336,7 +348,7 @@ def split_sub_delimited_words(words: list):
         if not re.match("pt[\.\-\d_]{1,4}|pg[\.\-\d_]{1,4}", word) \
                 and len(word) > 4 \
                 and re.match("^(?=.*[0-9])(?=.*[a-zA-Z]).*$", word):
-            for pres_word in larger_words_to_preserve:
+            for pres_word in preserve_wordlist.larger_words_to_preserve:
                 mutated = True
                 if pres_word in word_mut:
                     words_separated.append(pres_word)
@@ -0,0 +1,179 @@
+import struct
+from .media_file import MediaFile, HEADER_SIZE
+
+# the date tags read, by the names the exif package gives them
+DATE_TAGS = {
+    0x0132: "datetime",
+    0x9003: "datetime_original",
+    0x9004: "datetime_digitized",
+    0x9010: "offset_time",
+    0x9011: "offset_time_original",
+    0x9012: "offset_time_digitized",
+}
+
+EXIF_IFD_POINTER = 0x8769
+GPS_IFD_POINTER = 0x8825
+
+ASCII_TYPE = 2
+
+# the tag types the exif package knows, it skips a whole IFD with any other
+KNOWN_TYPES = {0, 1, 2, 3, 4, 5, 7, 8, 9, 10}
+
+# how many bytes each IFD entry takes
+TAG_SIZE = 12
+
+class ExifDates:
+    """The date tags of a JPEG, read the way exif.Image reads them. A tag
+        the file does not have raises AttributeError, and one that is not
+        ASCII text raises ValueError, where exif.Image would raise too or
+        give a value that is not a date"""
+
+    def __init__(self, values: dict):
+        # the name of each tag found with its raw bytes, or None if the
+        # exif package could not read it as text
+        self.values = values
+
+    def __getattr__(self, name: str) -> str:
+        values = self.__dict__.get("values", {})
+        if name not in values:
+            raise AttributeError(f"image does not have attribute {name}")
+
+        if values[name] is None:
+            raise ValueError(f"{name} is not ASCII text")
+
+        return values[name].rstrip(b"\x00").decode("ascii")
+
+def read_exif_dates(media_file: MediaFile) -> ExifDates | None:
+    """The date tags of a JPEG, reading only the marker segments before its
+        image data, which are nearly always in the media file's header. A
+        JPEG without EXIF has no tags. None when the file is not a JPEG, or
+        when its EXIF is not where the exif package would look for it, in
+        which case that should read it"""
+    data = media_file.head(HEADER_SIZE)
+    if not data.startswith(b"\xff\xd8"):
+        return None
+
+    # walk the segments to the first APP1, any other marker before the
+    # image data has a length after it
+    start = 2
+    while True:
+        data = __read_to(media_file, start + 4)
+        if len(data) < start + 4 or data[start] != 0xFF:
+            return None
+
+        marker = data[start + 1]
+        if marker == 0xE1:
+            break
+
+        # a JPEG without EXIF, the exif package would look on through the
+        # image data for it, where the marker can not be, so it would only
+        # find one in what is after the image, like another image's
+        if marker == 0xDA:
+            return None if __find_app1(data, start) != -1 else ExifDates({})
+
+        if marker in (0x01, 0xFF) or 0xD0 <= marker <= 0xD9:
+            return None
+
+        start += 2 + struct.unpack(">H", data[start + 2:start + 4])[0]
+
+    if __find_app1(data, start + 2) != start:
+        return None
+
+    # the exif package runs the segment on past its length to the next 0xFF
+    end = start + 2 + struct.unpack(">H", data[start + 2:start + 4])[0]
+    while True:
+        data = __read_to(media_file, end + 1)
+        if len(data) <= end:
+            return None
+
+        next_marker = data.find(b"\xff", end)
+        if next_marker != -1:
+            break
+        end = len(data)
+
+    return __read_tiff(data[start + 10:next_marker])
+
+def __find_app1(data: bytes, end: int) -> int:
+    """Where the exif package would find the APP1 marker in data before
+        end, the first one at an even offset, which may be in another
+        segment's data. -1 if there is none"""
+    position = data.find(b"\xff\xe1", 0, end)
+    while position % 2 and position != -1:
+        position = data.find(b"\xff\xe1", position + 1, end)
+    return position
+
+def __read_to(media_file: MediaFile, size: int) -> bytes:
+    """At least size bytes of the media file, read a header's worth at a
+        time past what was read before"""
+    data = media_file.head(0)
+    if len(data) < size:
+        data = media_file.head(max(size, len(data) + HEADER_SIZE))
+    return data
+
+def __read_tiff(body: bytes) -> ExifDates | None:
+    if len(body) < 8 or body[:2] not in (b"II", b"MM"):
+        return None
+    order = "<" if body[:2] == b"II" else ">"
+
+    tags = {}
+    pointers = {}
+
+    def read_ifd(key, offset: int) -> int:
+        """Reads the date tags of an IFD into tags and the IFDs it points to
+            into pointers, returning the offset of the next IFD"""
+        if offset + 2 > len(body):
+            return 0
+        count = struct.unpack(order + "H", body[offset:offset + 2])[0]
+        if offset + 2 + count * TAG_SIZE + 4 > len(body):
+            return 0
+
+        entries = [
+            (tag_offset, *struct.unpack(order + "HHII", body[tag_offset:tag_offset + TAG_SIZE]))
+            for tag_offset in range(offset + 2, offset + 2 + count * TAG_SIZE, TAG_SIZE)
+        ]
+        if any(tag_type not in KNOWN_TYPES for _, _, tag_type, _, _ in entries):
+            return 0
+
+        for tag_offset, tag_id, tag_type, value_count, value_offset in entries:
+            # the thumbnail's tags do not replace the image's
+            if tag_id in DATE_TAGS and (key != 1 or tag_id not in tags):
+                tags[tag_id] = __read_ascii(
+                    body, tag_offset, tag_type, value_count, value_offset)
+
+            if tag_id == EXIF_IFD_POINTER:
+                pointers["exif"] = value_offset
+            if tag_id == GPS_IFD_POINTER:
+                pointers["gps"] = value_offset
+
+        return struct.unpack(order + "I", body[offset + 2 + count * TAG_SIZE:][:4])[0]
+
+    key = 0
+    offset = struct.unpack(order + "I", body[4:8])[0]
+    seen = set()
+
+    # the exif package would follow an IFD chain that loops forever
+    while offset and offset not in seen:
+        seen.add(offset)
+        offset = read_ifd(key, offset)
+        key += 1
+
+    if "exif" in pointers:
+        read_ifd("exif", pointers["exif"])
+    if "gps" in pointers:
+        read_ifd("gps", pointers["gps"])
+
+    return ExifDates({DATE_TAGS[tag_id]: value for tag_id, value in tags.items()})
+
+def __read_ascii(body: bytes, tag_offset: int, tag_type: int, value_count: int,
+        value_offset: int) -> bytes | None:
+    if tag_type != ASCII_TYPE:
+        return None
+
+    # short values are in the entry itself
+    if value_count <= 4:
+        value_offset = tag_offset + 8
+
+    if value_offset + value_count > len(body):
+        return None
+
+    return body[value_offset:value_offset + value_count]
@@ -0,0 +1,52 @@
+import importlib
+import threading
+
+class LazyModule:
+    """Stands in for a module until one of its attributes is first used, and
+        only then imports it. Heavy libraries like OpenCV, Pillow and
+        libmagic take most of the time it takes to start, and many runs
+        never need some of them"""
+
+    def __init__(self, name: str, on_import=None):
+        self.__name = name
+        self.__on_import = on_import
+        self.__module = None
+        self.__lock = threading.Lock()
+
+    def __load(self):
+        with self.__lock:
+            if self.__module is None:
+                module = importlib.import_module(self.__name)
+                if self.__on_import:
+                    self.__on_import()
+                self.__module = module
+
+        return self.__module
+
+    def __getattr__(self, attribute: str):
+        return getattr(self.__module or self.__load(), attribute)
+
+_heif_support = None
+
+def register_heif_opener() -> bool:
+    """Lets Pillow open HEIF and HEIC files if pillow-heif is installed,
+        returning whether it is"""
+    global _heif_support
+
+    if _heif_support is None:
+        try:
+            from pillow_heif import register_heif_opener
+            register_heif_opener()
+            _heif_support = True
+        except ImportError:
+            _heif_support = False
+
+    return _heif_support
+
+Image = LazyModule("PIL.Image", on_import=register_heif_opener)
+PngImagePlugin = LazyModule("PIL.PngImagePlugin")
+cv2 = LazyModule("cv2")
+exif = LazyModule("exif")
+piexif = LazyModule("piexif")
+magic = LazyModule("magic")
+ffmpeg = LazyModule("ffmpeg")
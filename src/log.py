@@ -1,27 +1,115 @@
-from configparser import ConfigParser
+import json
+import time
+import queue
+import atexit
+import threading
+from .options import Options
 from datetime import datetime
 
+# tells the writer thread to flush everything and stop
+_CLOSE = object()
+
 class Logger:
+    """Writes the report from a background thread, so logging never waits
+        on the report file. Writes are buffered and flushed every
+        flush_every_seconds and when the logger is closed, which happens
+        on exit at the latest.
+
+        When json_report is on, a record for each file is also written to
+        report.jsonl, one JSON object per line"""
     filename = "report.txt"
+    records_filename = "report.jsonl"
+    flush_every_seconds = 1
 
-    def __init__(self, config: ConfigParser):
-        report_path = config.get("structure", "report_path")
+    def __init__(self, options: Options):
+        report_path = options.report_path
         if report_path:
             self.filename = report_path + "/" + self.filename
+            self.records_filename = report_path + "/" + self.records_filename
 
-        if not config.getboolean("structure", "continuous_reporting"):
+        if not options.continuous_reporting:
             self.wipe_log()
 
+        self.file = open(self.filename, "a")
+
+        self.records_file = None
+        if options.json_report:
+            self.records_file = open(self.records_filename, "a")
+
+        self.closed = False
+        self.queue = queue.SimpleQueue()
+        self.thread = threading.Thread(target=self.__write_lines, daemon=True)
+        self.thread.start()
+
+        atexit.register(self.close)
+
     def wipe_log(self):
         with open(self.filename, "w") as f:
             print("", end="", file=f)
 
     def log_timestamped(self, text: str, end="\n"):
-        with open(self.filename, "a") as f:
-            print(datetime.now(), text, end=end, file=f)
-        print(datetime.now(), text, end=end)
+        timestamped_text = f"{datetime.now()} {text}{end}"
+        self.queue.put((self.file, timestamped_text))
+        print(timestamped_text, end="")
+
+    def log(self, text: str, end="\n"):
+        self.queue.put((self.file, text + end))
+        print(text, end=end)
+
+    def log_record(self, record: dict):
+        if self.records_file:
+            self.queue.put((self.records_file, json.dumps(record) + "\n"))
+
+    def close(self):
+        """Writes everything that was logged and closes the report"""
+        if self.closed:
+            return
+        self.closed = True
+
+        # every run registers its own logger, so a closed one is let go of
+        atexit.unregister(self.close)
+
+        self.queue.put(_CLOSE)
+        self.thread.join()
+
+        self.file.close()
+        if self.records_file:
+            self.records_file.close()
+
+    def __flush(self):
+        self.file.flush()
+        if self.records_file:
+            self.records_file.flush()
+        self.last_flush_time = time.monotonic()
+
+    def __write_lines(self):
+        self.last_flush_time = time.monotonic()
+
+        while True:
+            try:
+                item = self.queue.get(timeout=self.flush_every_seconds)
+            except queue.Empty:
+                self.__flush()
+                continue
+
+            if item is _CLOSE:
+                self.__flush()
+                return
+
+            file, text = item
+            file.write(text)
+
+            if time.monotonic() - self.last_flush_time >= self.flush_every_seconds:
+                self.__flush()
+
+class CaptureLogger:
+    """Collects log text in memory instead of writing it, so work done in
+        another process can be written to the report in order later"""
+    def __init__(self):
+        self.text = ""
+
+    def log_timestamped(self, text: str, end="\n"):
+        self.text += f"{datetime.now()} {text}{end}"
 
     def log(self, text: str, end="\n"):
-        with open(self.filename, "a") as f:
-            print(text, end=end, file=f)
-        print(text, end=end)
\ No newline at end of file
+        self.text += text + end
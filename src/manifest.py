@@ -0,0 +1,192 @@
+import os
+import time
+import sqlite3
+import hashlib
+import threading
+from configparser import ConfigParser
+
+MANIFEST_FILE_NAME = ".camera_roll_manifest.sqlite"
+
+# config options that change where files are written or what is written to
+# them. If any of these change, every file needs to be fixed again
+FINGERPRINT_SECTIONS = ["structure", "parsing", "output"]
+FINGERPRINT_IGNORED_OPTIONS = [
+    "report_path",
+    "continuous_reporting",
+    # the output is the same whichever way it is copied
+    "output_mode",
+]
+
+def config_fingerprint(config: ConfigParser) -> str:
+    hasher = hashlib.sha256()
+
+    for section in FINGERPRINT_SECTIONS:
+        if not config.has_section(section):
+            continue
+
+        for option, value in sorted(config.items(section)):
+            if option not in FINGERPRINT_IGNORED_OPTIONS:
+                hasher.update(f"{section}.{option}={value}\n".encode())
+
+    return hasher.hexdigest()
+
+class Manifest:
+    """Remembers every input file that was fixed or put in the error dir,
+        along with its size and modification time when it was, so that
+        files that have not changed since can be skipped on later runs or
+        when resuming an interrupted run. It is stored in the output
+        directory, so delete it to fix every file again.
+
+        Files are recorded once they are completely written, and the records
+        are committed to disk periodically as checkpoints. A file named with
+        a random nonce is also recorded, and committed at once, before it is
+        written, so a resumed run finds it under that name rather than
+        writing it again under another"""
+
+    # how many files can be recorded, or how many seconds can pass, before
+    # the records are committed to disk
+    commit_every_files = 100
+    commit_every_seconds = 5
+
+    def __init__(self, output_path: str, fingerprint: str):
+        self.path = os.path.join(output_path, MANIFEST_FILE_NAME)
+        self.fingerprint = fingerprint
+        self.uncommitted = 0
+        self.last_commit_time = time.monotonic()
+
+        # the manifest is checked and recorded to from different pipeline
+        # threads, so access to the connection is serialized
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(self.path, check_same_thread=False)
+
+        # a write ahead log makes the frequent commits cheap, while still
+        # never losing a commit that finished if the run is interrupted
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.execute("""
+            CREATE TABLE IF NOT EXISTS files (
+                input_file_name TEXT PRIMARY KEY,
+                size INTEGER NOT NULL,
+                mtime_ns INTEGER NOT NULL,
+                config_fingerprint TEXT NOT NULL,
+                status TEXT NOT NULL,
+                output_file_name TEXT,
+                name_key TEXT
+            )
+        """)
+        self.connection.commit()
+
+    def get_unchanged(self, input_file_name: str, stat: os.stat_result):
+        """Returns the status, output file name and name key the file was
+            recorded with if it has not changed since and its output is still
+            there, otherwise None, so a deleted output is written again. An
+            output is only ever there once it is completely written, so one
+            recorded before it was written counts too"""
+        with self.lock:
+            row = self.connection.execute(
+                "SELECT size, mtime_ns, config_fingerprint, status, "
+                "output_file_name, name_key FROM files WHERE input_file_name = ?",
+                (os.path.abspath(input_file_name),),
+            ).fetchone()
+
+        if not row:
+            return None
+
+        size, mtime_ns, fingerprint, status, output_file_name, name_key = row
+        if size != stat.st_size or mtime_ns != stat.st_mtime_ns \
+                or fingerprint != self.fingerprint:
+            return None
+
+        if not os.path.exists(output_file_name):
+            return None
+
+        return status, output_file_name, name_key
+
+    def record(
+            self,
+            input_file_name: str,
+            stat: os.stat_result,
+            status: str,
+            output_file_name: str,
+            name_key: str | None,
+    ):
+        with self.lock:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (
+                    os.path.abspath(input_file_name),
+                    stat.st_size,
+                    stat.st_mtime_ns,
+                    self.fingerprint,
+                    status,
+                    output_file_name,
+                    name_key,
+                ),
+            )
+            self.uncommitted += 1
+
+            if self.uncommitted >= self.commit_every_files \
+                    or time.monotonic() - self.last_commit_time >= self.commit_every_seconds:
+                self.connection.commit()
+                self.uncommitted = 0
+                self.last_commit_time = time.monotonic()
+
+    def record_writing(
+            self,
+            input_file_name: str,
+            stat: os.stat_result,
+            output_file_name: str,
+            name_key: str,
+    ):
+        """Records the name a file is about to be written under, committing
+            it before the file is written"""
+        with self.lock:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (
+                    os.path.abspath(input_file_name),
+                    stat.st_size,
+                    stat.st_mtime_ns,
+                    self.fingerprint,
+                    "writing",
+                    output_file_name,
+                    name_key,
+                ),
+            )
+            self.connection.commit()
+            self.uncommitted = 0
+            self.last_commit_time = time.monotonic()
+
+    def record_moves(self, moved_files: list):
+        """Records where outputs were moved to by deduplication, given as
+            (from, to) pairs, so they are not written again"""
+        moved = {
+            os.path.normpath(os.path.abspath(from_path)): to_path
+            for from_path, to_path in moved_files
+        }
+        if not moved:
+            return
+
+        with self.lock:
+            rows = self.connection.execute(
+                "SELECT input_file_name, output_file_name FROM files").fetchall()
+
+            updates = []
+            for input_file_name, output_file_name in rows:
+                if not output_file_name:
+                    continue
+
+                to_path = moved.get(os.path.normpath(os.path.abspath(output_file_name)))
+                if to_path:
+                    updates.append((to_path, input_file_name))
+
+            self.connection.executemany(
+                "UPDATE files SET output_file_name = ? WHERE input_file_name = ?",
+                updates,
+            )
+            self.connection.commit()
+
+    def close(self):
+        with self.lock:
+            self.connection.commit()
+            self.connection.close()
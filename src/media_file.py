@@ -0,0 +1,170 @@
+import os
+import hashlib
+from .lazy_imports import Image, exif, magic
+
+# how much of the start of a file is read into the shared buffer at first.
+# Enough for the MIME type and the EXIF of nearly every photo
+HEADER_SIZE = 64 * 1024
+
+# how much of the rest of the file is read at once when all of it is needed
+READ_SIZE = 1024 * 1024
+
+class MediaFile:
+    """A file that is opened once for everything that reads it in a job.
+        The start of it is read into a buffer the first time anything
+        needs it, and MIME sniffing, metadata parsing and hashing are served
+        from that buffer, only reading past it when they have to. Nothing is
+        opened until it is used. Use it in a with statement so the file is
+        closed"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.file = None
+        self.__buffer = b""
+        self.__read_to_end = False
+        self.__contents = None
+        self.__exif_image = None
+        self.__image = None
+        self.__image_error = None
+        self.__mime_type = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.close()
+
+    def close(self):
+        if self.__image is not None:
+            self.__image.close()
+            self.__image = None
+
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+    def open(self):
+        """The open file, to be read from anywhere as long as it is seeked
+            to where reading starts first"""
+        if self.file is None:
+            self.file = open(self.path, "rb")
+        return self.file
+
+    def head(self, size: int) -> bytes:
+        """At least the first size bytes of the file, or all of it if it is
+            smaller, only reading the part that was not read before"""
+        if len(self.__buffer) < size and not self.__read_to_end:
+            file = self.open()
+            file.seek(len(self.__buffer))
+
+            wanted = size - len(self.__buffer)
+            data = file.read(wanted)
+            self.__buffer += data
+            self.__read_to_end = len(data) < wanted
+
+        return self.__buffer
+
+    @property
+    def header(self) -> bytes:
+        return self.head(HEADER_SIZE)
+
+    @property
+    def is_complete(self) -> bool:
+        """Whether the whole file is in the header"""
+        return len(self.header) < HEADER_SIZE or self.__read_to_end
+
+    def read(self) -> bytes:
+        """The whole file, reading only what is past the header"""
+        if self.__contents is None:
+            if self.is_complete:
+                self.__contents = self.header
+            else:
+                file = self.open()
+                file.seek(len(self.header))
+                self.__contents = self.header + file.read()
+        return self.__contents
+
+    def exif_image(self):
+        """The file parsed by the exif package, which reads the EXIF from the
+            first APP1 segment it finds anywhere in the bytes it is given.
+            When the header holds a whole APP1 segment it is the same one
+            it would find in the whole file, so the rest is not read"""
+        if self.__exif_image is None:
+            if not self.is_complete:
+                try:
+                    exif_image = exif.Image(self.header)
+                    if exif_image.has_exif:
+                        self.__exif_image = exif_image
+                except Exception:
+                    pass
+
+            if self.__exif_image is None:
+                self.__exif_image = exif.Image(self.read())
+
+        return self.__exif_image
+
+    def image(self):
+        """The file opened by Pillow, only reading what Pillow needs of it.
+            Raises the same error each time if Pillow can not open it"""
+        if self.__image_error is not None:
+            raise self.__image_error
+
+        if self.__image is None:
+            file = self.open()
+            file.seek(0)
+
+            try:
+                self.__image = Image.open(file)
+            except Exception as e:
+                self.__image_error = e
+                raise
+
+        return self.__image
+
+    def mime_type(self) -> str | None:
+        """The file's MIME type sniffed from the header, or None if it could
+            not be found"""
+        if self.__mime_type is None:
+            try:
+                # libmagic tells empty files and links apart by the file
+                # itself rather than by its contents
+                if not self.header or os.path.islink(self.path):
+                    self.__mime_type = magic.from_file(self.path, mime=True)
+                else:
+                    self.__mime_type = magic.from_buffer(self.header, mime=True)
+            except Exception:
+                return None
+
+        return self.__mime_type
+
+    def partial_hash(self) -> str:
+        """A hash of the file's size and header. Files with different partial
+            hashes can not have the same contents, and small files that fit
+            in the header get the same hash as file_hash would give them"""
+        if self.is_complete:
+            return self.file_hash()
+
+        # more than the header may have been read, which other files of the
+        # same contents might not have
+        hasher = hashlib.sha256()
+        hasher.update(str(os.fstat(self.open().fileno()).st_size).encode())
+        hasher.update(self.header[:HEADER_SIZE])
+        return hasher.hexdigest()
+
+    def file_hash(self) -> str:
+        """A hash of the whole file's contents, reading it in chunks after
+            the header"""
+        hasher = hashlib.sha256()
+        hasher.update(self.header)
+
+        if not self.is_complete:
+            file = self.open()
+            file.seek(len(self.header))
+
+            while True:
+                data = file.read(READ_SIZE)
+                if not data:
+                    break
+                hasher.update(data)
+
+        return hasher.hexdigest()
@@ -0,0 +1,180 @@
+import sys
+import tracemalloc
+from .log import Logger
+from . import metrics
+
+try:
+    import resource
+except ImportError:
+    # not available on Windows, where the RSS is not reported
+    resource = None
+
+# frames kept for each allocation, each one more makes every allocation
+# and snapshot slower while tracing
+TRACEBACK_FRAMES = 1
+
+# allocation sites listed at each snapshot and in the final report
+TOP_SITES = 10
+
+def get_rss() -> int | None:
+    """The resident set size of this process in bytes, or None where it can
+        not be found"""
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+
+    if not resource:
+        return None
+
+    # the peak rather than the current size, but the best there is elsewhere
+    return __get_max_rss()
+
+def get_peak_rss() -> int | None:
+    if not resource:
+        return None
+
+    # the peak is only updated by the kernel every so often, so it can lag
+    # behind the current size
+    return max(__get_max_rss(), get_rss())
+
+def __get_max_rss() -> int:
+    # ru_maxrss is in bytes on macOS and in KiB on Linux and the BSDs
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return max_rss if sys.platform == "darwin" else max_rss * 1024
+
+def format_mb(size: int | None) -> str:
+    if size is None:
+        return "unknown"
+    return f"{size / 1e6:.1f} MB"
+
+def format_size(size: int) -> str:
+    """The size in MB, or in KB when it is under a MB so small changes do
+        not all show as 0.0 MB"""
+    if abs(size) < 1e6:
+        return f"{size / 1e3:.1f} KB"
+    return format_mb(size)
+
+class MemoryTracker:
+    """Takes tracemalloc snapshots every snapshot_every files and at each
+        phase of the run, logging the RSS, how it grew and the allocation
+        sites that grew the most since the last snapshot. Only memory
+        allocated by Python in this process is traced, not by the worker
+        processes or by C libraries like OpenCV"""
+
+    def __init__(self, logger: Logger, snapshot_every: int = 1000):
+        self.logger = logger
+        self.snapshot_every = snapshot_every
+        self.files = 0
+
+        self.first_snapshot = None
+        self.last_snapshot = None
+        self.start_rss = 0
+        self.last_rss = 0
+        self.points = []
+
+    def start(self):
+        tracemalloc.start(TRACEBACK_FRAMES)
+        self.start_rss = self.last_rss = get_rss()
+        self.first_snapshot = self.last_snapshot = self.__take_snapshot()
+
+    def file_done(self, sizes: dict | None = None):
+        self.files += 1
+
+        if self.snapshot_every and self.files % self.snapshot_every == 0:
+            self.snapshot(f"{self.files} files", sizes)
+
+    def snapshot(self, label: str, sizes: dict | None = None):
+        """Logs how memory grew since the last snapshot. The sizes are the
+            lengths of structures that could keep growing, to tell which
+            one is behind the growth"""
+        snapshot = self.__take_snapshot()
+        rss = get_rss()
+        traced, traced_peak = tracemalloc.get_traced_memory()
+
+        self.points.append({
+            "label": label,
+            "files": self.files,
+            "rss": rss,
+            "traced": traced,
+            "traced_peak": traced_peak,
+            "sizes": dict(sizes or {}),
+        })
+
+        growth = None if rss is None or self.last_rss is None \
+            else rss - self.last_rss
+        self.logger.log_timestamped(
+            f"Memory at {label}: RSS {format_mb(rss)} "
+            f"({format_mb(growth)} since the last snapshot), "
+            f"traced {format_mb(traced)}, traced peak {format_mb(traced_peak)}"
+        )
+        for name, size in (sizes or {}).items():
+            self.logger.log(f"    {name}: {size}")
+        for line in self.__top_sites(snapshot, self.last_snapshot):
+            self.logger.log("    " + line)
+
+        self.last_snapshot = snapshot
+        self.last_rss = rss
+
+    def stop(self, report_path: str):
+        """Writes the final memory report and stops tracing"""
+        snapshot = self.__take_snapshot()
+        tracemalloc.stop()
+
+        with open(report_path, "w") as f:
+            print(f"Start RSS: {format_mb(self.start_rss)}", file=f)
+            print(f"End RSS:   {format_mb(get_rss())}", file=f)
+            print(f"Peak RSS:  {format_mb(get_peak_rss())}", file=f)
+            print(file=f)
+
+            print(f"{'snapshot':<30} {'files':>8} {'RSS':>12} {'traced':>12} {'traced peak':>12}", file=f)
+            for point in self.points:
+                print(
+                    f"{point['label']:<30} {point['files']:>8} {format_mb(point['rss']):>12} "
+                    f"{format_mb(point['traced']):>12} {format_mb(point['traced_peak']):>12}",
+                    file=f,
+                )
+                for name, size in point["sizes"].items():
+                    print(f"    {name}: {size}", file=f)
+            print(file=f)
+
+            print("Allocation sites that grew the most over the run:", file=f)
+            for line in self.__top_sites(snapshot, self.first_snapshot):
+                print(line, file=f)
+            print(file=f)
+
+            print("Largest allocation sites at the end of the run:", file=f)
+            for stat in snapshot.statistics("traceback")[:TOP_SITES]:
+                print(f"{format_size(stat.size)} in {stat.count} blocks", file=f)
+                for line in stat.traceback.format():
+                    print("    " + line, file=f)
+
+    def __take_snapshot(self) -> tracemalloc.Snapshot:
+        # the tracing of tracemalloc itself is left out, along with the
+        # snapshots and metrics kept while tracing
+        return tracemalloc.take_snapshot().filter_traces([
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+            tracemalloc.Filter(False, __file__),
+            tracemalloc.Filter(False, metrics.__file__),
+        ])
+
+    def __top_sites(self, snapshot, previous_snapshot) -> list:
+        lines = []
+
+        grown = [
+            stat for stat in snapshot.compare_to(previous_snapshot, "lineno")
+            if stat.size_diff > 0
+        ]
+
+        for stat in grown[:TOP_SITES]:
+            frame = stat.traceback[0]
+            lines.append(
+                f"+{format_size(stat.size_diff)} ({format_size(stat.size)} total) "
+                f"{frame.filename}:{frame.lineno}"
+            )
+
+        return lines
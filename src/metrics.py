@@ -0,0 +1,287 @@
+import os
+import json
+import time
+import threading
+import functools
+from contextlib import contextmanager
+from .options import Options
+from . import tracing
+
+PROMETHEUS_PREFIX = "camera_roll_"
+
+# upper bounds of the latency histogram buckets, in seconds
+BUCKETS = [0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30]
+
+DESCRIPTIONS = {
+    "files_total": "Files fixed, by status and where their date came from",
+    "file_seconds": "Time spent on each file in all stages, by where its date came from",
+    "stage_seconds": "Time spent on each file in each pipeline stage",
+    "date_source_seconds": "Time spent trying each date source, whether it found a date or not",
+    "operation_seconds": "Time spent in expensive operations like reading metadata, "
+        "running ffprobe and writing files",
+    "file_name_parser_seconds": "Time spent parsing a date from each file name, by whether "
+        "the digit run fast path, the formats remembered for its shape (a shape cache hit) "
+        "or every format (a miss) handled it",
+}
+
+class Histogram:
+    def __init__(self):
+        self.bucket_counts = [0] * len(BUCKETS)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        self.count += 1
+        self.sum += value
+
+        for i, bound in enumerate(BUCKETS):
+            if value <= bound:
+                self.bucket_counts[i] += 1
+                break
+
+    def cumulative_buckets(self):
+        """Yields each bucket's upper bound with the number of values at or
+            below it, ending with +Inf like Prometheus expects"""
+        total = 0
+        for bound, count in zip(BUCKETS, self.bucket_counts):
+            total += count
+            yield str(bound), total
+        yield "+Inf", self.count
+
+class Metrics:
+    """Counters and latency histograms, each kept per set of labels. Safe to
+        update from any thread"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.clear()
+
+    def clear(self):
+        with self.lock:
+            self.start_time = time.time()
+            self.counters = {}
+            self.histograms = {}
+
+    def increment(self, name: str, amount: float = 1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + amount
+
+    def observe(self, name: str, seconds: float, **labels):
+        key = (name, tuple(sorted(labels.items())))
+
+        with self.lock:
+            if key not in self.histograms:
+                self.histograms[key] = Histogram()
+            self.histograms[key].observe(seconds)
+
+    def to_json(self) -> dict:
+        with self.lock:
+            counters = {}
+            for (name, labels), value in sorted(self.counters.items()):
+                counters.setdefault(name, []).append({
+                    "labels": dict(labels),
+                    "value": value,
+                })
+
+            histograms = {}
+            for (name, labels), histogram in sorted(self.histograms.items()):
+                histograms.setdefault(name, []).append({
+                    "labels": dict(labels),
+                    "count": histogram.count,
+                    "sum": histogram.sum,
+                    "buckets": dict(histogram.cumulative_buckets()),
+                })
+
+            return {
+                "elapsed_seconds": time.time() - self.start_time,
+                "counters": counters,
+                "histograms": histograms,
+            }
+
+    def to_prometheus(self) -> str:
+        """The metrics in the Prometheus text format, for node exporter's
+            textfile collector"""
+        lines = []
+
+        with self.lock:
+            counter_names = sorted({name for name, _ in self.counters})
+            for name in counter_names:
+                metric_name = PROMETHEUS_PREFIX + name
+                lines.append(f"# HELP {metric_name} {DESCRIPTIONS.get(name, name)}")
+                lines.append(f"# TYPE {metric_name} counter")
+
+                for (key_name, labels), value in sorted(self.counters.items()):
+                    if key_name == name:
+                        lines.append(f"{metric_name}{format_labels(labels)} {value}")
+
+            histogram_names = sorted({name for name, _ in self.histograms})
+            for name in histogram_names:
+                metric_name = PROMETHEUS_PREFIX + name
+                lines.append(f"# HELP {metric_name} {DESCRIPTIONS.get(name, name)}")
+                lines.append(f"# TYPE {metric_name} histogram")
+
+                for (key_name, labels), histogram in sorted(self.histograms.items()):
+                    if key_name != name:
+                        continue
+
+                    for bound, count in histogram.cumulative_buckets():
+                        bucket_labels = format_labels(labels + (("le", bound),))
+                        lines.append(f"{metric_name}_bucket{bucket_labels} {count}")
+                    lines.append(f"{metric_name}_sum{format_labels(labels)} {histogram.sum}")
+                    lines.append(f"{metric_name}_count{format_labels(labels)} {histogram.count}")
+
+        return "\n".join(lines) + "\n"
+
+def format_labels(labels: tuple) -> str:
+    if not labels:
+        return ""
+
+    formatted = []
+    for key, value in labels:
+        value = str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        formatted.append(f'{key}="{value}"')
+
+    return "{" + ",".join(formatted) + "}"
+
+# the metrics of this process. Worker processes send their timings back
+# with their results instead of using their own
+registry = Metrics()
+
+class Span:
+    """A timed block of work, along with the process and thread it ran on
+        for the trace"""
+    def __init__(
+            self,
+            name: str,
+            labels: dict,
+            start_time: float,
+            seconds: float,
+            trace_args: dict | None = None,
+    ):
+        self.name = name
+        self.labels = labels
+        self.start_time = start_time
+        self.seconds = seconds
+        self.trace_args = trace_args or {}
+
+        thread = threading.current_thread()
+        self.pid = os.getpid()
+        self.tid = thread.native_id
+        self.thread_name = thread.name
+
+# timings collected for the job running on this thread, see collect_spans
+_local = threading.local()
+
+def record(span: Span):
+    spans = getattr(_local, "spans", None)
+
+    if spans is not None:
+        spans.append(span)
+    else:
+        add_spans([span])
+
+def add_spans(spans: list, **trace_args):
+    """Adds finished spans to the metrics, and to the trace if tracing.
+        The trace args are added to each span, like the file it was for"""
+    for span in spans:
+        registry.observe(span.name, span.seconds, **span.labels)
+
+        if tracing.active:
+            span.trace_args.update(trace_args)
+            tracing.active.add(span)
+
+@contextmanager
+def span(name: str, trace_args: dict | None = None, **labels):
+    """Times the block, recording it in the histogram with the given name"""
+    start_time = time.time()
+    start_counter = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(Span(
+            name,
+            labels,
+            start_time,
+            time.perf_counter() - start_counter,
+            trace_args,
+        ))
+
+def timed(operation: str):
+    """Decorates a function to record how long each call to it takes as an
+        operation"""
+    def decorator(function):
+        @functools.wraps(function)
+        def timed_function(*args, **kwargs):
+            with span("operation_seconds", operation=operation):
+                return function(*args, **kwargs)
+        return timed_function
+    return decorator
+
+def collect_spans(job, *args):
+    """Runs the job, returning its result along with the timings recorded
+        while it ran, so they can be sent back from a worker process"""
+    _local.spans = []
+
+    try:
+        result = job(*args)
+        return result, _local.spans
+    finally:
+        _local.spans = None
+
+class MetricsWriter:
+    """Writes the metrics to metrics.json and metrics.prom in the metrics
+        path when stopped, and every write_every_seconds while running if
+        set. Files are replaced at once so they are never read half written"""
+    json_filename = "metrics.json"
+    prometheus_filename = "metrics.prom"
+
+    def __init__(self, options: Options):
+        self.metrics_path = options.metrics_path
+        self.write_every_seconds = options.write_every_seconds
+
+        self.stopped = threading.Event()
+        self.thread = None
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.metrics_path)
+
+    def start(self):
+        if not self.enabled:
+            return
+
+        os.makedirs(self.metrics_path, exist_ok=True)
+
+        if self.write_every_seconds > 0:
+            self.thread = threading.Thread(target=self.__write_periodically, daemon=True)
+            self.thread.start()
+
+    def stop(self):
+        if not self.enabled:
+            return
+
+        self.stopped.set()
+        if self.thread:
+            self.thread.join()
+
+        self.write()
+
+    def write(self):
+        self.__write_file(
+            self.json_filename, json.dumps(registry.to_json(), indent=4) + "\n")
+        self.__write_file(self.prometheus_filename, registry.to_prometheus())
+
+    def __write_file(self, filename: str, text: str):
+        file_path = os.path.join(self.metrics_path, filename)
+        partial_file_path = file_path + ".partial"
+
+        with open(partial_file_path, "w") as f:
+            f.write(text)
+
+        os.replace(partial_file_path, file_path)
+
+    def __write_periodically(self):
+        while not self.stopped.wait(self.write_every_seconds):
+            self.write()
@@ -0,0 +1,174 @@
+import copy
+import pytz
+from datetime import datetime, timedelta
+from configparser import ConfigParser
+from dateutil import parser
+from .manifest import config_fingerprint
+
+# ways files can be put in the output dir, see output_mode in config.ini
+OUTPUT_MODES = ["copy", "hardlink", "reflink", "auto"]
+
+# used when earliest_year is not set
+DEFAULT_EARLIEST_YEAR = 1826
+
+class Options:
+    """The config read once into typed values, so nothing is parsed again
+        for each file. It can not be changed once made, use replace for a
+        copy with some options changed, and it is small enough to send to
+        the worker processes.
+
+        Each option has the same name as in config.ini"""
+
+    def __init__(self, config: ConfigParser):
+        set_option = lambda name, value: object.__setattr__(self, name, value)
+
+        # [structure]
+        set_option("input_path", config.get("structure", "input_path"))
+        set_option("output_path", config.get("structure", "output_path"))
+        set_option("error_path", config.get("structure", "error_path"))
+        set_option("report_path", config.get("structure", "report_path", fallback=""))
+        set_option("output_in_month_subdirs",
+            config.getboolean("structure", "output_in_month_subdirs"))
+        set_option("preserve_directory_structure",
+            config.getboolean("structure", "preserve_directory_structure"))
+        set_option("continuous_reporting",
+            config.getboolean("structure", "continuous_reporting"))
+        set_option("json_report",
+            config.getboolean("structure", "json_report", fallback=False))
+
+        # [parsing]
+        set_option("get_date_from_sidecar_file",
+            config.getboolean("parsing", "get_date_from_sidecar_file"))
+        set_option("get_date_from_file_metadata",
+            config.getboolean("parsing", "get_date_from_file_metadata"))
+        set_option("get_date_from_gphotos_json_file",
+            config.getboolean("parsing", "get_date_from_gphotos_json_file"))
+        set_option("get_date_from_file_name",
+            config.getboolean("parsing", "get_date_from_file_name"))
+        set_option("get_date_from_sys_file_times",
+            config.getboolean("parsing", "get_date_from_sys_file_times"))
+
+        earliest_year = get_year(config, "earliest_year")
+        set_option("earliest_year",
+            DEFAULT_EARLIEST_YEAR if earliest_year is None else earliest_year)
+
+        # the year of the day after tomorrow when not set, in case the photo
+        # was taken in a later timezone
+        latest_year = get_year(config, "latest_year")
+        set_option("latest_year",
+            (datetime.now() + timedelta(days=2)).year if latest_year is None else latest_year)
+
+        set_option("local_timezone",
+            pytz.timezone(config.get("parsing", "local_timezone")))
+
+        manual_file_date_override = config.get(
+            "parsing", "manual_file_date_override", fallback="")
+        set_option("manual_file_date_override",
+            parser.isoparse(manual_file_date_override) if manual_file_date_override else None)
+
+        # [output]
+        set_option("rename_files", config.getboolean("output", "rename_files"))
+        set_option("preserve_original_file_name",
+            config.getboolean("output", "preserve_original_file_name"))
+        set_option("expand_file_types_in_name",
+            config.getboolean("output", "expand_file_types_in_name"))
+        set_option("override_png_metadata",
+            config.getboolean("output", "override_png_metadata"))
+        set_option("write_sidecar_for_unsupported_types",
+            config.getboolean("output", "write_sidecar_for_unsupported_types"))
+
+        output_mode = config.get("output", "output_mode", fallback="copy").strip()
+        if output_mode not in OUTPUT_MODES:
+            raise ValueError(
+                f"output_mode must be one of {', '.join(OUTPUT_MODES)}, not {output_mode}")
+        set_option("output_mode", output_mode)
+
+        # [deduplication]
+        set_option("search_for_duplicate_files",
+            config.getboolean("deduplication", "search_for_duplicate_files"))
+        set_option("move_duplicate_files",
+            config.getboolean("deduplication", "move_duplicate_files"))
+        set_option("duplicate_path", config.get("deduplication", "duplicate_path"))
+        set_option("preferred_keyword_in_dups",
+            config.get("deduplication", "preferred_keyword_in_dups"))
+        set_option("unpreferred_keyword_in_dups",
+            config.get("deduplication", "unpreferred_keyword_in_dups"))
+        set_option("heavy_duplicate_file_checking",
+            config.getboolean("deduplication", "heavy_duplicate_file_checking"))
+        set_option("only_dedup", config.getboolean("deduplication", "only_dedup"))
+
+        # [performance]
+        workers = config.get("performance", "workers", fallback="1").strip().lower()
+
+        # the workers are picked by a preflight when auto
+        set_option("auto_workers", workers == "auto")
+        set_option("workers", 1 if workers == "auto" else int(workers))
+
+        # each stage works on as many files at once as there are workers
+        # when not set, so every worker can be kept busy
+        set_option("metadata_concurrency",
+            get_concurrency(config, "metadata_concurrency", self.workers))
+        set_option("date_concurrency",
+            get_concurrency(config, "date_concurrency", self.workers))
+        set_option("write_concurrency",
+            get_concurrency(config, "write_concurrency", self.workers))
+        set_option("queue_size", config.getint("performance", "queue_size", fallback=64))
+        set_option("skip_unchanged_files",
+            config.getboolean("performance", "skip_unchanged_files", fallback=False))
+        set_option("max_bytes_per_sec", get_rate(config, "max_bytes_per_sec"))
+        set_option("max_files_per_sec", get_rate(config, "max_files_per_sec"))
+
+        # [metrics]
+        set_option("metrics_path",
+            config.get("metrics", "metrics_path", fallback="").strip())
+        set_option("write_every_seconds",
+            config.getfloat("metrics", "write_every_seconds", fallback=0))
+        set_option("progress_every_seconds",
+            config.getfloat("metrics", "progress_every_seconds", fallback=0))
+
+        # tells whether files fixed with other options would come out the same
+        set_option("fingerprint", config_fingerprint(config))
+
+    def __setattr__(self, name: str, value):
+        raise AttributeError("options can not be changed, use replace")
+
+    def __delattr__(self, name: str):
+        raise AttributeError("options can not be changed, use replace")
+
+    def replace(self, **changes):
+        """A copy of the options with the given ones changed"""
+        options = copy.copy(self)
+
+        for name, value in changes.items():
+            if not hasattr(self, name):
+                raise AttributeError(f"there is no option named {name}")
+            object.__setattr__(options, name, value)
+
+        return options
+
+def read_options(config_path: str) -> Options:
+    config = ConfigParser()
+    config.read(config_path)
+    return Options(config)
+
+def get_year(config: ConfigParser, option: str) -> int | None:
+    try:
+        return int(config.get("parsing", option))
+    except ValueError:
+        return None
+
+def get_concurrency(config: ConfigParser, option: str, workers: int) -> int:
+    concurrency = config.get("performance", option, fallback="").strip()
+
+    if not concurrency:
+        return workers
+
+    return int(concurrency)
+
+def get_rate(config: ConfigParser, option: str) -> float | None:
+    rate = config.get("performance", option, fallback="").strip()
+
+    if not rate:
+        return None
+
+    return float(rate)
@@ -0,0 +1,164 @@
+import queue
+import threading
+from typing import Callable, Iterable, Iterator
+
+# put on a queue after the last item so the threads reading it know to stop
+_DONE = object()
+
+class _Failure:
+    """Wraps an error raised by a stage so it can be passed along to the
+        consumer and raised there, in order, instead of killing a thread"""
+    def __init__(self, error: BaseException):
+        self.error = error
+
+class Stage:
+    def __init__(
+            self,
+            name: str,
+            handler: Callable,
+            concurrency: int = 1,
+            ordered: bool = False,
+    ):
+        self.name = name
+        self.handler = handler
+        self.concurrency = max(concurrency, 1)
+
+        # an ordered stage handles items one at a time in the order the
+        # source yielded them, eg. for generating names with a counter
+        self.ordered = ordered
+        if ordered:
+            self.concurrency = 1
+
+class Pipeline:
+    """Passes items from a source through a series of stages. Each stage
+        runs in its own threads and is connected to the next by a bounded
+        queue, so a slow stage makes the stages before it wait instead of
+        letting items pile up. No more than max_in_flight items are between
+        the source and the consumer at once, which keeps memory use flat
+        no matter how many items the source yields"""
+
+    def __init__(self, stages: list, max_in_flight: int = 64):
+        self.stages = stages
+        self.max_in_flight = max(max_in_flight, 1)
+        self.queues = []
+
+    def queue_depths(self) -> dict:
+        """The number of items waiting to be picked up by each stage"""
+        return {
+            stage.name: q.qsize() for stage, q in zip(self.stages, self.queues)
+        }
+
+    def run(self, source: Iterable) -> Iterator:
+        """Yields the items from the source, after every stage handled
+            them, in the order the source yielded them"""
+        in_flight = threading.Semaphore(self.max_in_flight)
+        stopped = threading.Event()
+        self.queues = [
+            queue.Queue(maxsize=self.max_in_flight)
+            for _ in range(len(self.stages) + 1)
+        ]
+
+        threads = [threading.Thread(
+            target=self.__feed,
+            args=(source, self.queues[0], in_flight, stopped),
+            name="feed",
+            daemon=True,
+        )]
+
+        for i, stage in enumerate(self.stages):
+            in_queue, out_queue = self.queues[i], self.queues[i + 1]
+            remaining = [stage.concurrency]
+            lock = threading.Lock()
+
+            for thread_number in range(stage.concurrency):
+                threads.append(threading.Thread(
+                    target=self.__work,
+                    args=(stage, in_queue, out_queue, remaining, lock),
+                    name=f"{stage.name} {thread_number}",
+                    daemon=True,
+                ))
+
+        for thread in threads:
+            thread.start()
+
+        results = _in_order(self.queues[-1])
+        try:
+            for _, item in results:
+                in_flight.release()
+
+                if isinstance(item, _Failure):
+                    raise item.error
+
+                yield item
+        finally:
+            # when the consumer stops early, the source stops being read
+            # and the items already in flight are finished and dropped, so
+            # no threads are left waiting
+            stopped.set()
+            in_flight.release()
+            for _ in results:
+                in_flight.release()
+
+    def __feed(self, source: Iterable, out_queue: queue.Queue, in_flight, stopped):
+        seq = 0
+        try:
+            for item in source:
+                in_flight.acquire()
+                if stopped.is_set():
+                    break
+                out_queue.put((seq, item))
+                seq += 1
+        except BaseException as e:
+            in_flight.acquire()
+            out_queue.put((seq, _Failure(e)))
+
+        out_queue.put(_DONE)
+
+    def __work(self, stage: Stage, in_queue, out_queue, remaining, lock):
+        items = _in_order(in_queue) if stage.ordered \
+            else iter(lambda: _get_unless_done(in_queue), _DONE)
+
+        for seq, item in items:
+            if not isinstance(item, _Failure):
+                try:
+                    item = stage.handler(item)
+                except BaseException as e:
+                    item = _Failure(e)
+
+            out_queue.put((seq, item))
+
+        # the last thread of a stage to finish tells the next stage
+        with lock:
+            remaining[0] -= 1
+            if remaining[0] == 0:
+                out_queue.put(_DONE)
+
+def _get_unless_done(in_queue: queue.Queue):
+    entry = in_queue.get()
+
+    # leave the marker for the other threads reading this queue
+    if entry is _DONE:
+        in_queue.put(_DONE)
+
+    return entry
+
+def _in_order(in_queue: queue.Queue) -> Iterator:
+    """Reads (seq, item) pairs from a queue that may be out of order and
+        yields them in order"""
+    waiting = {}
+    next_seq = 0
+
+    while True:
+        entry = in_queue.get()
+        if entry is _DONE:
+            break
+
+        seq, item = entry
+        waiting[seq] = item
+
+        while next_seq in waiting:
+            yield next_seq, waiting.pop(next_seq)
+            next_seq += 1
+
+    for seq in sorted(waiting):
+        yield seq, waiting[seq]
@@ -0,0 +1,67 @@
+import os
+import json
+from .file_fixer import FixedFile
+from .options import Options
+
+PLAN_VERSION = 1
+
+class PlanWriter:
+    """Writes a plan as JSON lines: a header, then one line for each file
+        with everything needed to write it without reading it again"""
+
+    def __init__(self, plan_path: str, options: Options):
+        self.options = options
+        self.file = open(plan_path, "w")
+
+        self.__write_line({
+            "plan": PLAN_VERSION,
+            "config_fingerprint": options.fingerprint,
+        })
+
+    def write(self, fixed_file: FixedFile):
+        self.__write_line(fixed_file.to_plan(self.options))
+
+    def close(self):
+        self.file.close()
+
+    def __write_line(self, entry: dict):
+        print(json.dumps(entry, separators=(",", ":")), file=self.file)
+
+def read_header(plan_path: str) -> dict:
+    with open(plan_path) as f:
+        header = json.loads(f.readline())
+
+    if header.get("plan") != PLAN_VERSION:
+        raise ValueError(f"{plan_path} is not a version {PLAN_VERSION} plan")
+
+    return header
+
+def read_entries(plan_path: str):
+    with open(plan_path) as f:
+        # skip the header
+        f.readline()
+
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+def read_planned_files(plan_path: str, options: Options):
+    for entry in read_entries(plan_path):
+        yield FixedFile.from_plan(entry, options.input_path, options)
+
+def count_entries(plan_path: str) -> int:
+    """The number of files in the plan"""
+    return sum(1 for _ in read_entries(plan_path))
+
+def create_directories(plan_path: str) -> int:
+    """Creates every directory the plan writes to at once, so they do not
+        need to be checked for while writing each file"""
+    dir_paths = set()
+
+    for entry in read_entries(plan_path):
+        dir_paths.add(os.path.dirname(entry["output"]))
+
+    for dir_path in sorted(dir_paths):
+        os.makedirs(dir_path, exist_ok=True)
+
+    return len(dir_paths)
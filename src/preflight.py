@@ -0,0 +1,367 @@
+import os
+import time
+import random
+import tempfile
+import collections
+from .determine_date import read_file_date, resolve_date
+from .media_file import MediaFile
+from .scanner import Scanner
+from .options import Options
+from .progress import format_duration
+from .log import CaptureLogger
+from . import fixer_util
+from . import metrics
+
+# files of each media type that are sampled
+SAMPLE_SIZE = 8
+
+# at most this many files are looked at before the run starts, and the
+# counts and sizes of the rest are scaled up from them
+PREWALK_FILES = 5000
+
+# only this much of a larger file is copied, and the time it takes is
+# scaled up to the file's size
+COPY_SAMPLE_BYTES = 64 * 1024 * 1024
+
+# files larger than this on average are copied at most two at a time, since
+# large sequential copies only slow each other down when run together
+LARGE_FILE_BYTES = 100 * 1024 * 1024
+
+# runs predicted to take less than this many seconds in one process are not
+# worth starting worker processes for
+MIN_SECONDS_FOR_WORKERS = 10
+
+class TypeCost:
+    """The files of one media type found in the input, and how long the
+        sampled ones took to read, date and copy"""
+
+    def __init__(self, media_type: str):
+        self.media_type = media_type
+        self.files = 0
+        self.bytes = 0
+        self.samples = []
+
+        self.sampled = 0
+        self.read_seconds = 0
+        self.ffprobe_seconds = 0
+        self.date_seconds = 0
+        self.copy_seconds = 0
+        self.copied_bytes = 0
+
+    def per_file(self, seconds: float) -> float:
+        return seconds / self.sampled if self.sampled else 0
+
+    @property
+    def total_read_seconds(self) -> float:
+        return self.files * self.per_file(self.read_seconds)
+
+    @property
+    def total_ffprobe_seconds(self) -> float:
+        return self.files * self.per_file(self.ffprobe_seconds)
+
+    @property
+    def total_date_seconds(self) -> float:
+        return self.files * self.per_file(self.date_seconds)
+
+    @property
+    def total_copy_seconds(self) -> float:
+        if not self.copied_bytes:
+            return self.files * self.per_file(self.copy_seconds)
+        return self.bytes * self.copy_seconds / self.copied_bytes
+
+class Preflight:
+    """Samples the input before a run to predict how long it will take and
+        to pick the number of workers and the concurrency of each stage.
+
+        The input is listed, and the first files found, up to PREWALK_FILES,
+        are classified as an image, video, audio or unknown file by their
+        extension, with the counts and sizes of the rest scaled up from
+        them. A few files of each type are read, dated and copied next to
+        the output dir the way a run would, timing each step. Reading
+        metadata with Python and working out the date take CPU, so they are
+        spread over up to one worker per CPU.
+        ffprobe runs in its own process, so a worker mostly waits on it and
+        more workers than CPUs pay off when videos take most of the time.
+        Copies are limited by the disk.
+
+        The files looked at are kept, so a run started right after can fix
+        them and carry on with the same walk instead of walking the input
+        again"""
+
+    def __init__(self, options: Options, sample_size: int = SAMPLE_SIZE):
+        self.options = options
+        self.sample_size = sample_size
+        self.input_path = options.input_path
+        self.output_path = options.output_path
+        self.output_mode = options.output_mode
+
+        self.costs = {}
+        self.scan_seconds = 0
+        self.photo_details = {}
+        self.scanner = None
+        self.scanned_files = collections.deque()
+        self.unscanned_files = iter(())
+        self.total_files = 0
+
+        self.workers = 1
+        self.metadata_concurrency = 1
+        self.date_concurrency = 1
+        self.write_concurrency = 1
+
+    def run(self):
+        self.__scan()
+
+        # copies are timed on the disk the output goes to, without creating
+        # the output dir, since the preflight may be all that is run
+        with tempfile.TemporaryDirectory(dir=self.__existing_output_dir()) as copy_dir:
+            for cost in self.costs.values():
+                self.__sample(cost, copy_dir)
+
+        self.__tune()
+        return self
+
+    def take_scanned_files(self):
+        """Yields the files the scan looked at, letting go of each one once
+            it is taken, then the rest of the files, in the order the scan
+            finds them"""
+        while self.scanned_files:
+            yield self.scanned_files.popleft()
+        yield from self.unscanned_files
+
+    @property
+    def files(self) -> int:
+        return self.total_files
+
+    @property
+    def serial_seconds(self) -> float:
+        """The predicted run time in a single process, one file at a time"""
+        return self.scan_seconds + sum(
+            cost.total_read_seconds
+                + cost.total_ffprobe_seconds
+                + cost.total_date_seconds
+                + cost.total_copy_seconds
+            for cost in self.costs.values()
+        )
+
+    @property
+    def predicted_seconds(self) -> float:
+        """The predicted run time with the tuned settings. Files go through
+            the stages at once, so this is about the time of the busiest
+            resource"""
+        cpus = os.cpu_count() or 1
+
+        cpu_seconds = sum(
+            cost.total_read_seconds + cost.total_date_seconds
+            for cost in self.costs.values()
+        ) / min(self.workers, cpus, max(self.metadata_concurrency, self.date_concurrency))
+
+        ffprobe_seconds = sum(
+            cost.total_ffprobe_seconds for cost in self.costs.values()
+        ) / min(self.workers, self.metadata_concurrency)
+
+        copy_seconds = sum(
+            cost.total_copy_seconds for cost in self.costs.values()
+        ) / (1 if self.__has_large_files() else self.write_concurrency)
+
+        # copies can not go faster than the configured rate limits
+        max_bytes_per_sec = self.options.max_bytes_per_sec
+        if max_bytes_per_sec:
+            copy_seconds = max(
+                copy_seconds,
+                sum(cost.bytes for cost in self.costs.values()) / max_bytes_per_sec,
+            )
+        max_files_per_sec = self.options.max_files_per_sec
+        if max_files_per_sec:
+            copy_seconds = max(copy_seconds, self.files / max_files_per_sec)
+
+        return self.scan_seconds + max(cpu_seconds, ffprobe_seconds, copy_seconds)
+
+    def apply(self, options: Options) -> Options:
+        """The options with the tuned worker count and concurrencies"""
+        return options.replace(
+            auto_workers=False,
+            workers=self.workers,
+            metadata_concurrency=self.metadata_concurrency,
+            date_concurrency=self.date_concurrency,
+            write_concurrency=self.write_concurrency,
+        )
+
+    def log(self, logger):
+        logger.log_timestamped(
+            f"Preflight found {self.files} files to fix "
+            f"in {self.scan_seconds:.1f}s")
+
+        for cost in self.costs.values():
+            if not cost.files:
+                continue
+
+            line = f"    {cost.media_type}: {cost.files} files, " \
+                f"{cost.bytes / 1e6:.1f} MB, sampled {cost.sampled}, per file " \
+                f"read {cost.per_file(cost.read_seconds) * 1000:.1f} ms, "
+            if cost.ffprobe_seconds:
+                line += f"ffprobe {cost.per_file(cost.ffprobe_seconds) * 1000:.1f} ms, "
+            line += f"date {cost.per_file(cost.date_seconds) * 1000:.1f} ms, " \
+                f"copy {cost.per_file(cost.copy_seconds) * 1000:.1f} ms"
+            logger.log(line)
+
+        logger.log(
+            f"    workers = {self.workers}, "
+            f"metadata_concurrency = {self.metadata_concurrency}, "
+            f"date_concurrency = {self.date_concurrency}, "
+            f"write_concurrency = {self.write_concurrency}"
+        )
+        logger.log(
+            f"    predicted run time: {format_duration(self.predicted_seconds)} "
+            f"({format_duration(self.serial_seconds)} one file at a time)"
+        )
+
+    def __scan(self):
+        start_time = time.perf_counter()
+
+        # the same sample is taken from the same input every time
+        rng = random.Random(0)
+        scanner = Scanner(self.input_path)
+        scanned_files = scanner.scan()
+
+        for scanned_file in scanned_files:
+            self.scanned_files.append(scanned_file)
+            self.__count(scanned_file, rng)
+
+            if len(self.scanned_files) >= PREWALK_FILES:
+                break
+
+        # the whole input has been listed by the time the first file is
+        # found, so the total is known
+        self.total_files = scanner.files_found
+        if self.scanned_files:
+            scale = self.total_files / len(self.scanned_files)
+            for cost in self.costs.values():
+                cost.files = round(cost.files * scale)
+                cost.bytes = round(cost.bytes * scale)
+
+        self.scanner = scanner
+        self.unscanned_files = scanned_files
+        self.photo_details = scanner.photo_details
+        self.scan_seconds = time.perf_counter() - start_time
+
+    def __count(self, scanned_file, rng: random.Random):
+        media_type = fixer_util.guess_media_type(scanned_file.path)
+        cost = self.costs.setdefault(media_type, TypeCost(media_type))
+
+        try:
+            size = os.stat(scanned_file.path).st_size
+        except OSError:
+            return
+
+        cost.files += 1
+        cost.bytes += size
+
+        # reservoir sampling keeps an even sample without knowing how many
+        # files there are up front
+        if len(cost.samples) < self.sample_size:
+            cost.samples.append((scanned_file, size))
+        else:
+            i = rng.randrange(cost.files)
+            if i < self.sample_size:
+                cost.samples[i] = (scanned_file, size)
+
+    def __sample(self, cost: TypeCost, copy_dir: str):
+        if not cost.samples:
+            return
+
+        # the first file pays for importing the libraries that read it, so
+        # it is read once before anything is timed
+        self.__read_and_date(cost.samples[0][0])
+
+        for i, (scanned_file, size) in enumerate(cost.samples):
+            start_time = time.perf_counter()
+            (_, spans), date_seconds = self.__read_and_date(scanned_file)
+            read_seconds = time.perf_counter() - start_time - date_seconds
+
+            ffprobe_seconds = sum(
+                span.seconds for span in spans
+                if span.labels.get("operation") == "ffprobe"
+            )
+
+            copy_file_name = os.path.join(copy_dir, str(i))
+            start_time = time.perf_counter()
+            copied_bytes = self.__copy(scanned_file.path, copy_file_name, size)
+            cost.copy_seconds += time.perf_counter() - start_time
+            cost.copied_bytes += copied_bytes
+
+            cost.sampled += 1
+            cost.read_seconds += read_seconds - ffprobe_seconds
+            cost.ffprobe_seconds += ffprobe_seconds
+            cost.date_seconds += date_seconds
+
+    def __read_and_date(self, scanned_file):
+        # read the way the workers do, with the MIME type sniffed from the
+        # same opened file
+        with MediaFile(scanned_file.path) as media_file:
+            read_date = metrics.collect_spans(
+                read_file_date,
+                scanned_file.path,
+                self.options,
+                self.photo_details,
+                scanned_file.sidecar_names,
+                media_file,
+            )
+            mime_type = media_file.mime_type()
+
+        start_time = time.perf_counter()
+        resolve_date(scanned_file.path, self.options, read_date[0])
+        fixer_util.get_file_type(scanned_file.path, CaptureLogger(), mime_type)
+
+        return read_date, time.perf_counter() - start_time
+
+    def __copy(self, input_file_name: str, output_file_name: str, size: int) -> int:
+        """Copies the file the way a run would, or only the start of it if
+            it is large, returning how many bytes were copied"""
+        try:
+            if size <= COPY_SAMPLE_BYTES:
+                fixer_util.copy_file(input_file_name, output_file_name, self.output_mode)
+                return size
+
+            with open(input_file_name, "rb") as src, open(output_file_name, "wb") as dst:
+                copied_bytes = 0
+                while copied_bytes < COPY_SAMPLE_BYTES:
+                    chunk = src.read(1024 * 1024)
+                    if not chunk:
+                        break
+                    dst.write(chunk)
+                    copied_bytes += len(chunk)
+            return copied_bytes
+        except OSError:
+            return 0
+        finally:
+            if os.path.exists(output_file_name):
+                os.remove(output_file_name)
+
+    def __existing_output_dir(self) -> str:
+        """The output dir, or the closest dir above it that exists"""
+        path = os.path.abspath(self.output_path)
+        while not os.path.isdir(path) and os.path.dirname(path) != path:
+            path = os.path.dirname(path)
+        return path
+
+    def __has_large_files(self) -> bool:
+        total_bytes = sum(cost.bytes for cost in self.costs.values())
+        return self.files and total_bytes / self.files > LARGE_FILE_BYTES
+
+    def __tune(self):
+        cpus = os.cpu_count() or 1
+
+        read_seconds = sum(cost.total_read_seconds for cost in self.costs.values())
+        ffprobe_seconds = sum(cost.total_ffprobe_seconds for cost in self.costs.values())
+
+        if self.serial_seconds < MIN_SECONDS_FOR_WORKERS:
+            self.workers = 1
+        elif ffprobe_seconds > read_seconds:
+            # most of a worker's time goes to waiting on ffprobe
+            self.workers = cpus * 2
+        else:
+            self.workers = cpus
+
+        self.metadata_concurrency = self.workers
+        self.date_concurrency = min(self.workers, cpus)
+        self.write_concurrency = 2 if self.__has_large_files() else max(self.workers, 4)
@@ -1,3 +1,5 @@
+import os
+
 __custom_words_to_preserve = [
     "strunk",
     "websize",
@@ -27,23 +29,49 @@ words_to_not_preserve = [
     "image",
 ]
 
-with open('resources/words.txt') as word_file:
-    valid_words = set(word_file.read().split())
+# found next to the code rather than in the working directory, which may
+# have changed by the time the word lists are first used
+WORDS_PATH = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    "resources",
+    "words.txt",
+)
 
-words_to_preserve = [
-    *__custom_words_to_preserve, 
-    *sorted(
-        [w for w in valid_words if len(w) > 2 and not w in words_to_not_preserve], 
-        key=lambda x: len(x),
-        reverse=True
-    )
-]
+# the word lists take a while to build, so they are only built the first
+# time they are used, and only once
+_word_lists = None
+
+def __build_word_lists():
+    with open(WORDS_PATH) as word_file:
+        valid_words = set(word_file.read().split())
 
-larger_words_to_preserve = [
-    *__custom_words_to_preserve, 
-    *sorted(
-        [w for w in valid_words if len(w) > 3 and not w in words_to_not_preserve], 
+    # sorting is stable, so the longer words keep the same order whether
+    # they are sorted on their own or with the shorter ones
+    sorted_words = sorted(
+        [w for w in valid_words if len(w) > 2 and not w in words_to_not_preserve],
         key=lambda x: len(x),
         reverse=True
     )
-]
+
+    return {
+        "valid_words": valid_words,
+        "words_to_preserve": [
+            *__custom_words_to_preserve,
+            *sorted_words,
+        ],
+        "larger_words_to_preserve": [
+            *__custom_words_to_preserve,
+            *[w for w in sorted_words if len(w) > 3],
+        ],
+    }
+
+def __getattr__(name: str):
+    global _word_lists
+
+    if name not in ["valid_words", "words_to_preserve", "larger_words_to_preserve"]:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+    if _word_lists is None:
+        _word_lists = __build_word_lists()
+
+    return _word_lists[name]
@@ -0,0 +1,154 @@
+import io
+import os
+import sys
+import pstats
+import cProfile
+import threading
+import functools
+from contextlib import contextmanager
+
+# how many functions of each scope are listed in the summary
+SUMMARY_FUNCTIONS = 30
+
+class Profiler:
+    """Profiles each scope of a run separately, like scanning or writing, so
+        the time spent in one is not hidden in the others. A scope entered
+        inside another one pauses the outer scope's profile until it ends.
+
+        cProfile only profiles the thread it is enabled on, so each thread
+        gets its own profile for each scope, and they are merged when
+        written.
+
+        From Python 3.12 a profile sees every thread and only one can be
+        enabled at once, so the scopes run one at a time across the threads
+        instead, which makes the run slower but keeps them apart"""
+
+    def __init__(self):
+        self.profiles = {}
+        self.lock = threading.Lock()
+        self.local = threading.local()
+
+        self.exclusive = sys.version_info >= (3, 12)
+        self.scope_lock = threading.RLock()
+
+    def __get_profile(self, name: str) -> cProfile.Profile:
+        key = (name, threading.get_ident())
+
+        with self.lock:
+            if key not in self.profiles:
+                self.profiles[key] = cProfile.Profile()
+            return self.profiles[key]
+
+    @contextmanager
+    def scope(self, name: str):
+        if not self.exclusive:
+            with self.__scope(name):
+                yield
+            return
+
+        # a scope entered inside another one in the same thread already
+        # holds the lock
+        with self.scope_lock, self.__scope(name):
+            yield
+
+    @contextmanager
+    def __scope(self, name: str):
+        stack = getattr(self.local, "stack", None)
+        if stack is None:
+            stack = self.local.stack = []
+
+        if stack:
+            stack[-1].disable()
+
+        profile = self.__get_profile(name)
+        stack.append(profile)
+        profile.enable()
+
+        try:
+            yield
+        finally:
+            profile.disable()
+            stack.pop()
+
+            if stack:
+                stack[-1].enable()
+
+    def write(self, dir_path: str) -> str:
+        """Writes a .pstats file for each scope and a summary of all of them
+            sorted by cumulative time, returning the summary's path"""
+        scope_stats = {}
+
+        with self.lock:
+            for (name, _), profile in self.profiles.items():
+                try:
+                    stats = pstats.Stats(profile)
+                except TypeError:
+                    # the profile never ran a function
+                    continue
+
+                if name in scope_stats:
+                    scope_stats[name].add(stats)
+                else:
+                    scope_stats[name] = stats
+
+        summary = io.StringIO()
+
+        for name, stats in scope_stats.items():
+            file_name = "profile_" + name.replace(" ", "_")
+            stats.dump_stats(os.path.join(dir_path, file_name + ".pstats"))
+
+            print(f"==== {name} ({file_name}.pstats) ====", file=summary)
+            stats.stream = summary
+            stats.sort_stats(pstats.SortKey.CUMULATIVE).print_stats(SUMMARY_FUNCTIONS)
+
+        summary_path = os.path.join(dir_path, "profile.txt")
+        with open(summary_path, "w") as f:
+            f.write(summary.getvalue())
+
+        return summary_path
+
+# the profiler of the run, only set when running with --profile
+active = None
+
+def start():
+    global active
+    active = Profiler()
+
+def stop(dir_path: str) -> str:
+    global active
+    profiler, active = active, None
+    return profiler.write(dir_path)
+
+@contextmanager
+def scope(name: str):
+    """Profiles the block under the named scope if profiling"""
+    if not active:
+        yield
+        return
+
+    with active.scope(name):
+        yield
+
+def profiled(name: str):
+    """Decorates a function to profile it under the named scope"""
+    def decorator(function):
+        @functools.wraps(function)
+        def profiled_function(*args, **kwargs):
+            with scope(name):
+                return function(*args, **kwargs)
+        return profiled_function
+    return decorator
+
+def iterate(name: str, iterable):
+    """Profiles producing each item of the iterable under the named scope,
+        without profiling whatever is done with the items"""
+    iterator = iter(iterable)
+
+    while True:
+        with scope(name):
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+
+        yield item
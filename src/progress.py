@@ -0,0 +1,117 @@
+import sys
+import time
+import threading
+from collections import deque
+
+class ProgressReporter:
+    """Prints how far along the run is every interval seconds from a
+        background thread: files done out of the files found so far,
+        rolling files/sec and MB/sec, an ETA and how many files wait in
+        each pipeline stage's queue. Fixing a file only adds to counters,
+        so the reporter adds no work per file"""
+
+    # seconds of history the rolling rates are worked out over
+    window_seconds = 30
+
+    def __init__(
+            self,
+            scanner,
+            file_fixer,
+            interval: float,
+            stream=sys.stderr,
+            total: int | None = None,
+    ):
+        self.scanner = scanner
+        self.file_fixer = file_fixer
+        self.interval = interval
+        self.stream = stream
+
+        # the number of files when it is known up front, like when applying
+        # a plan, rather than found by scanning
+        self.total = total
+
+        self.files = 0
+        self.bytes = 0
+        self.samples = deque()
+
+        self.stopped = threading.Event()
+        self.thread = None
+
+    def file_done(self, size: int):
+        self.files += 1
+        self.bytes += size
+
+    def start(self):
+        self.start_time = time.monotonic()
+        self.samples.append((self.start_time, 0, 0))
+
+        self.thread = threading.Thread(target=self.__report_periodically, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.stopped.set()
+        if self.thread:
+            self.thread.join()
+            self.report()
+
+    def report(self):
+        now = time.monotonic()
+
+        # skipped files are not fixed but still count towards the total
+        files = self.files + self.file_fixer.skipped_count
+        self.samples.append((now, files, self.bytes))
+        while len(self.samples) > 2 and now - self.samples[0][0] > self.window_seconds:
+            self.samples.popleft()
+
+        first_time, first_files, first_bytes = self.samples[0]
+        elapsed = max(now - first_time, 1e-9)
+        files_per_sec = (files - first_files) / elapsed
+        mb_per_sec = (self.bytes - first_bytes) / 1e6 / elapsed
+
+        # the total is only known once the whole input has been scanned
+        if self.total is not None:
+            total, scanned = self.total, True
+        else:
+            total, scanned = self.scanner.files_found, self.scanner.done
+
+        if scanned:
+            total_text = str(total)
+        elif total:
+            total_text = f"{total}+"
+        else:
+            total_text = "?"
+
+        if files_per_sec > 0 and total > files:
+            eta = format_duration((total - files) / files_per_sec)
+        elif total <= files and scanned:
+            eta = "0s"
+        else:
+            eta = "?"
+
+        line = (
+            f"[{format_duration(now - self.start_time)}] {files}/{total_text} files, "
+            f"{files_per_sec:.1f} files/s, {mb_per_sec:.2f} MB/s, ETA {eta}"
+        )
+
+        pipeline = self.file_fixer.pipeline
+        if pipeline:
+            depths = ", ".join(
+                f"{name} {depth}" for name, depth in pipeline.queue_depths().items())
+            line += f" | queued: {depths}"
+
+        print(line, file=self.stream, flush=True)
+
+    def __report_periodically(self):
+        while not self.stopped.wait(self.interval):
+            self.report()
+
+def format_duration(seconds: float) -> str:
+    seconds = int(seconds)
+    hours, seconds = divmod(seconds, 3600)
+    minutes, seconds = divmod(seconds, 60)
+
+    if hours:
+        return f"{hours}h{minutes:02d}m"
+    if minutes:
+        return f"{minutes}m{seconds:02d}s"
+    return f"{seconds}s"
@@ -0,0 +1,63 @@
+import time
+import threading
+from .options import Options
+
+class TokenBucket:
+    """Lets up to rate tokens through each second on average, with bursts
+        of up to a second's worth. A rate of None lets everything through"""
+
+    def __init__(self, rate: float | None):
+        self.rate = rate
+        self.tokens = rate or 0
+        self.last_refill = time.monotonic()
+
+    def wait_time(self, amount: float) -> float:
+        """Takes the amount of tokens, returning how long to wait before
+            using them"""
+        if not self.rate:
+            return 0
+
+        now = time.monotonic()
+        self.tokens = min(
+            self.rate,
+            self.tokens + (now - self.last_refill) * self.rate,
+        )
+        self.last_refill = now
+
+        # tokens can go negative so a single file larger than the budget
+        # still gets through, it just delays the files after it
+        self.tokens -= amount
+        if self.tokens >= 0:
+            return 0
+
+        return -self.tokens / self.rate
+
+class RateLimiter:
+    """Limits how many files and bytes are written each second across every
+        worker, only waiting once the budget is used up"""
+
+    def __init__(self, max_bytes_per_sec: float | None, max_files_per_sec: float | None):
+        self.bytes = TokenBucket(max_bytes_per_sec)
+        self.files = TokenBucket(max_files_per_sec)
+        self.lock = threading.Lock()
+
+    @classmethod
+    def from_options(cls, options: Options):
+        return cls(options.max_bytes_per_sec, options.max_files_per_sec)
+
+    @property
+    def unlimited(self) -> bool:
+        return not self.bytes.rate and not self.files.rate
+
+    def acquire(self, size: int):
+        if self.unlimited:
+            return
+
+        with self.lock:
+            wait_time = max(
+                self.bytes.wait_time(size),
+                self.files.wait_time(1),
+            )
+
+        if wait_time > 0:
+            time.sleep(wait_time)
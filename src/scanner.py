@@ -0,0 +1,165 @@
+import os
+import csv
+from typing import Iterator
+from . import profiling
+
+class ScannedFile:
+    def __init__(
+            self,
+            path: str,
+            sidecar_names: frozenset,
+            input_path: str | None = None,
+    ):
+        self.path = path
+
+        # the directory the file was found under, when it is not the
+        # configured input path
+        self.input_path = input_path
+
+        # names of the .json files in the same directory, shared by every
+        # file in that directory
+        self.sidecar_names = sidecar_names
+
+class Scanner:
+    """Walks the input directory once, listing every directory before any
+        file is yielded. A Photo Details CSV file dates the files it names
+        anywhere in the input, like a Takeout export's CSV in a folder next
+        to the photos, so every one is read from those listings before the
+        first file is fixed. JSON sidecar files are picked out of the same
+        listings instead of being searched for separately.
+
+        Only the names of the files are kept until they are yielded, about
+        80 bytes a file"""
+
+    def __init__(self, input_path: str, photo_details: dict | None = None):
+        self.input_path = input_path
+        self.photo_details = photo_details if photo_details is not None else {}
+        self.csv_files = []
+        self.csv_errors = []
+        self.files_found = 0
+
+        # set once the whole input has been scanned and files_found is the
+        # total
+        self.done = False
+
+        # the modification time and sidecar names of each directory
+        # scan_files has listed
+        self.dir_indexes = {}
+
+    def scan(self) -> Iterator[ScannedFile]:
+        listings = self.__list_dirs()
+        self.done = True
+
+        for dir_path, file_names, sidecar_names in listings:
+            for file_name in file_names:
+                yield ScannedFile(
+                    os.path.join(dir_path, file_name), sidecar_names, self.input_path)
+
+    def __list_dirs(self) -> list:
+        """Lists every directory under the input path, reading the Photo
+            Details CSV files found and counting the files to fix. Returns
+            the directory, the names of the files to fix in it and the names
+            of its JSON sidecar files, for each directory that has files"""
+        listings = []
+
+        # visit directories in the same order as os.walk so files are
+        # numbered the same in the report
+        dirs_to_scan = [self.input_path]
+
+        while dirs_to_scan:
+            dir_path = dirs_to_scan.pop()
+
+            try:
+                with os.scandir(dir_path) as it:
+                    entries = list(it)
+            except OSError:
+                continue
+
+            sub_dirs = []
+            file_names = []
+            sidecar_names = set()
+
+            for entry in entries:
+                try:
+                    is_dir = entry.is_dir()
+                except OSError:
+                    is_dir = False
+
+                if is_dir:
+                    if not entry.is_symlink():
+                        sub_dirs.append(entry.path)
+                    continue
+
+                if entry.name.endswith(".json"):
+                    sidecar_names.add(entry.name)
+
+                if entry.name.startswith("Photo Details") \
+                        and entry.name.endswith(".csv"):
+                    self.read_photo_details_csv(entry.path)
+
+                if not ".json" in entry.name:
+                    file_names.append(entry.name)
+
+            if file_names:
+                self.files_found += len(file_names)
+                listings.append((dir_path, file_names, frozenset(sidecar_names)))
+
+            dirs_to_scan.extend(reversed(sub_dirs))
+
+        return listings
+
+    def scan_files(self, file_paths) -> Iterator[ScannedFile]:
+        """Yields the given files along with the JSON sidecar files next to
+            them, reading the Photo Details CSV files next to them first.
+            A directory is only listed again once it has changed, so its
+            listing is reused for every file in it and between calls"""
+        for file_path in file_paths:
+            dir_path = os.path.dirname(file_path) or "."
+            self.files_found += 1
+            yield ScannedFile(file_path, self.__index_dir(dir_path), dir_path)
+
+        self.done = True
+
+    def __index_dir(self, dir_path: str) -> frozenset:
+        try:
+            mtime_ns = os.stat(dir_path).st_mtime_ns
+        except OSError:
+            return frozenset()
+
+        dir_index = self.dir_indexes.get(dir_path)
+        if dir_index and dir_index[0] == mtime_ns:
+            return dir_index[1]
+
+        sidecar_names = set()
+        with os.scandir(dir_path) as it:
+            for entry in it:
+                if entry.name.endswith(".json"):
+                    sidecar_names.add(entry.name)
+
+                if entry.name.startswith("Photo Details") \
+                        and entry.name.endswith(".csv"):
+                    self.read_photo_details_csv(entry.path)
+
+        sidecar_names = frozenset(sidecar_names)
+        self.dir_indexes[dir_path] = (mtime_ns, sidecar_names)
+        return sidecar_names
+
+    @profiling.profiled("csv parse")
+    def read_photo_details_csv(self, csv_file: str):
+        """Reads a Photo Details CSV sidecar file into the photo details,
+            mapping image names to original creation dates"""
+        self.csv_files.append(csv_file)
+
+        try:
+            with open(csv_file, 'r', encoding='utf-8', newline='') as file:
+                reader = csv.DictReader(file)
+
+                for row in reader:
+                    img_name = row.get('imgName', '').strip()
+                    original_creation_date = row.get('originalCreationDate', '').strip()
+
+                    if img_name and original_creation_date:
+                        self.photo_details[img_name] = original_creation_date
+
+        except Exception as e:
+            self.csv_errors.append(f"Error reading CSV file {csv_file}: {str(e)}")
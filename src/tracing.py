@@ -0,0 +1,70 @@
+import os
+import json
+import threading
+
+class Tracer:
+    """Collects spans into a Chrome trace event file that can be opened in
+        Perfetto or chrome://tracing. Each process and thread gets its own
+        track, so stalls and slow files stand out"""
+
+    def __init__(self):
+        self.events = []
+        self.threads = {}
+        self.lock = threading.Lock()
+        self.main_pid = os.getpid()
+
+    def add(self, span):
+        # the span's labels say what it was, like which operation or stage
+        name = ", ".join(str(value) for value in span.labels.values()) or span.name
+
+        with self.lock:
+            self.events.append({
+                "name": name,
+                "cat": span.name,
+                "ph": "X",
+                "ts": span.start_time * 1e6,
+                "dur": span.seconds * 1e6,
+                "pid": span.pid,
+                "tid": span.tid,
+                "args": span.trace_args,
+            })
+            self.threads[(span.pid, span.tid)] = span.thread_name
+
+    def write(self, trace_path: str):
+        with self.lock:
+            metadata = []
+            for pid in sorted({pid for pid, _ in self.threads}):
+                process_name = "main" if pid == self.main_pid else f"worker {pid}"
+                metadata.append({
+                    "name": "process_name",
+                    "ph": "M",
+                    "pid": pid,
+                    "args": {"name": process_name},
+                })
+
+            for (pid, tid), thread_name in sorted(self.threads.items()):
+                metadata.append({
+                    "name": "thread_name",
+                    "ph": "M",
+                    "pid": pid,
+                    "tid": tid,
+                    "args": {"name": thread_name},
+                })
+
+            with open(trace_path, "w") as f:
+                json.dump(
+                    {"traceEvents": metadata + self.events, "displayTimeUnit": "ms"},
+                    f,
+                )
+
+# the tracer of the run, only set when writing a trace
+active = None
+
+def start():
+    global active
+    active = Tracer()
+
+def stop(trace_path: str):
+    global active
+    tracer, active = active, None
+    tracer.write(trace_path)
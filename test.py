@@ -1,10 +1,9 @@
 import json
 import src.determine_date as determine_date
-from configparser import ConfigParser
+from src.options import read_options
 
 def test_filename_date_parser():
-    config = ConfigParser()
-    config.read('config.ini')
+    options = read_options('config.ini')
 
     # Open the JSON file
     with open('resources/photonames.json') as f:
@@ -12,7 +11,7 @@ def test_filename_date_parser():
 
     # Iterate over each top-level key
     for filename in data:
-        date = determine_date.from_file_name(filename, config) or ""
+        date = determine_date.from_file_name(filename, options) or ""
 
         if not type(date) == str:
             date = date.strftime("%Y/%m/%d %H:%M:%S")
@@ -0,0 +1,78 @@
+import os
+import random
+import collections
+from datetime import datetime, timedelta
+import src.determine_date as determine_date
+from src import metrics
+from src.options import read_options
+
+CONFIG_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "config.ini")
+
+PREFIXES = ["IMG_", "PXL_", "VID", "Screenshot_", "WhatsApp Image ", "", "photo-"]
+DATE_FORMATS = [
+    "%Y%m%d_%H%M%S",
+    "%Y%m%d%H%M%S",
+    "%Y%m%d-%H%M%S",
+    "%Y-%m-%d %H.%M.%S",
+    "%Y-%m-%d-%H-%M-%S",
+    "%Y_%m_%d_%H_%M_%S",
+    "%Y-%m-%d at %I.%M.%S %p",
+    "%Y%m%d_%I%M%S %p",
+    "%Y-%b-%d",
+    "%Y%m%d",
+]
+SUFFIXES = ["", "_1", "(1)", "123", "_HDR", " copy", "_20200101", "~2"]
+EXTENSIONS = [".jpg", ".mp4", ".png"]
+
+def generate_names(count: int) -> list:
+    """File names in many of the shapes the parser handles, some with
+        dates that are not valid or that are outside the years, and some
+        repeating the shape of an earlier name"""
+    rng = random.Random(0)
+    names = []
+
+    for _ in range(count):
+        date = datetime(1990, 1, 1) + timedelta(seconds=rng.randrange(50 * 365 * 86400))
+        date_text = date.strftime(rng.choice(DATE_FORMATS))
+        if rng.random() < 0.1:
+            # a month that does not exist
+            date_text = date_text[:4] + date_text[4:].replace(date.strftime("%m"), "13", 1)
+
+        names.append(
+            rng.choice(PREFIXES) + date_text + rng.choice(SUFFIXES) + rng.choice(EXTENSIONS))
+
+    return names
+
+def parse_names(names: list) -> list:
+    options = read_options(CONFIG_PATH)
+    return [determine_date.from_file_name(name, options) for name in names]
+
+def count_parser_paths() -> dict:
+    paths = {}
+    for (name, labels), histogram in metrics.registry.histograms.items():
+        if name == "file_name_parser_seconds":
+            path = dict(labels)["path"]
+            paths[path] = paths.get(path, 0) + histogram.count
+    return paths
+
+def test_fast_path_and_shape_cache_match_format_walk(monkeypatch):
+    names = generate_names(600)
+    metrics.registry.clear()
+
+    monkeypatch.setattr(determine_date, "_shape_matches", collections.OrderedDict())
+    dates = parse_names(names)
+    paths = count_parser_paths()
+    assert paths.get("digit_runs") and paths.get("shape_cache")
+    assert any(dates) and not all(dates)
+
+    with monkeypatch.context() as patch:
+        patch.setattr(determine_date, "__parse_digit_runs", lambda file_name, options: None)
+        patch.setattr(determine_date, "_shape_matches", collections.OrderedDict())
+        patch.setattr(determine_date, "SHAPE_CACHE_SIZE", 0)
+        metrics.registry.clear()
+
+        walked_dates = parse_names(names)
+        assert set(count_parser_paths()) == {"formats"}
+
+    metrics.registry.clear()
+    assert dates == walked_dates
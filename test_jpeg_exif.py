@@ -0,0 +1,55 @@
+import struct
+import pytest
+from src.jpeg_exif import read_exif_dates
+from src.media_file import MediaFile
+
+DATE = b"2019:03:28 10:11:12\x00"
+
+def make_tiff(count: int = 1, next_ifd: int = 0) -> bytes:
+    """Little endian TIFF data with an IFD0 of count entries, the first of
+        which is the datetime tag, its text right after the IFD"""
+    return (
+        b"II*\x00" + struct.pack("<I", 8)
+        + struct.pack("<H", count)
+        + struct.pack("<HHII", 0x0132, 2, len(DATE), 26)
+        + struct.pack("<I", next_ifd)
+        + DATE
+    )
+
+def write_jpeg(path, tiff: bytes, before_app1: bytes = b""):
+    app1 = b"Exif\x00\x00" + tiff
+    data = (
+        b"\xff\xd8" + before_app1
+        + b"\xff\xe1" + struct.pack(">H", len(app1) + 2) + app1
+        + b"\xff\xda\x00\x02" + bytes(16) + b"\xff\xd9"
+    )
+    with open(path, "wb") as f:
+        f.write(data)
+
+def read_dates(path):
+    with MediaFile(str(path)) as media_file:
+        return read_exif_dates(media_file)
+
+def test_reads_datetime(tmp_path):
+    write_jpeg(tmp_path / "plain.jpg", make_tiff())
+
+    assert read_dates(tmp_path / "plain.jpg").datetime == "2019:03:28 10:11:12"
+
+def test_app1_at_odd_offset_is_left_to_exif_package(tmp_path):
+    # an APP0 with an odd length puts the APP1 marker at an odd offset,
+    # where the exif package does not look for it
+    write_jpeg(tmp_path / "odd.jpg", make_tiff(), b"\xff\xe0\x00\x03\x00")
+
+    assert read_dates(tmp_path / "odd.jpg") is None
+
+def test_truncated_ifd_has_no_dates(tmp_path):
+    write_jpeg(tmp_path / "truncated.jpg", make_tiff(count=200))
+
+    with pytest.raises(AttributeError):
+        read_dates(tmp_path / "truncated.jpg").datetime
+
+def test_ifd_chain_that_loops_ends(tmp_path):
+    # IFD0 points back at itself as the next IFD
+    write_jpeg(tmp_path / "loop.jpg", make_tiff(next_ifd=8))
+
+    assert read_dates(tmp_path / "loop.jpg").datetime == "2019:03:28 10:11:12"
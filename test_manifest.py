@@ -0,0 +1,45 @@
+import os
+from conftest import run_fixer, output_tree, read_report
+from src.manifest import Manifest
+
+def skipped_lines(config_path: str) -> list:
+    return [line for line in read_report(config_path) if line.startswith("Skipped")]
+
+def test_unchanged_files_are_skipped(make_config):
+    config_path = make_config("skip", skip_unchanged_files=True)
+    run_fixer(config_path)
+    first_tree = output_tree(config_path)
+
+    run_fixer(config_path)
+
+    assert skipped_lines(config_path) == [
+        f"Skipped {len(first_tree)} file(s) unchanged since they were last fixed\n"]
+    assert output_tree(config_path) == first_tree
+
+def test_resume_rewrites_missing_outputs(make_config):
+    config_path = make_config("resume")
+    run_fixer(config_path)
+    first_tree = output_tree(config_path)
+
+    missing = next(path for path in first_tree if path.startswith("fixed"))
+    os.remove(os.path.join(os.path.dirname(config_path), missing))
+
+    run_fixer(config_path, resume=True)
+
+    assert skipped_lines(config_path) == [
+        f"Skipped {len(first_tree) - 1} file(s) unchanged since they were last fixed\n"]
+    assert output_tree(config_path) == first_tree
+
+def test_resume_keeps_renamed_files_written_before_the_run_stopped(make_config, monkeypatch):
+    # as if the run stopped before any file it wrote was recorded as done
+    config_path = make_config(
+        "renamed", rename_files=True, preserve_original_file_name=False)
+    with monkeypatch.context() as patch:
+        patch.setattr(Manifest, "record", lambda self, *args: None)
+        run_fixer(config_path)
+    first_tree = output_tree(config_path)
+
+    # a resumed run draws other nonces
+    run_fixer(config_path, seed=1, resume=True)
+
+    assert output_tree(config_path) == first_tree
@@ -0,0 +1,43 @@
+import time
+import random
+import pytest
+from src.pipeline import Pipeline, Stage
+
+def sleep_randomly(item):
+    # long enough for the threads of a stage to finish out of order
+    time.sleep(random.random() / 1000)
+    return item
+
+def test_pipeline_yields_in_source_order():
+    seen_by_ordered_stage = []
+
+    def record(item):
+        seen_by_ordered_stage.append(item)
+        return item
+
+    pipeline = Pipeline(
+        [
+            Stage("first", sleep_randomly, concurrency=4),
+            Stage("ordered", record, ordered=True),
+            Stage("last", lambda item: item * 2, concurrency=3),
+        ],
+        max_in_flight=8,
+    )
+
+    assert list(pipeline.run(range(200))) == [i * 2 for i in range(200)]
+    assert seen_by_ordered_stage == list(range(200))
+
+def test_pipeline_raises_errors_in_order():
+    def fail_on_five(item):
+        if item == 5:
+            raise ValueError("five")
+        return sleep_randomly(item)
+
+    pipeline = Pipeline([Stage("fail", fail_on_five, concurrency=4)], max_in_flight=4)
+
+    results = []
+    with pytest.raises(ValueError, match="five"):
+        for item in pipeline.run(range(20)):
+            results.append(item)
+
+    assert results == [0, 1, 2, 3, 4]
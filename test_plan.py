@@ -0,0 +1,17 @@
+import os
+from conftest import run_fixer, output_tree
+
+def test_applied_plan_matches_direct_run(make_config):
+    direct_config = make_config("direct")
+    applied_config = make_config("applied")
+    plan_path = os.path.join(os.path.dirname(applied_config), "plan.jsonl")
+
+    run_fixer(direct_config)
+    run_fixer(applied_config, plan_path=plan_path)
+
+    assert output_tree(applied_config) == {}
+
+    run_fixer(applied_config, apply_path=plan_path)
+
+    assert output_tree(direct_config)
+    assert output_tree(applied_config) == output_tree(direct_config)
@@ -0,0 +1,22 @@
+import os
+import src.preflight as preflight
+from conftest import run_fixer, output_tree
+
+def test_run_after_preflight_fixes_every_file(make_config, monkeypatch):
+    # the run carries on the walk past the files the preflight looked at
+    monkeypatch.setattr(preflight, "PREWALK_FILES", 3)
+    serial_config = make_config("serial", workers=1)
+    auto_config = make_config("auto", workers="auto")
+
+    run_fixer(serial_config)
+    run_fixer(auto_config)
+
+    assert output_tree(auto_config) == output_tree(serial_config)
+
+def test_preflight_only_does_not_create_output(make_config):
+    config_path = make_config("preflight")
+
+    run_fixer(config_path, preflight_only=True)
+
+    run_path = os.path.dirname(config_path)
+    assert sorted(os.listdir(run_path)) == ["config.ini", "report.txt"]
@@ -0,0 +1,26 @@
+from conftest import run_fixer, output_tree, read_report
+
+def test_parallel_run_matches_serial_run(make_config):
+    serial_config = make_config("serial", workers=1)
+    parallel_config = make_config(
+        "parallel", workers=3, metadata_concurrency=3, date_concurrency=2)
+
+    run_fixer(serial_config)
+    run_fixer(parallel_config)
+
+    assert output_tree(serial_config)
+    assert output_tree(parallel_config) == output_tree(serial_config)
+    assert read_report(parallel_config) == read_report(serial_config)
+
+def test_parallel_run_names_files_like_serial_run(make_config):
+    # files with the same date get the same name apart from a random nonce
+    names = {"rename_files": True, "preserve_original_file_name": False}
+    serial_config = make_config("serial", workers=1, **names)
+    parallel_config = make_config(
+        "parallel", workers=3, metadata_concurrency=3, date_concurrency=2, **names)
+
+    run_fixer(serial_config)
+    run_fixer(parallel_config)
+
+    assert output_tree(parallel_config) == output_tree(serial_config)
+    assert read_report(parallel_config) == read_report(serial_config)